@@ -0,0 +1,7 @@
+try:
+    from .celery import app as celery_app
+except ImportError:
+    # celery is optional; only RESUME_TASK_BACKEND=celery needs it (see resumes.tasks.task_backend)
+    celery_app = None
+
+__all__ = ("celery_app",)
@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'resume_rag.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, "LEXICAL_WARM_ON_START", True):
+    # BM25 is built from the DB while the worker starts taking requests,
+    # not inside the first one that needs it
+    from resumes.search import LEXICAL_INDEX  # noqa: E402
+    LEXICAL_INDEX.warm_in_background()
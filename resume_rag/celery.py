@@ -0,0 +1,16 @@
+"""
+Celery app for resume_rag.
+
+Start a worker with ``celery -A resume_rag worker`` and set
+RESUME_TASK_BACKEND=celery on the web processes to hand uploads to it.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'resume_rag.settings')
+
+app = Celery('resume_rag')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -181,6 +181,123 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+# -------------------------
+# Background processing
+# -------------------------
+# "celery" (needs a broker and `celery -A resume_rag worker`), "thread"
+# (in-process pool, no broker needed) or "sync" (inline, for debugging).
+# Any other value, or "celery" without celery installed, fails at startup.
+# The thread pool's queue dies with its worker: run `manage.py
+# requeue_resumes` after restarts (or from cron) to pick those uploads up
+RESUME_TASK_BACKEND = os.getenv("RESUME_TASK_BACKEND", "thread")
+RESUME_TASK_WORKERS = int(os.getenv("RESUME_TASK_WORKERS", "2"))
+# Minutes an upload may sit in "processing" before requeue_resumes retries it
+RESUME_TASK_STALE_MINUTES = int(os.getenv("RESUME_TASK_STALE_MINUTES", "30"))
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Re-uploads of a file (same SHA-256) copy the first upload's chunks instead
+# of parsing, and chunk texts embedded before reuse their stored vector
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1") == "1"
+
+# -------------------------
+# Embedding
+# -------------------------
+# sentence-transformers model new index versions are built with. Changing it
+# takes effect through `manage.py rebuild_index`, which re-embeds into a new
+# version next to the live one; until then queries keep the live index's model
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Texts per model.encode call; uploads in flight are pooled up to this size
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# How long the ingestion batcher waits for more chunks before encoding
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "20"))
+# Pending encode requests before producers block
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "256"))
+# Per-worker LRU of query embeddings (/ask/, job matching)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+# Optional CACHES alias shared by all workers, e.g. a Redis-backed "default"
+QUERY_EMBED_SHARED_CACHE = os.getenv("QUERY_EMBED_SHARED_CACHE") or None
+# Vector queries from all threads of a worker are encoded and searched in
+# groups of up to QUERY_BATCH_SIZE. With MAX_WAIT_MS=0 a group is whatever
+# queued while the previous one ran; > 0 holds each group open that long for
+# company (see bench_embed --scheduler). QUERY_BATCH_SIZE=1 turns it off
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "0"))
+QUERY_QUEUE_SIZE = int(os.getenv("QUERY_QUEUE_SIZE", "1024"))
+# torch intra-op threads for encoding (0 keeps torch's default)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
+# -------------------------
+# Retrieval / FAISS
+# -------------------------
+# Map the index read-only so gunicorn workers share one copy in the page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+# Uploads append small delta segments; merge them into the base past this many
+FAISS_MAX_DELTA_SEGMENTS = int(os.getenv("FAISS_MAX_DELTA_SEGMENTS", "16"))
+# faiss.index_factory string for the compacted base segment, e.g. "Flat",
+# "IVF{n},Flat", "HNSW32", "IVF{n},PQ48"; {n} is sized from the corpus.
+# Compressed codes cut memory per vector (d=384: Flat 1536 B, "SQfp16" 768,
+# "SQ8" 384, "SQ4" 192, "IVF{n},PQ48" 48); append ",RFlat" to re-rank the top
+# candidates on full vectors, which pays off in RAM only with FAISS_MMAP=1
+# (the full vectors stay on disk), or ",Refine(SQfp16)" to keep them resident
+# at half size. Bare PQ and LSH can't filter and are rejected.
+# See bench_index --ann for memory, latency and recall
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+# Same for the resume-level index (default: FAISS_INDEX_FACTORY)
+FAISS_RESUME_INDEX_FACTORY = os.getenv("FAISS_RESUME_INDEX_FACTORY") or FAISS_INDEX_FACTORY
+# Refined indexes re-rank k * this many compressed candidates
+FAISS_REFINE_K_FACTOR = int(os.getenv("FAISS_REFINE_K_FACTOR", "4"))
+# Below this many vectors the base stays exact brute force. Compaction builds
+# the ANN base once when the corpus crosses it and only adds to it after
+# that; run rebuild_index to retrain (e.g. IVF lists) for a grown corpus
+FAISS_ANN_MIN_VECTORS = int(os.getenv("FAISS_ANN_MIN_VECTORS", "10000"))
+# Search-time recall/latency knobs for IVF and HNSW bases
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Seconds an upload waits for the cross-worker index write lock
+FAISS_WRITE_LOCK_TIMEOUT = float(os.getenv("FAISS_WRITE_LOCK_TIMEOUT", "60"))
+# /ask/ fuses FAISS and BM25 rankings with reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# each retriever contributes k * factor candidates to the fusion
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Build the BM25 index in a background thread when a wsgi/asgi worker starts
+LEXICAL_WARM_ON_START = os.getenv("LEXICAL_WARM_ON_START", "1") == "1"
+# /ask/ answers per request (k outside 1..ASK_MAX_K is a 400), and the most
+# hits one request retrieves while searching past copies of one file for k
+# distinct answers
+ASK_MAX_K = int(os.getenv("ASK_MAX_K", "50"))
+ASK_MAX_DEPTH = int(os.getenv("ASK_MAX_DEPTH", "1000"))
+# Optional second stage for /ask/: a cross-encoder re-scores the top hits.
+# Empty RERANK_MODEL turns it off; "stub" scores by term overlap (tests)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# default for requests that don't send "rerank"
+RERANK = os.getenv("RERANK", "0") == "1"
+# Hits re-ranked per request: as many as fit RERANK_BUDGET_MS at the measured
+# per-pair cost, at most RERANK_MAX_DEPTH (see bench_rerank)
+RERANK_MAX_DEPTH = int(os.getenv("RERANK_MAX_DEPTH", "50"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+# Job matching shortlists top_n * factor resumes from the resume-level index,
+# then reads up to EVIDENCE_PER_RESUME chunks of each; with MATCH_RESCORE the
+# best chunk's similarity replaces the pooled score (off: it favours long
+# resumes again, see bench_index --match)
+MATCH_SHORTLIST_FACTOR = int(os.getenv("MATCH_SHORTLIST_FACTOR", "3"))
+MATCH_EVIDENCE_PER_RESUME = int(os.getenv("MATCH_EVIDENCE_PER_RESUME", "3"))
+MATCH_RESCORE = os.getenv("MATCH_RESCORE", "0") == "1"
+
+# -------------------------
+# Async query path (ASGI)
+# -------------------------
+# Route /ask/ and /jobs/<id>/match/ to the async views; needs an ASGI server.
+# Off by default: with the fake encoder, async p99 at 64 clients was 591ms
+# against 199ms sync (bench_concurrency); turn on only where a run with the
+# real model shows batched encoding winning
+ASYNC_QUERY_VIEWS = os.getenv("ASYNC_QUERY_VIEWS", "0") == "1"
+# Threads that run encode/search/ORM work for the async views, per process
+ASYNC_QUERY_WORKERS = int(os.getenv("ASYNC_QUERY_WORKERS", "4"))
+# Calls allowed in flight on that pool before requests wait for a slot
+ASYNC_QUERY_MAX_PENDING = int(os.getenv("ASYNC_QUERY_MAX_PENDING", "64"))
+
 # -------------------------
 # Default primary key
 # -------------------------
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ResumesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'resumes'
+
+    def ready(self):
+        # index tombstones for deleted resumes
+        from . import signals  # noqa: F401
+        from .tasks import task_backend
+        # a misconfigured upload backend stops the process here
+        task_backend()
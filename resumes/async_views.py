@@ -0,0 +1,133 @@
+import asyncio
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FormParser, JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .search import fuse_hits, hybrid_depth
+from .utils import get_query_scheduler
+from .views import QUERY_REQUIRED, ask_answers, ask_hydrate, ask_params, ask_plan, ask_widen, job_match_payload
+
+# Async versions of /ask/ and /jobs/<id>/match/ for ASGI workers. The event
+# loop only waits: the ORM runs on a bounded thread pool, and encode and
+# search go through the process-wide query scheduler.
+
+_EXECUTORS = {}
+_LIMITS = weakref.WeakKeyDictionary()
+
+def get_query_executor():
+    # one pool per process; gunicorn forks workers after import
+    pid = os.getpid()
+    if pid not in _EXECUTORS:
+        _EXECUTORS.clear()
+        _EXECUTORS[pid] = ThreadPoolExecutor(
+            max_workers=getattr(settings, "ASYNC_QUERY_WORKERS", 4),
+            thread_name_prefix="query",
+        )
+    return _EXECUTORS[pid]
+
+def in_worker(fn, *args):
+    # pool threads hold their own DB connections; don't leak them
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+def pending_limit():
+    loop = asyncio.get_running_loop()
+    limit = _LIMITS.get(loop)
+    if limit is None:
+        limit = _LIMITS[loop] = asyncio.Semaphore(getattr(settings, "ASYNC_QUERY_MAX_PENDING", 64))
+    return limit
+
+async def run_sync(fn, *args):
+    # bounded: past ASYNC_QUERY_MAX_PENDING calls in flight, callers wait
+    # here instead of piling onto the pool's unbounded queue
+    async with pending_limit():
+        return await asyncio.get_running_loop().run_in_executor(get_query_executor(), in_worker, fn, *args)
+
+
+async def scheduled_search(query_text, k, resume_ids):
+    # the query scheduler batches these with every other caller in the
+    # process; waiting on it counts against the same pending limit
+    async with pending_limit():
+        return await asyncio.wrap_future(get_query_scheduler().submit(query_text, k, resume_ids))
+
+
+def authenticate(request):
+    # the same authenticators and parsers the DRF views use
+    drf_request = Request(
+        request,
+        parsers=[JSONParser(), FormParser()],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    if not drf_request.user or not drf_request.user.is_authenticated:
+        return drf_request, JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    return drf_request, None
+
+def api_error(exc):
+    # same body shapes as DRF's exception handler
+    if isinstance(exc, Http404):
+        return JsonResponse({"detail": "Not found."}, status=404)
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    return JsonResponse(data, status=exc.status_code, safe=False)
+
+def prepare_ask(request):
+    drf_request, error = authenticate(request)
+    if error is not None:
+        return None, error
+    return ask_params(drf_request.data), None
+
+def finish_ask(q, hits, k, hybrid, allowed, depth, rerank_depth):
+    # None: too few distinct answers, search deeper. The cross-encoder pass
+    # runs here, off the event loop
+    if hybrid:
+        hits = fuse_hits(q, hits, k=depth, resume_ids=allowed)
+    hydrated = ask_hydrate(hits, k, depth)
+    return None if hydrated is None else ask_answers(q, hydrated, k, rerank_depth)
+
+@csrf_exempt
+async def ask(request):
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        params, error = await run_sync(prepare_ask, request)
+    except (APIException, Http404) as exc:
+        return api_error(exc)
+    if error is not None:
+        return error
+    q, k, hybrid, allowed, rerank = params
+    if not q:
+        return JsonResponse(QUERY_REQUIRED, status=400)
+    depth, rerank_depth = ask_plan(k, rerank)
+    while True:
+        hits = await scheduled_search(q, hybrid_depth(depth) if hybrid else depth, allowed)
+        payload = await run_sync(finish_ask, q, hits, k, hybrid, allowed, depth, rerank_depth)
+        if payload is not None:
+            return JsonResponse(payload)
+        depth = ask_widen(depth)
+
+def run_job_match(request, id):
+    drf_request, error = authenticate(request)
+    if error is not None:
+        return error
+    return JsonResponse(job_match_payload(id, drf_request.data))
+
+@csrf_exempt
+async def job_match(request, id):
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    # matching is mostly cache reads and ORM work; it runs off-loop as one unit
+    try:
+        return await run_sync(run_job_match, request, id)
+    except (APIException, Http404) as exc:
+        return api_error(exc)
@@ -0,0 +1,107 @@
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from .models import ChunkEmbedding, Resume, ResumeChunk
+from .utils import active_model_name, get_embedding_batcher
+
+# Content-addressed ingest. A file's SHA-256 finds an earlier upload of the
+# same file whose parsed chunks can be copied, and a chunk text's SHA-256
+# finds its stored vector, so re-uploads and unchanged chunks skip parsing
+# and encoding.
+
+HASH_BLOCK = 1 << 20
+
+def dedup_enabled():
+    return getattr(settings, "INGEST_DEDUP", True)
+
+def file_sha256(f):
+    # path or binary file object, read in blocks
+    if not hasattr(f, "read"):
+        with open(f, "rb") as fh:
+            return file_sha256(fh)
+    h = hashlib.sha256()
+    for block in iter(lambda: f.read(HASH_BLOCK), b""):
+        h.update(block)
+    return h.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def find_sources(shas, exclude=None):
+    # {file sha: id of the earliest resume with that content and parsed chunks}
+    shas = [s for s in set(shas) if s]
+    if not shas or not dedup_enabled():
+        return {}
+    qs = Resume.objects.filter(content_sha256__in=shas, chunks__isnull=False).exclude(status="failed")
+    if exclude is not None:
+        qs = qs.exclude(id=exclude)
+    sources = {}
+    for sha, rid in qs.order_by("uploaded_at", "id").values_list("content_sha256", "id"):
+        sources.setdefault(sha, rid)
+    return sources
+
+def source_chunks(resume_ids):
+    # {resume id: (summary, chunks)} with chunks shaped like stream_pdf_chunks' output
+    copies = {rid: (summary or "", []) for rid, summary in Resume.objects.filter(id__in=resume_ids).values_list("id", "summary")}
+    rows = ResumeChunk.objects.filter(resume_id__in=resume_ids).order_by("resume_id", "chunk_order").values_list(
+        "resume_id", "chunk_text", "chunk_order", "page_number", "char_start", "char_end", "text_sha256",
+    )
+    for rid, text, order, page, start, end, sha in rows:
+        copies[rid][1].append({"text": text, "order": order, "page": page, "start": start, "end": end, "sha": sha})
+    return copies
+
+def later_copies(resume_ids):
+    # the resumes among resume_ids whose file was uploaded before by another resume
+    shas = dict(Resume.objects.filter(id__in=resume_ids).exclude(content_sha256="").values_list("id", "content_sha256"))
+    if not shas:
+        return set()
+    first = {}
+    for sha, rid in Resume.objects.filter(content_sha256__in=set(shas.values())).order_by("uploaded_at", "id").values_list("content_sha256", "id"):
+        first.setdefault(sha, rid)
+    return {str(rid) for rid, sha in shas.items() if first[sha] != rid}
+
+def stored_vectors(hashes, model_name=None):
+    model_name = model_name or active_model_name()
+    found = {}
+    hashes = list(set(hashes))
+    for start in range(0, len(hashes), 1000):
+        rows = ChunkEmbedding.objects.filter(model=model_name, text_sha256__in=hashes[start:start + 1000])
+        for sha, vector in rows.values_list("text_sha256", "vector"):
+            found[sha] = np.frombuffer(vector, dtype="float32")
+    return found
+
+def store_vectors(vectors, model_name=None):
+    # first writer wins; a racing ingest of the same text computed the same vector
+    model_name = model_name or active_model_name()
+    ChunkEmbedding.objects.bulk_create(
+        [ChunkEmbedding(text_sha256=sha, model=model_name, vector=np.asarray(vec, dtype="float32").tobytes()) for sha, vec in vectors.items()],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+def embed_texts(texts, hashes=None, encode=None, model_name=None):
+    # -> (vecs, encoded). Texts with a stored vector aren't encoded, repeats
+    # within texts are encoded once, and new vectors are stored. encode must
+    # use model_name (default: the active index's model).
+    if not texts:
+        return None, 0
+    model_name = model_name or active_model_name()
+    hashes = [h or text_sha256(t) for t, h in zip(texts, hashes or [""] * len(texts))]
+    encode = encode or (lambda todo: get_embedding_batcher().encode(todo, model_name))
+    known = stored_vectors(hashes, model_name) if dedup_enabled() else {}
+    todo = {}
+    for text, sha in zip(texts, hashes):
+        if sha not in known:
+            todo.setdefault(sha, text)
+    if todo:
+        fresh = dict(zip(todo, encode(list(todo.values()))))
+        if dedup_enabled():
+            store_vectors(fresh, model_name)
+        known.update(fresh)
+    return np.stack([known[h] for h in hashes]).astype("float32"), len(todo)
+
+def embed_chunks(chunk_objs, model_name=None):
+    vecs, _ = embed_texts([c.chunk_text for c in chunk_objs], [c.text_sha256 for c in chunk_objs], model_name=model_name)
+    return vecs
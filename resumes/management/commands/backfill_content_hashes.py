@@ -0,0 +1,55 @@
+import uuid
+
+import faiss
+from django.core.management.base import BaseCommand
+
+from resumes.dedup import file_sha256, store_vectors, text_sha256
+from resumes.models import Resume, ResumeChunk
+from resumes.utils import INDEX_MANAGER, segment_vectors
+
+
+class Command(BaseCommand):
+    help = "Fill Resume.content_sha256 and ResumeChunk.text_sha256 for rows stored before content hashing, and seed the vector store from the FAISS index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        batch = opts["batch"]
+        hashed = 0
+        for resume in Resume.objects.filter(content_sha256="").exclude(original_file="").only("id", "original_file").iterator():
+            try:
+                with resume.original_file.open("rb") as f:
+                    sha = file_sha256(f)
+            except (OSError, ValueError):
+                # file gone from storage; the resume just never dedupes
+                continue
+            Resume.objects.filter(id=resume.id).update(content_sha256=sha)
+            hashed += 1
+        self.stdout.write(f"hashed {hashed} resume files")
+
+        updated = 0
+        while True:
+            chunks = list(ResumeChunk.objects.filter(text_sha256="").only("id", "chunk_text")[:batch])
+            if not chunks:
+                break
+            for chunk in chunks:
+                chunk.text_sha256 = text_sha256(chunk.chunk_text)
+            ResumeChunk.objects.bulk_update(chunks, ["text_sha256"], batch_size=1000)
+            updated += len(chunks)
+        self.stdout.write(f"hashed {updated} chunk texts")
+
+        # vectors already in the index, so the first re-upload of an old
+        # resume doesn't encode again; one segment in memory at a time
+        snapshot = INDEX_MANAGER.get()
+        seeded = 0
+        for name, offset, _ in snapshot.segments:
+            vecs = segment_vectors(faiss.read_index(str(INDEX_MANAGER.index_dir / name)))
+            for start in range(0, len(vecs), batch):
+                rows = range(offset + start, offset + min(start + batch, len(vecs)))
+                chunk_ids = {snapshot.ids.get(row): row - offset for row in rows}
+                shas = ResumeChunk.objects.filter(id__in=[uuid.UUID(c) for c in chunk_ids if c]).values_list("id", "text_sha256")
+                vectors = {sha: vecs[chunk_ids[str(cid)]] for cid, sha in shas}
+                store_vectors(vectors)
+                seeded += len(vectors)
+        self.stdout.write(self.style.SUCCESS(f"stored vectors for {seeded} of {snapshot.ntotal} index rows"))
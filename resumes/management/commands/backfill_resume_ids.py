@@ -0,0 +1,35 @@
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from resumes.models import ResumeChunk
+from resumes.utils import INDEX_MANAGER, ChunkIdStore
+
+
+class Command(BaseCommand):
+    help = "Write faiss_index/resume_ids.bin (FAISS row -> resume id) for rows indexed before filtered search existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        batch = opts["batch"]
+        # hold the writer lock so no upload appends rows while we resolve them
+        with INDEX_MANAGER.writing():
+            snapshot = INDEX_MANAGER.get()
+            n = len(snapshot.ids)
+            rows = np.zeros((n, ChunkIdStore.ROW_BYTES), dtype=np.uint8)
+            missing = 0
+            for start in range(0, n, batch):
+                chunk_ids = [snapshot.ids.get(row) for row in range(start, min(start + batch, n))]
+                owners = dict(ResumeChunk.objects.filter(id__in=chunk_ids).values_list("id", "resume_id"))
+                for offset, chunk_id in enumerate(chunk_ids):
+                    resume_id = owners.get(uuid.UUID(chunk_id)) if chunk_id else None
+                    if resume_id is None:
+                        # chunk deleted since it was indexed; stays unfilterable
+                        missing += 1
+                        continue
+                    rows[start + offset] = np.frombuffer(resume_id.bytes, dtype=np.uint8)
+            INDEX_MANAGER.set_resume_ids(ChunkIdStore(rows))
+        self.stdout.write(self.style.SUCCESS(f"mapped {n - missing} of {n} rows to resumes ({missing} without a chunk)"))
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from resumes import async_views
+from resumes.views import AskView
+
+WORDS = "python django react kubernetes aws docker java sql golang rust terraform pytorch spark kafka".split()
+
+
+def queries(n, seed=0):
+    # distinct texts so the query-embedding cache doesn't answer for us
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, 3)) + f" engineer {i}" for i in range(n)]
+
+
+def summarize(samples, took):
+    arr = np.array(samples) * 1000.0
+    return len(samples) / took, float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+class Command(BaseCommand):
+    help = "Load /ask/ with N concurrent clients through the sync view (one thread per client) and the async view (one event loop) and report RPS and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,16,64", help="comma-separated concurrency levels")
+        parser.add_argument("--requests", type=int, default=256, help="requests per level")
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--user", help="username to authenticate as (default: first user)")
+        parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        user = User.objects.filter(username=opts["user"]).first() if opts["user"] else User.objects.first()
+        if user is None:
+            raise CommandError("no user to authenticate as")
+        auth = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+        for clients in (int(c) for c in opts["clients"].split(",")):
+            texts = queries(opts["requests"], seed=clients)
+            if opts["mode"] in ("sync", "both"):
+                self.report("sync", clients, *self.run_sync(texts, clients, opts["k"], auth))
+            if opts["mode"] in ("async", "both"):
+                self.report("async", clients, *asyncio.run(self.run_async(texts, clients, opts["k"], auth)))
+
+    def report(self, mode, clients, samples, took):
+        rps, p50, p99 = summarize(samples, took)
+        self.stdout.write(f"{mode:5s} clients={clients:<3} rps={rps:.1f} p50={p50:.1f}ms p99={p99:.1f}ms")
+
+    def run_sync(self, texts, clients, k, auth):
+        view = AskView.as_view()
+        factory = RequestFactory()
+
+        def one(text):
+            close_old_connections()
+            request = factory.post("/api/ask/", {"query": text, "k": k}, content_type="application/json", headers=auth)
+            t0 = time.perf_counter()
+            response = view(request)
+            elapsed = time.perf_counter() - t0
+            assert response.status_code == 200, response.status_code
+            return elapsed
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            samples = list(pool.map(one, texts))
+        return samples, time.perf_counter() - t0
+
+    async def run_async(self, texts, clients, k, auth):
+        factory = AsyncRequestFactory()
+        todo = list(reversed(texts))
+        samples = []
+
+        async def client():
+            while todo:
+                request = factory.post("/api/ask/", {"query": todo.pop(), "k": k}, content_type="application/json", headers=auth)
+                t0 = time.perf_counter()
+                response = await async_views.ask(request)
+                samples.append(time.perf_counter() - t0)
+                assert response.status_code == 200, response.status_code
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return samples, time.perf_counter() - t0
@@ -0,0 +1,122 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from resumes.utils import (
+    INDEX_MANAGER, QUERY_CACHE, EmbeddingBatcher, QueryScheduler, embed_query, encode_texts,
+    load_embedding_model, search_index_batch,
+)
+
+WORDS = (
+    "python django react aws docker kubernetes sql postgres redis celery machine learning "
+    "pytorch pandas analytics leadership communication agile scrum java spring microservices "
+    "testing ci cd linux git rest api design frontend backend cloud security data pipelines"
+).split()
+
+
+def synthetic_resumes(count, chunks_per_resume, words_per_chunk=250, seed=0):
+    rng = random.Random(seed)
+    return [
+        [" ".join(rng.choices(WORDS, k=words_per_chunk)) for _ in range(chunks_per_resume)]
+        for _ in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare per-resume encoding with the pooled ingestion batcher (chunks/sec) using the real embedding model; --queries and --scheduler time the query side."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resumes", type=int, default=200)
+        parser.add_argument("--chunks", type=int, default=3, help="chunks per resume")
+        parser.add_argument("--batch-size", type=int, default=64)
+        parser.add_argument("--max-wait-ms", type=float, default=20)
+        parser.add_argument("--producers", type=int, default=8, help="concurrent uploads feeding the batcher")
+        parser.add_argument("--queries", type=int, default=0, help="instead: time N distinct queries repeated --repeats times, uncached vs cached")
+        parser.add_argument("--repeats", type=int, default=5)
+        parser.add_argument("--scheduler", type=int, default=0, help="instead: answer N distinct queries against the live index, one at a time vs through the query scheduler")
+        parser.add_argument("--clients", default="1,16,64", help="concurrent callers for --scheduler")
+        parser.add_argument("--query-wait-ms", default="0,2", help="scheduler max_wait values to try")
+        parser.add_argument("--k", type=int, default=5)
+
+    def handle(self, *args, **opts):
+        if opts["scheduler"]:
+            return self.bench_scheduler(opts)
+        if opts["queries"]:
+            return self.bench_query_cache(opts["queries"], opts["repeats"])
+        resumes = synthetic_resumes(opts["resumes"], opts["chunks"])
+        total = sum(len(r) for r in resumes)
+        load_embedding_model()
+        encode_texts(resumes[0])  # warm up
+
+        t0 = time.perf_counter()
+        for chunks in resumes:
+            encode_texts(chunks)
+        self.report("per-resume", total, time.perf_counter() - t0)
+
+        batcher = EmbeddingBatcher(batch_size=opts["batch_size"], max_wait=opts["max_wait_ms"] / 1000.0)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(opts["producers"]) as pool:
+            list(pool.map(batcher.encode, resumes))
+        self.report(f"batched (bs={opts['batch_size']}, producers={opts['producers']})", total, time.perf_counter() - t0)
+
+    def bench_query_cache(self, count, repeats):
+        queries = self.query_texts(count, seed=7)
+        workload = queries * repeats
+        load_embedding_model()
+        encode_texts(queries[:1])  # warm up
+
+        t0 = time.perf_counter()
+        for q in workload:
+            encode_texts([q])
+        self.report("query encode, no cache", len(workload), time.perf_counter() - t0, unit="queries")
+
+        before = QUERY_CACHE.stats()
+        t0 = time.perf_counter()
+        for q in workload:
+            embed_query(q)
+        self.report("query encode, LRU", len(workload), time.perf_counter() - t0, unit="queries")
+        after = QUERY_CACHE.stats()
+        self.stdout.write(f"hits={after['hits'] - before['hits']} misses={after['misses'] - before['misses']}")
+
+    def bench_scheduler(self, opts):
+        if INDEX_MANAGER.get().ntotal == 0:
+            raise CommandError("the index is empty; upload or import resumes first")
+        load_embedding_model()
+        search_index_batch(["warm up"], [opts["k"]])
+        waits = [float(w) for w in opts["query_wait_ms"].split(",")]
+        for clients in (int(c) for c in opts["clients"].split(",")):
+            # fresh texts per run so the query cache doesn't answer for us
+            runs = [("direct", None)] + [
+                (f"scheduled bs={opts['batch_size']} wait={w:g}ms", QueryScheduler(max_batch=opts["batch_size"], max_wait=w / 1000.0))
+                for w in waits
+            ]
+            for seed, (label, scheduler) in enumerate(runs):
+                texts = self.query_texts(opts["scheduler"], seed=clients * 100 + seed)
+                if scheduler is None:
+                    ask = lambda q: search_index_batch([q], [opts["k"]])[0]
+                else:
+                    ask = lambda q, s=scheduler: s.search(q, opts["k"])
+
+                def timed(q):
+                    t0 = time.perf_counter()
+                    ask(q)
+                    return time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(clients) as pool:
+                    samples = np.array(list(pool.map(timed, texts))) * 1000.0
+                took = time.perf_counter() - t0
+                batch = f" mean_batch={scheduler.stats()['mean_batch']}" if scheduler else ""
+                self.stdout.write(
+                    f"clients={clients:<3} {label:32s} qps={len(texts) / took:.1f} "
+                    f"p50={np.percentile(samples, 50):.1f}ms p99={np.percentile(samples, 99):.1f}ms{batch}"
+                )
+
+    def query_texts(self, count, seed):
+        return [" ".join(chunk.split()[:12]) for resume in synthetic_resumes(count, 1, seed=seed) for chunk in resume]
+
+    def report(self, label, total, elapsed, unit="chunks"):
+        self.stdout.write(f"{label:40s} {unit}={total} took={elapsed:.2f}s throughput={total / elapsed:.1f} {unit}/s")
@@ -0,0 +1,65 @@
+import io
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from PyPDF2 import PdfReader, PdfWriter
+
+from resumes.utils import redact_pii, stream_pdf_chunks
+
+
+def inflate_pdf(path, pages):
+    # repeat the source pages until the document has `pages` pages
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    while len(writer.pages) < pages:
+        for page in reader.pages:
+            if len(writer.pages) == pages:
+                break
+            writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def legacy_chunks(data, chunk_size, overlap):
+    # the pre-streaming pipeline: whole-document string, then a full word list
+    text = ""
+    for p, page in enumerate(PdfReader(io.BytesIO(data)).pages, start=1):
+        t = page.extract_text()
+        if t:
+            text += f"\n\n---PAGE {p}---\n\n" + t
+    words = redact_pii(text).split()
+    chunks = []
+    i = 0
+    while i < len(words):
+        chunks.append(" ".join(words[i:i + chunk_size]))
+        i += chunk_size - overlap
+    return chunks
+
+
+class Command(BaseCommand):
+    help = "Compare whole-document and streaming PDF extraction/chunking (time and peak memory) on an inflated PDF."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf", help="source PDF; its pages are repeated to reach --pages")
+        parser.add_argument("--pages", type=int, nargs="+", default=[10, 100])
+        parser.add_argument("--chunk-size", type=int, default=250)
+        parser.add_argument("--overlap", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        size, overlap = opts["chunk_size"], opts["overlap"]
+        for pages in opts["pages"]:
+            data = inflate_pdf(opts["pdf"], pages)
+            self.measure(f"legacy    pages={pages}", lambda: len(legacy_chunks(data, size, overlap)))
+            # count chunks without keeping them, as an embed-and-store consumer would
+            self.measure(f"streaming pages={pages}", lambda: sum(1 for _ in stream_pdf_chunks(io.BytesIO(data), size, overlap)[0]))
+
+    def measure(self, label, run):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{label:24s} chunks={count} took={elapsed:.2f}s peak-mem={peak / 2**20:.1f}MB")
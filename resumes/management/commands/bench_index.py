@@ -0,0 +1,398 @@
+import json
+import multiprocessing
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from django.conf import settings
+
+from resumes.utils import (
+    FAISS_MMAP_FLAGS, ChunkIdStore, FaissIndexManager, IndexSnapshot, build_index, index_factory_spec, tune_index,
+)
+
+
+def percentiles(samples):
+    arr = np.array(samples) * 1000.0
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+def synthetic_vectors(n, d, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+def clustered_vectors(n, d, seed=0, clusters=1000):
+    # embeddings cluster by topic; uniform noise would make every ANN look bad
+    rng = np.random.default_rng(seed)
+    centers = np.random.default_rng(42).standard_normal((clusters, d)).astype("float32")
+    vecs = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+def synthetic_ids(n):
+    return ChunkIdStore().extend(uuid.uuid4() for _ in range(n))
+
+
+def memory_mb(keys=("Rss", "Pss")):
+    # Rss counts shared file pages in full; Pss splits them between sharers;
+    # Anonymous is what the page cache can't take back
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in keys:
+                out[key] = int(rest.split()[0]) / 1024.0
+    return out
+
+
+def index_mb(index):
+    return len(faiss.serialize_index(index)) / 2**20
+
+
+def loaded_memory(path, mmap, queries, k, results):
+    # what one worker holds after loading the index and serving queries
+    before = memory_mb(("Rss", "Anonymous"))
+    index = tune_index(faiss.read_index(path, FAISS_MMAP_FLAGS if mmap else 0))
+    index.search(queries, k)
+    after = memory_mb(("Rss", "Anonymous"))
+    results.put({key: after[key] - before[key] for key in after})
+
+
+def worker_memory(index_dir, mmap, d, ready, done, results):
+    manager = FaissIndexManager(index_dir, mmap=mmap)
+    manager.get(d).search(synthetic_vectors(8, d, seed=2), 5)
+    # measure only once every worker holds its index
+    ready.wait()
+    results.put(memory_mb())
+    done.wait()
+
+
+class Command(BaseCommand):
+    help = "Benchmark FAISS index load/search/upload latency and worker memory on a synthetic corpus (never touches the live index)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--n", type=int, default=100000, help="number of synthetic vectors")
+        parser.add_argument("--d", type=int, default=384)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--workers", type=int, default=0, help="report per-worker RSS/PSS for N worker processes")
+        parser.add_argument("--ids", action="store_true", help="compare id_map.json against the binary chunk-id store")
+        parser.add_argument("--uploads", type=int, default=0, help="time N uploads of --upload-size vectors each")
+        parser.add_argument("--upload-size", type=int, default=20)
+        parser.add_argument("--ann", action="append", default=[], help="factory string to compare against Flat, e.g. 'IVF{n},Flat', 'SQ8', 'IVF{n},PQ48,RFlat' (repeatable)")
+        parser.add_argument("--nprobe", default="4,16,64", help="comma-separated nprobe values for IVF")
+        parser.add_argument("--ef", default="16,64,256", help="comma-separated efSearch values for HNSW")
+        parser.add_argument("--k-factor", default="1,4,16", help="comma-separated re-rank factors for ',RFlat' / ',Refine(...)' indexes")
+        parser.add_argument("--memory", action="store_true", help="with --ann, also measure a worker's memory after loading each index privately and mmapped")
+        parser.add_argument("--filter", default="", help="comma-separated fractions of resumes a filter keeps, e.g. '0.5,0.05,0.005'")
+        parser.add_argument("--resumes", type=int, default=10000, help="synthetic resumes the rows are spread over (--filter)")
+        parser.add_argument("--factory", default="Flat", help="index type for --filter")
+        parser.add_argument("--match", action="store_true", help="compare chunk-averaging job matching with the resume-level index on --resumes resumes")
+        parser.add_argument("--chunks-per-resume", type=int, default=8, help="mean chunks per synthetic resume (--match)")
+        parser.add_argument("--top-n", type=int, default=10)
+
+    def handle(self, *args, **opts):
+        n, d = opts["n"], opts["d"]
+        with tempfile.TemporaryDirectory() as tmp:
+            index_dir = Path(tmp)
+            if opts["ids"]:
+                self.bench_ids(index_dir, n)
+                return
+            if opts["ann"]:
+                self.bench_ann(n, d, opts)
+                return
+            if opts["filter"]:
+                self.bench_filter(n, d, opts)
+                return
+            if opts["match"]:
+                self.bench_match(d, opts)
+                return
+            index = faiss.IndexFlatIP(d)
+            index.add(synthetic_vectors(n, d))
+            FaissIndexManager(index_dir).replace(index, synthetic_ids(n))
+            del index
+
+            if opts["workers"]:
+                for mmap in (False, True):
+                    self.bench_workers(index_dir, mmap, d, opts["workers"])
+            elif opts["uploads"]:
+                self.bench_uploads(index_dir, n, d, opts["uploads"], opts["upload_size"])
+            else:
+                self.bench_latency(index_dir, n, d, opts["k"], opts["queries"])
+
+    def bench_latency(self, index_dir, n, d, k, nq):
+        queries = synthetic_vectors(nq, d, seed=1)
+        # baseline: what every request used to do
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            FaissIndexManager(index_dir).get(d).search(q.reshape(1, -1), k)
+            samples.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(samples)
+        self.stdout.write(f"reload-per-query  n={n} p50={p50:.2f}ms p99={p99:.2f}ms")
+
+        manager = FaissIndexManager(index_dir)
+        manager.get(d)
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            manager.get(d).search(q.reshape(1, -1), k)
+            samples.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(samples)
+        self.stdout.write(f"resident          n={n} p50={p50:.2f}ms p99={p99:.2f}ms")
+
+    def bench_uploads(self, index_dir, n, d, uploads, size):
+        manager = FaissIndexManager(index_dir, max_delta_segments=uploads + 1)
+        manager.get(d)
+        samples = []
+        for i in range(uploads):
+            vecs = synthetic_vectors(size, d, seed=100 + i)
+            t0 = time.perf_counter()
+            manager.add(vecs, [uuid.uuid4() for _ in range(size)], d)
+            samples.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(samples)
+        self.stdout.write(f"upload            n={n} size={size} p50={p50:.2f}ms p99={p99:.2f}ms")
+        t0 = time.perf_counter()
+        manager.compact()
+        self.stdout.write(f"compaction        segments={uploads + 1} took={(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    def bench_workers(self, index_dir, mmap, d, workers):
+        ctx = multiprocessing.get_context("fork")
+        ready, done = ctx.Barrier(workers), ctx.Event()
+        results = ctx.Queue()
+        procs = [ctx.Process(target=worker_memory, args=(index_dir, mmap, d, ready, done, results)) for _ in range(workers)]
+        for p in procs:
+            p.start()
+        stats = [results.get() for _ in procs]
+        done.set()
+        for p in procs:
+            p.join()
+        rss = sum(s["Rss"] for s in stats) / workers
+        pss = sum(s["Pss"] for s in stats) / workers
+        mode = "mmap" if mmap else "private"
+        self.stdout.write(f"{mode:8s} workers={workers} per-worker rss={rss:.0f}MB pss={pss:.0f}MB total pss={pss * workers:.0f}MB")
+
+    def bench_ids(self, tmp, n):
+        ids = synthetic_ids(n)
+        ids.write(tmp / "chunk_ids.bin")
+        json_path = tmp / "id_map.json"
+        with open(json_path, "w") as f:
+            json.dump({str(i): ids.get(i) for i in range(n)}, f)
+        loaders = [
+            ("json", lambda: json.loads(json_path.read_text())),
+            ("bin", lambda: ChunkIdStore.load(tmp / "chunk_ids.bin")),
+            ("bin-mmap", lambda: ChunkIdStore.load(tmp / "chunk_ids.bin", mmap=True)),
+        ]
+        for name, load in loaders:
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            loaded = load()
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del loaded
+            self.stdout.write(f"{name:8s} n={n} load={elapsed * 1000:.1f}ms peak-mem={peak / 2**20:.1f}MB")
+
+    def bench_ann(self, n, d, opts):
+        k, nq = opts["k"], opts["queries"]
+        vecs = clustered_vectors(n, d)
+        queries = clustered_vectors(nq, d, seed=1)
+        flat = faiss.IndexFlatIP(d)
+        flat.add(vecs)
+        _, truth = flat.search(queries, k)
+        flat_mb = index_mb(flat)
+
+        def run(index, label):
+            samples = []
+            found = np.zeros((nq, k), dtype="int64")
+            for i, q in enumerate(queries):
+                t0 = time.perf_counter()
+                _, I = index.search(q.reshape(1, -1), k)
+                samples.append(time.perf_counter() - t0)
+                found[i] = I[0]
+            recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(nq)])
+            p50, p99 = percentiles(samples)
+            self.stdout.write(f"{label:40s} n={n} recall@{k}={recall:.3f} p50={p50:.2f}ms p99={p99:.2f}ms")
+
+        def memory(index, label):
+            size = index_mb(index)
+            line = f"{label:40s} size={size:.1f}MB ({size * 2**20 / n:.0f} B/vec, {flat_mb / size:.1f}x smaller than Flat)"
+            if isinstance(index, faiss.IndexRefine):
+                # with FAISS_MMAP only the scanned codes need to stay hot;
+                # re-ranking touches k * k_factor full vectors per query
+                line += f" scan={index_mb(index.base_index):.1f}MB"
+            self.stdout.write(line)
+            if opts["memory"]:
+                self.worker_memory(index, label, queries, k)
+
+        memory(flat, "Flat")
+        run(flat, "Flat")
+        self.warn_below_ann_threshold(n)
+        for spec in opts["ann"]:
+            t0 = time.perf_counter()
+            # build what was asked for even below FAISS_ANN_MIN_VECTORS,
+            # where the live index would stay Flat
+            index = build_index(vecs, d, factory=spec, min_vectors=0)
+            self.stdout.write(f"build {spec} as {index_factory_spec(n, spec, min_vectors=0)} took {time.perf_counter() - t0:.1f}s")
+            memory(index, spec)
+            sweep = []
+            if "HNSW" in spec:
+                sweep += [("efSearch", int(v)) for v in opts["ef"].split(",")]
+            elif "IVF" in spec:
+                sweep += [("nprobe", int(v)) for v in opts["nprobe"].split(",")]
+            if isinstance(index, faiss.IndexRefine):
+                sweep += [("k_factor", int(v)) for v in opts["k_factor"].split(",")]
+            for knob, value in sweep or [(None, None)]:
+                tune_index(index)
+                if knob == "nprobe":
+                    tune_index(index, nprobe=value)
+                elif knob == "efSearch":
+                    tune_index(index, ef_search=value)
+                elif knob == "k_factor":
+                    tune_index(index, k_factor=value)
+                run(index, f"{spec} {knob}={value}" if knob else spec)
+
+    def warn_below_ann_threshold(self, n):
+        threshold = getattr(settings, "FAISS_ANN_MIN_VECTORS", 10000)
+        if n < threshold:
+            self.stdout.write(f"note: n={n} is below FAISS_ANN_MIN_VECTORS={threshold}; the live index would build Flat")
+
+    def worker_memory(self, index, label, queries, k):
+        ctx = multiprocessing.get_context("fork")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "index.faiss")
+            faiss.write_index(index, path)
+            for mmap in (False, True):
+                results = ctx.Queue()
+                proc = ctx.Process(target=loaded_memory, args=(path, mmap, queries, k, results))
+                proc.start()
+                used = results.get()
+                proc.join()
+                mode = "mmap" if mmap else "private"
+                self.stdout.write(f"{'':40s} {mode:7s} worker rss=+{used['Rss']:.1f}MB anon=+{used['Anonymous']:.1f}MB")
+
+    def bench_filter(self, n, d, opts):
+        k, nq = opts["k"], opts["queries"]
+        vecs = clustered_vectors(n, d)
+        queries = clustered_vectors(nq, d, seed=1)
+        resume_ids = [uuid.uuid4() for _ in range(opts["resumes"])]
+        owners = np.random.default_rng(3).integers(0, len(resume_ids), n)
+        self.warn_below_ann_threshold(n)
+        index = tune_index(build_index(vecs, d, factory=opts["factory"], min_vectors=0), nprobe=int(opts["nprobe"].split(",")[-1]))
+        self.stdout.write(f"index {index_factory_spec(n, opts['factory'], min_vectors=0)}")
+        snapshot = IndexSnapshot(1, [("base", 0, index)], synthetic_ids(n), d, ChunkIdStore().extend(resume_ids[o] for o in owners))
+        for fraction in (float(f) for f in opts["filter"].split(",")):
+            keep = resume_ids[:max(1, int(len(resume_ids) * fraction))]
+            keep_set = set(range(len(keep)))
+            t0 = time.perf_counter()
+            rows = snapshot.rows_for_resumes(keep)
+            resolve = time.perf_counter() - t0
+
+            samples, filled = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                _, I = snapshot.search(q.reshape(1, -1), k, rows=rows)
+                samples.append(time.perf_counter() - t0)
+                filled.append(int((I[0] >= 0).sum()))
+            p50, p99 = percentiles(samples)
+            self.stdout.write(
+                f"selector    keep={fraction:<6} rows={len(rows)} resolve={resolve * 1000:.1f}ms "
+                f"p50={p50:.2f}ms p99={p99:.2f}ms filled={np.mean(filled):.1f}/{k}"
+            )
+
+            # the old way: over-fetch top_n*5 and drop what the filter rejects
+            for factor in (5, 50):
+                samples, filled = [], []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    _, I = snapshot.search(q.reshape(1, -1), k * factor)
+                    kept = [i for i in I[0] if i >= 0 and owners[i] in keep_set][:k]
+                    samples.append(time.perf_counter() - t0)
+                    filled.append(len(kept))
+                p50, p99 = percentiles(samples)
+                self.stdout.write(
+                    f"post x{factor:<3}   keep={fraction:<6} p50={p50:.2f}ms p99={p99:.2f}ms filled={np.mean(filled):.1f}/{k}"
+                )
+
+    def bench_match(self, d, opts):
+        from resumes.utils import pool_by_resume
+
+        top_n, nq, n_resumes = opts["top_n"], opts["queries"], opts["resumes"]
+        rng = np.random.default_rng(5)
+        # uneven chunk counts, so long resumes can crowd the chunk hits
+        counts = rng.integers(1, 2 * opts["chunks_per_resume"], n_resumes)
+        owner = np.repeat(np.arange(n_resumes), counts)
+        centers = clustered_vectors(n_resumes, d, seed=6)
+        vecs = centers[owner] + 0.5 * rng.standard_normal((len(owner), d)).astype("float32")
+        faiss.normalize_L2(vecs)
+        resume_ids = [uuid.uuid4() for _ in range(n_resumes)]
+        owner_ids = [resume_ids[o] for o in owner]
+        chunks = IndexSnapshot(1, [("base", 0, tune_index(build_index(vecs, d)))], synthetic_ids(len(vecs)), d, ChunkIdStore().extend(owner_ids))
+        pooled, pooled_ids = pool_by_resume(vecs, owner_ids)
+        resumes = IndexSnapshot(1, [("base", 0, tune_index(build_index(pooled, d)))], ChunkIdStore().extend(pooled_ids), d, ChunkIdStore().extend(pooled_ids))
+        self.stdout.write(f"corpus resumes={n_resumes} chunks={len(vecs)} d={d}")
+
+        queries = clustered_vectors(nq, d, seed=7)
+        noisy = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+        faiss.normalize_L2(noisy)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        def exact(q):
+            # exact max-sim of every resume; favours resumes with many chunks
+            return set(np.argsort(-np.maximum.reduceat(vecs @ q, starts))[:top_n].tolist())
+
+        def latent(q):
+            # what the synthetic resumes were generated from
+            return set(np.argsort(-(centers @ q))[:top_n].tolist())
+
+        def averaged(q):
+            # the previous JobMatchView: average of whatever chunks land in top_n*5
+            D, I = chunks.search(q.reshape(1, -1), top_n * 5)
+            sums, hits = {}, {}
+            for score, row in zip(D[0], I[0]):
+                if row >= 0:
+                    sums[owner[row]] = sums.get(owner[row], 0.0) + score
+                    hits[owner[row]] = hits.get(owner[row], 0) + 1
+            return set(sorted(sums, key=lambda r: sums[r] / hits[r], reverse=True)[:top_n])
+
+        slot = {str(rid): i for i, rid in enumerate(resume_ids)}
+
+        def shortlisted(q):
+            D, I = resumes.search(q.reshape(1, -1), top_n * 3)
+            short = [resumes.ids.get(row) for row in I[0] if row >= 0]
+            D, I = chunks.search(q.reshape(1, -1), len(short) * 3, rows=chunks.rows_for_resumes(short))
+            best = {}
+            for score, row in zip(D[0], I[0]):
+                if row >= 0:
+                    best.setdefault(owner[row], score)
+            floor = min(best.values(), default=0.0)
+            return set(sorted((slot[r] for r in short), key=lambda r: best.get(r, floor), reverse=True)[:top_n])
+
+        def pooled_only(q):
+            _, I = resumes.search(q.reshape(1, -1), top_n)
+            return {slot[resumes.ids.get(row)] for row in I[0] if row >= 0}
+
+        for name, rank in (("chunk-average", averaged), ("pooled", pooled_only), ("pooled+rescore", shortlisted)):
+            samples, overlap, relevant, stable = [], [], [], []
+            for q, qn in zip(queries, noisy):
+                t0 = time.perf_counter()
+                got = rank(q)
+                samples.append(time.perf_counter() - t0)
+                overlap.append(len(got & exact(q)) / top_n)
+                relevant.append(len(got & latent(q)) / top_n)
+                again = rank(qn)
+                stable.append(len(got & again) / max(1, len(got | again)))
+            p50, p99 = percentiles(samples)
+            self.stdout.write(
+                f"{name:14s} top_n={top_n} p50={p50:.2f}ms p99={p99:.2f}ms "
+                f"vs-max-sim={np.mean(overlap):.3f} vs-latent={np.mean(relevant):.3f} jaccard-under-noise={np.mean(stable):.3f}"
+            )
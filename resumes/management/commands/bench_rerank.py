@@ -0,0 +1,94 @@
+import json
+import random
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from resumes.models import ResumeChunk
+from resumes.rerank import Reranker
+from resumes.search import hybrid_search, tokenize
+from resumes.utils import query_index
+from resumes.views import hydrate_hits
+
+
+def percentiles(samples):
+    arr = np.array(samples) * 1000.0
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark /ask/ re-ranking on the live corpus: recall/MRR and cross-encoder latency for each "
+        "re-rank depth M (0 = first stage only), and the M the latency budget allows on this host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--depths", default="0,10,20,50,100", help="comma-separated re-rank depths M")
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--model", help="cross-encoder (default: settings.RERANK_MODEL; 'stub' for term overlap)")
+        parser.add_argument("--budget-ms", type=float, default=None, help="default: settings.RERANK_BUDGET_MS")
+        parser.add_argument("--vector", action="store_true", help="first stage is FAISS only instead of hybrid")
+        parser.add_argument("--qrels", help="JSON {query: [relevant chunk ids]}; default is known-item queries sampled from chunks")
+        parser.add_argument("--query-words", type=int, default=6, help="words per sampled known-item query")
+
+    def handle(self, *args, **opts):
+        model_name = opts["model"] or getattr(settings, "RERANK_MODEL", "")
+        if not model_name:
+            raise CommandError("no cross-encoder: set RERANK_MODEL or pass --model")
+        depths = sorted({int(m) for m in opts["depths"].split(",")})
+        k = opts["k"]
+        budget_ms = opts["budget_ms"] or getattr(settings, "RERANK_BUDGET_MS", 150.0)
+        reranker = Reranker(model_name, max_depth=max(depths), budget_ms=budget_ms)
+        qrels = self.qrels(opts)
+        if not qrels:
+            raise CommandError("no queries; index some resumes first")
+
+        # the first stage runs once per query at the deepest M, every depth
+        # re-ranks a prefix of the same shortlist
+        retrieve = query_index if opts["vector"] else hybrid_search
+        shortlists, first = {}, []
+        for q in qrels:
+            t0 = time.perf_counter()
+            shortlists[q] = hydrate_hits(retrieve(q, k=max(max(depths), k)))
+            first.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(first)
+        self.stdout.write(f"first stage ({'vector' if opts['vector'] else 'hybrid'}) queries={len(qrels)} p50={p50:.1f}ms p99={p99:.1f}ms")
+
+        reranker.rerank("warm up", shortlists[next(iter(qrels))], 1)
+        for m in depths:
+            recall, rr, samples = [], [], []
+            for q, relevant in qrels.items():
+                t0 = time.perf_counter()
+                ranked = reranker.rerank(q, shortlists[q], m) if m else shortlists[q]
+                samples.append(time.perf_counter() - t0)
+                hits = [str(chunk.id) for _, chunk in ranked[:k]]
+                recall.append(len(relevant.intersection(hits)) / len(relevant))
+                rr.append(next((1.0 / (i + 1) for i, h in enumerate(hits) if h in relevant), 0.0))
+            p50, p99 = percentiles(samples)
+            self.stdout.write(
+                f"M={m:<4d} recall@{k}={np.mean(recall):.3f} mrr={np.mean(rr):.3f} rerank p50={p50:.1f}ms p99={p99:.1f}ms"
+            )
+        stats = reranker.stats()
+        reranker.max_depth = getattr(settings, "RERANK_MAX_DEPTH", 50)
+        self.stdout.write(
+            f"{model_name}: {stats['fixed_ms']:.2f}ms + {stats['pair_cost_ms']:.3f}ms/pair -> a {budget_ms:.0f}ms budget "
+            f"re-ranks M={reranker.depth(k)} for k={k} (RERANK_MAX_DEPTH={reranker.max_depth})"
+        )
+
+    def qrels(self, opts):
+        if opts["qrels"]:
+            with open(opts["qrels"]) as f:
+                return {q: set(ids) for q, ids in json.load(f).items()}
+        # known-item: a few words lifted from a chunk should find that chunk
+        rng = random.Random(1)
+        ids = list(ResumeChunk.objects.values_list("id", flat=True))
+        qrels = {}
+        for cid in rng.sample(ids, min(opts["queries"], len(ids))):
+            words = tokenize(ResumeChunk.objects.get(id=cid).chunk_text)
+            if len(words) >= opts["query_words"]:
+                start = rng.randrange(len(words) - opts["query_words"] + 1)
+                qrels[" ".join(words[start:start + opts["query_words"]])] = {str(cid)}
+        return qrels
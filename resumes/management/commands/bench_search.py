@@ -0,0 +1,104 @@
+import json
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from resumes.models import ResumeChunk
+from resumes.search import BM25Index, LEXICAL_INDEX, hybrid_search, tokenize
+from resumes.utils import query_index
+
+
+def percentiles(samples):
+    arr = np.array(samples) * 1000.0
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+def synthetic_chunks(n, words=250, vocab=50000, seed=0):
+    # Zipf-ish term frequencies, roughly what natural text looks like
+    rng = np.random.default_rng(seed)
+    terms = [f"w{i}" for i in range(vocab)]
+    ranks = np.minimum(rng.zipf(1.2, size=(n, words)), vocab) - 1
+    return [" ".join(terms[r] for r in row) for row in ranks]
+
+
+class Command(BaseCommand):
+    help = "Benchmark lexical (BM25), vector and hybrid retrieval: latency on a synthetic corpus, quality on the live one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--n", type=int, default=100000, help="synthetic chunks for the latency run")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--quality", action="store_true", help="measure recall/MRR on the live corpus instead")
+        parser.add_argument("--qrels", help="JSON {query: [relevant chunk ids]}; default is known-item queries sampled from chunks")
+        parser.add_argument("--query-words", type=int, default=6, help="words per sampled known-item query")
+
+    def handle(self, *args, **opts):
+        if opts["quality"]:
+            self.bench_quality(opts)
+        else:
+            self.bench_latency(opts["n"], opts["queries"], opts["k"])
+
+    def bench_latency(self, n, nq, k):
+        chunks = synthetic_chunks(n)
+        index = BM25Index()
+        t0 = time.perf_counter()
+        for i, text in enumerate(chunks):
+            index.add(i, i // 10, text)
+        self.stdout.write(f"bm25 build        n={n} took={time.perf_counter() - t0:.1f}s")
+
+        rng = random.Random(1)
+        queries = [" ".join(rng.sample(chunks[rng.randrange(n)].split(), 3)) for _ in range(nq)]
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, k)
+            samples.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(samples)
+        self.stdout.write(f"bm25 search       n={n} p50={p50:.2f}ms p99={p99:.2f}ms")
+
+        # what icontains does, minus the database round trip
+        samples = []
+        for q in queries[:20]:
+            t0 = time.perf_counter()
+            needle = q.lower()
+            [i for i, text in enumerate(chunks) if needle in text.lower()]
+            samples.append(time.perf_counter() - t0)
+        p50, p99 = percentiles(samples)
+        self.stdout.write(f"substring scan    n={n} p50={p50:.2f}ms p99={p99:.2f}ms")
+
+    def bench_quality(self, opts):
+        k = opts["k"]
+        if opts["qrels"]:
+            with open(opts["qrels"]) as f:
+                qrels = {q: set(ids) for q, ids in json.load(f).items()}
+        else:
+            # known-item: a few words lifted from a chunk should find that chunk
+            rng = random.Random(1)
+            ids = list(ResumeChunk.objects.values_list("id", flat=True))
+            qrels = {}
+            for cid in rng.sample(ids, min(opts["queries"], len(ids))):
+                words = tokenize(ResumeChunk.objects.get(id=cid).chunk_text)
+                if len(words) >= opts["query_words"]:
+                    start = rng.randrange(len(words) - opts["query_words"] + 1)
+                    qrels[" ".join(words[start:start + opts["query_words"]])] = {str(cid)}
+        lexical = LEXICAL_INDEX.get()
+        retrievers = [
+            ("vector", lambda q: query_index(q, k=k)),
+            ("bm25", lambda q: lexical.search(q, k=k)),
+            ("hybrid", lambda q: hybrid_search(q, k=k)),
+        ]
+        for name, retrieve in retrievers:
+            recall, rr, samples = [], [], []
+            for q, relevant in qrels.items():
+                t0 = time.perf_counter()
+                hits = [h["chunk_id"] for h in retrieve(q)]
+                samples.append(time.perf_counter() - t0)
+                recall.append(len(relevant.intersection(hits)) / len(relevant))
+                rr.append(next((1.0 / (i + 1) for i, h in enumerate(hits) if h in relevant), 0.0))
+            p50, p99 = percentiles(samples)
+            self.stdout.write(
+                f"{name:8s} queries={len(qrels)} recall@{k}={np.mean(recall):.3f} mrr={np.mean(rr):.3f} "
+                f"p50={p50:.2f}ms p99={p99:.2f}ms"
+            )
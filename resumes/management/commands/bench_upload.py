@@ -0,0 +1,99 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from resumes.models import Resume
+from resumes.views import ResumeUploadView
+
+
+def percentiles(samples):
+    arr = np.array(samples) * 1000.0
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+class Command(BaseCommand):
+    help = (
+        "Load POST /resumes/upload/ with N concurrent clients and report upload p50/p99 per task backend. "
+        "'sync' processes inside the request, as uploads did before the task backend; 'thread' answers 202 "
+        "and processes in the background, so its time until processed is reported as well."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdfs", nargs="+", help="PDF files to upload, cycled")
+        parser.add_argument("--backends", default="sync,thread", help="comma-separated RESUME_TASK_BACKEND values")
+        parser.add_argument("--clients", default="1,8,32", help="comma-separated concurrency levels")
+        parser.add_argument("--uploads", type=int, default=64, help="uploads per level")
+        parser.add_argument("--user", help="username to upload as (default: first user)")
+        parser.add_argument("--same-file", action="store_true", help="upload identical bytes, so ingest dedup reuses the first parse")
+        parser.add_argument("--keep", action="store_true", help="keep the uploaded resumes instead of deleting them")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        user = User.objects.filter(username=opts["user"]).first() if opts["user"] else User.objects.first()
+        if user is None:
+            raise CommandError("no user to upload as")
+        files = [(Path(p).name, Path(p).read_bytes()) for p in opts["pdfs"]]
+        for backend in opts["backends"].split(","):
+            for clients in (int(c) for c in opts["clients"].split(",")):
+                with override_settings(RESUME_TASK_BACKEND=backend):
+                    ids, samples, took = self.run(user, files, clients, opts)
+                    processed = self.wait_processed(ids)
+                rps = len(samples) / took
+                p50, p99 = percentiles(samples)
+                line = f"{backend:6s} clients={clients:<3} uploads/s={rps:.1f} upload p50={p50:.1f}ms p99={p99:.1f}ms"
+                if backend != "sync":
+                    p50, p99 = percentiles(processed)
+                    line += f" processed p50={p50:.0f}ms p99={p99:.0f}ms"
+                failed = Resume.objects.filter(id__in=ids, status="failed").count()
+                if failed:
+                    line += f" failed={failed}"
+                self.stdout.write(line)
+                if not opts["keep"]:
+                    for resume in Resume.objects.filter(id__in=ids):
+                        resume.original_file.delete(save=False)
+                        resume.delete()
+
+    def run(self, user, files, clients, opts):
+        view = ResumeUploadView.as_view()
+        factory = APIRequestFactory()
+        self.started = {}
+
+        def one(i):
+            close_old_connections()
+            name, data = files[i % len(files)]
+            if not opts["same_file"]:
+                # bytes after %%EOF keep the PDF readable and its hash distinct
+                data += f"\n% bench {uuid.uuid4()}\n".encode()
+            request = factory.post("/api/resumes/upload/", {"file": SimpleUploadedFile(name, data, "application/pdf")}, format="multipart")
+            force_authenticate(request, user=user)
+            t0 = time.perf_counter()
+            response = view(request)
+            elapsed = time.perf_counter() - t0
+            assert response.status_code == 202, response.status_code
+            self.started[response.data["id"]] = t0
+            return elapsed
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            samples = list(pool.map(one, range(opts["uploads"])))
+        return list(self.started), samples, time.perf_counter() - t0
+
+    def wait_processed(self, ids, poll=0.02):
+        # upload start -> status leaves "processing", to within one poll
+        done = {}
+        while len(done) < len(ids):
+            now = time.perf_counter()
+            for resume_id, status in Resume.objects.filter(id__in=[i for i in ids if i not in done]).values_list("id", "status"):
+                if status != "processing":
+                    done[str(resume_id)] = now - self.started[str(resume_id)]
+            time.sleep(poll)
+        return list(done.values())
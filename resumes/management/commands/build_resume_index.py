@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from resumes.utils import INDEX_MANAGER, RESUME_INDEX_MANAGER, ChunkIdStore, build_index, pool_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the resume-level index (one pooled vector per resume) from the chunk index."
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        snapshot = INDEX_MANAGER.get()
+        if len(snapshot.resumes) < snapshot.ntotal:
+            raise CommandError("chunk rows have no resume ids yet; run backfill_resume_ids first")
+        sums, owners = pool_index(INDEX_MANAGER)
+        RESUME_INDEX_MANAGER.replace(build_index(sums, snapshot.d, RESUME_INDEX_MANAGER.factory), ChunkIdStore().extend(owners), ChunkIdStore().extend(owners))
+        self.stdout.write(self.style.SUCCESS(
+            f"indexed {len(owners)} resumes from {snapshot.ntotal} chunks in {time.perf_counter() - t0:.1f}s"
+        ))
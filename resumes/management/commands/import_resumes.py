@@ -0,0 +1,231 @@
+import hashlib
+import io
+import json
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from resumes.dedup import dedup_enabled, embed_texts, find_sources, source_chunks
+from resumes.matching import refresh_matches_safely
+from resumes.models import Resume, ResumeChunk
+from resumes.tasks import CHUNK_OVERLAP, CHUNK_SIZE, chunk_rows
+from resumes.utils import (
+    INDEX_MANAGER, IndexModelChanged, active_model_name, atomic_write_json, encode_texts, index_vectors, missing_ids,
+    stream_pdf_chunks,
+)
+
+# resumes per chunk query while indexing
+RESUME_SLICE = 500
+
+
+def list_sources(source):
+    # (key, filename) pairs; key identifies the file across runs
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = sorted(n for n in zf.namelist() if n.lower().endswith(".pdf"))
+        return [(f"{source}!{n}", n) for n in names]
+    return [(str(p), p.name) for p in sorted(Path(source).rglob("*.pdf"))]
+
+
+def read_source(key):
+    if "!" in key:
+        archive, member = key.split("!", 1)
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                return zf.read(member)
+    with open(key, "rb") as f:
+        return f.read()
+
+
+def hash_source(key):
+    return key, hashlib.sha256(read_source(key)).hexdigest()
+
+
+def parse_source(key):
+    # runs in a pool process: PDF text extraction is pure Python and CPU-bound
+    data = read_source(key)
+    chunks, summary = stream_pdf_chunks(io.BytesIO(data), chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    chunks = list(chunks)
+    return key, data, "".join(summary), chunks
+
+
+class Command(BaseCommand):
+    help = "Bulk-import a directory or zip of PDF resumes: parallel parsing, bulk inserts, one index update at the end."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="directory (searched recursively) or .zip of PDFs")
+        parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count)")
+        parser.add_argument("--batch", type=int, default=100, help="files per DB transaction / checkpoint")
+        parser.add_argument("--embed-batch", type=int, default=256, help="chunks per model.encode call")
+        parser.add_argument("--index-batch", type=int, default=4096, help="chunks per index write while indexing")
+        parser.add_argument("--owner", help="username to own the imported resumes")
+        parser.add_argument("--checkpoint", help="progress file (default: <source>.checkpoint.json)")
+
+    def handle(self, *args, **opts):
+        source = Path(opts["source"])
+        if not source.exists():
+            raise CommandError(f"{source} not found")
+        owner = None
+        if opts["owner"]:
+            owner = get_user_model().objects.filter(username=opts["owner"]).first()
+            if owner is None:
+                raise CommandError(f"user {opts['owner']} not found")
+        checkpoint_path = Path(opts["checkpoint"] or f"{str(source).rstrip('/')}.checkpoint.json")
+        done = json.loads(checkpoint_path.read_text()) if checkpoint_path.exists() else {}
+
+        pending = [(key, name) for key, name in list_sources(source) if key not in done]
+        self.stdout.write(f"{len(done)} files already imported, {len(pending)} to go")
+        names = dict(pending)
+
+        t0 = time.perf_counter()
+        parsed = 0
+        # forked parsers must not inherit (and later close) our DB sockets
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=opts["workers"], mp_context=get_context("fork")) as pool:
+            for start in range(0, len(pending), opts["batch"]):
+                batch = [key for key, _ in pending[start:start + opts["batch"]]]
+                # one parse per distinct file; copies of a file already in
+                # the database, or earlier in this batch, reuse its chunks
+                hashes = dict(pool.map(hash_source, batch, chunksize=16))
+                # committed by a run that died before writing the checkpoint
+                recovered = self.imported_before(batch, hashes, names, owner, set(done.values()))
+                done.update(recovered)
+                batch = [key for key in batch if key not in recovered]
+                sources = find_sources(hashes.values())
+                seen = set(sources)
+                to_parse = []
+                for key in batch:
+                    if not dedup_enabled() or hashes[key] not in seen:
+                        seen.add(hashes[key])
+                        to_parse.append(key)
+                results = list(pool.map(parse_source, to_parse, chunksize=4))
+                parsed_keys = set(to_parse)
+                copies = [key for key in batch if key not in parsed_keys]
+                done.update(self.store_batch(results, copies, names, owner, hashes, sources))
+                # only after the rows are committed, so a restart never skips a
+                # file; a crash in between is caught by imported_before
+                atomic_write_json(checkpoint_path, done)
+                parsed += len(batch) + len(recovered)
+                elapsed = time.perf_counter() - t0
+                self.stdout.write(f"parsed {parsed}/{len(pending)} files ({parsed / elapsed:.1f} files/s)")
+
+        # index everything this source imported that isn't searchable yet,
+        # including resumes left over from an interrupted earlier run
+        indexed = self.index_pending(list(done.values()), opts["embed_batch"], opts["index_batch"])
+        elapsed = time.perf_counter() - t0
+        rate = len(pending) / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"imported {len(pending)} files, indexed {indexed} chunks in {elapsed:.1f}s ({rate:.1f} files/s)"
+        ))
+
+    def imported_before(self, batch, hashes, names, owner, claimed):
+        # {key: resume id} for files of this batch already in the DB under the
+        # same name, owner and content but not in the checkpoint. Each row
+        # accounts for one file, so identical files still import once each
+        rows = defaultdict(list)
+        existing = Resume.objects.filter(owner=owner, content_sha256__in={hashes[key] for key in batch})
+        for rid, filename, sha in existing.order_by("uploaded_at", "id").values_list("id", "filename", "content_sha256"):
+            if str(rid) not in claimed:
+                rows[(filename, sha)].append(str(rid))
+        found = {}
+        for key in batch:
+            matches = rows.get((names[key], hashes[key]))
+            if matches:
+                found[key] = matches.pop(0)
+        return found
+
+    def store_batch(self, results, copies, names, owner, hashes, sources):
+        parsed = {hashes[key]: (summary, parsed_chunks) for key, _, summary, parsed_chunks in results}
+        copied = source_chunks({sources[hashes[key]] for key in copies if hashes[key] in sources})
+        entries = list(results)
+        for key in copies:
+            sha = hashes[key]
+            summary, parsed_chunks = parsed[sha] if sha in parsed else copied[sources[sha]]
+            entries.append((key, read_source(key), summary, parsed_chunks))
+        resumes, chunks, stored = [], [], {}
+        for key, data, summary, parsed_chunks in entries:
+            resume = Resume(
+                filename=names[key],
+                owner=owner,
+                status="processing" if parsed_chunks else "failed",
+                summary=summary,
+                content_sha256=hashes[key],
+            )
+            resume.original_file.save(names[key], ContentFile(data), save=False)
+            resumes.append(resume)
+            chunks.extend(chunk_rows(resume, parsed_chunks))
+            stored[key] = str(resume.id)
+        with transaction.atomic():
+            Resume.objects.bulk_create(resumes)
+            ResumeChunk.objects.bulk_create(chunks, batch_size=1000)
+        return stored
+
+    def index_pending(self, resume_ids, embed_batch, index_batch):
+        # Chunks of the imported resumes still "processing", read a slice of
+        # resumes at a time (each slice drained before anything is written),
+        # so memory holds one slice and one batch, not the whole import. A
+        # batch is cut at a resume boundary, indexed as one delta, and its
+        # resumes marked processed; a rerun continues with what's left.
+        resume_ids = sorted(resume_ids)
+        written = 0
+        batch = []
+        for start in range(0, len(resume_ids), RESUME_SLICE):
+            pending = Resume.objects.filter(id__in=resume_ids[start:start + RESUME_SLICE], status="processing")
+            rows = list(
+                ResumeChunk.objects.filter(resume__in=pending)
+                .order_by("resume_id", "chunk_order")
+                .values_list("id", "resume_id", "chunk_text", "text_sha256")
+            )
+            for row in rows:
+                if len(batch) >= index_batch and row[1] != batch[-1][1]:
+                    written += self.index_batch(batch, embed_batch)
+                    batch = []
+                batch.append(row)
+        if batch:
+            written += self.index_batch(batch, embed_batch)
+        return written
+
+    def index_batch(self, batch, embed_batch):
+        resumes = list(dict.fromkeys(rid for _, rid, _, _ in batch))
+        written = 0
+        while True:
+            model_name = active_model_name()
+            # a run interrupted between indexing and the status update left
+            # these chunks in the index already; writing them again would
+            # duplicate their rows
+            missing = set(missing_ids(INDEX_MANAGER.get().ids, [cid for cid, _, _, _ in batch]))
+            todo = [c for c in batch if str(c[0]) in missing]
+            if not todo:
+                break
+            t0 = time.perf_counter()
+            # each distinct chunk text is encoded once; texts embedded before
+            # (re-uploads) reuse the stored vector
+            vecs, encoded = embed_texts(
+                [text for _, _, text, _ in todo],
+                [sha for _, _, _, sha in todo],
+                encode=lambda texts: encode_texts(texts, batch_size=embed_batch, model_name=model_name),
+                model_name=model_name,
+            )
+            self.stdout.write(
+                f"embedded {len(todo)} chunks, {encoded} encoded ({len(todo) / (time.perf_counter() - t0):.1f} chunks/s)"
+            )
+            try:
+                index_vectors(vecs, [cid for cid, _, _, _ in todo], [rid for _, rid, _, _ in todo], model_name)
+                written = len(todo)
+                break
+            except IndexModelChanged:
+                # rebuild_index switched the live index to another model; encode again
+                continue
+        Resume.objects.filter(id__in=resumes).update(status="processed")
+        refreshed = refresh_matches_safely(resumes)
+        if refreshed:
+            self.stdout.write(f"updated {refreshed} cached job matches")
+        return written
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from resumes.matching import match_job, match_jobs
+from resumes.models import Job
+
+
+class Command(BaseCommand):
+    help = "Re-rank jobs against the whole corpus in one batch (one encode, one multi-query search) and store the reports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--job", action="append", default=[], help="job id (repeatable); default is every job")
+        parser.add_argument("--top-n", type=int, default=10)
+        parser.add_argument("--compare", action="store_true", help="also time the per-job path and report jobs/sec for both")
+
+    def handle(self, *args, **opts):
+        jobs = Job.objects.all().order_by("-created_at")
+        if opts["job"]:
+            jobs = jobs.filter(id__in=opts["job"])
+        jobs = list(jobs)
+        top_n = opts["top_n"]
+        if opts["compare"]:
+            t0 = time.perf_counter()
+            for job in jobs:
+                # what one POST /jobs/<id>/match/ per job costs without a cache hit
+                job.match_generation = ""
+                match_job(job, top_n)
+            took = time.perf_counter() - t0
+            self.stdout.write(f"per-job  jobs={len(jobs)} took={took:.2f}s ({len(jobs) / took:.1f} jobs/s)")
+        t0 = time.perf_counter()
+        results = match_jobs(jobs, top_n)
+        took = time.perf_counter() - t0
+        self.stdout.write(f"batch    jobs={len(jobs)} took={took:.2f}s ({len(jobs) / took:.1f} jobs/s)")
+        self.stdout.write(self.style.SUCCESS(f"stored {sum(len(m) for m in results.values())} match reports"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from resumes.utils import CHUNK_IDS_PATH, ID_MAP_PATH, migrate_id_map
+
+
+class Command(BaseCommand):
+    help = "Convert the legacy faiss_index/id_map.json into the binary chunk-id store (chunk_ids.bin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--remove-json", action="store_true", help="delete id_map.json after converting")
+
+    def handle(self, *args, **opts):
+        if not ID_MAP_PATH.exists():
+            raise CommandError(f"{ID_MAP_PATH} not found")
+        count = migrate_id_map(ID_MAP_PATH, CHUNK_IDS_PATH)
+        self.stdout.write(self.style.SUCCESS(f"wrote {count} chunk ids to {CHUNK_IDS_PATH}"))
+        if opts["remove_json"]:
+            ID_MAP_PATH.unlink()
@@ -0,0 +1,191 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from resumes.dedup import embed_texts
+from resumes.models import Resume, ResumeChunk
+from resumes.utils import (
+    DEFAULT_MODEL_NAME, INDEX_MANAGER, INDEX_REGISTRY, RESUME_INDEX_MANAGER, RESUME_INDEX_SUBDIR, ChunkIdStore,
+    FaissIndexManager, build_index, embedding_dimension, encode_texts, missing_ids, pool_by_resume, pool_index, remove_from_index,
+)
+
+# uploads that committed while we streamed are picked up by created_at
+SLACK = timedelta(minutes=5)
+# batches per keyset page
+PAGE_BATCHES = 10
+
+
+def indexed_chunks():
+    # chunks of resumes that finished processing; import_resumes indexes the rest itself
+    return ResumeChunk.objects.filter(resume__status="processed")
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed every indexed chunk into a new index version next to the live one, then switch to it. "
+        "Run it after changing EMBEDDING_MODEL, or to purge deleted rows. An interrupted run resumes "
+        "from its last written batch when rerun with the same model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", help="embedding model for the new version (default: settings.EMBEDDING_MODEL)")
+        parser.add_argument("--batch", type=int, default=4096, help="chunks per index write; a rerun continues after the last one")
+        parser.add_argument("--encode-batch", type=int, default=256, help="texts per model.encode call")
+        parser.add_argument("--fresh", action="store_true", help="start a new version even if an unfinished one exists")
+        parser.add_argument("--no-switch", action="store_true", help="build the version but leave the live one serving")
+        parser.add_argument("--activate", metavar="VERSION", help="only switch to an existing version, e.g. to roll back")
+        parser.add_argument("--grace", type=float, default=2.0, help="seconds to let in-flight uploads commit before reconciling")
+
+    def handle(self, *args, **opts):
+        if opts["activate"]:
+            tag = INDEX_REGISTRY.tag(opts["activate"])
+            if tag.get("status") != "ready":
+                raise CommandError(f"{opts['activate']} is not a finished build")
+            # catch up on everything uploaded or deleted since it was built
+            self.switch(opts["activate"], datetime.fromisoformat(tag["finished"]), opts["grace"])
+            return
+        t0 = time.perf_counter()
+        model_name = opts["model"] or getattr(settings, "EMBEDDING_MODEL", DEFAULT_MODEL_NAME)
+        d = embedding_dimension(model_name)
+        version = None if opts["fresh"] else self.unfinished(model_name, d)
+        if version is None:
+            version = INDEX_REGISTRY.create(model_name, d)
+            INDEX_REGISTRY.write_tag(version, dict(INDEX_REGISTRY.tag(version), started=timezone.now().isoformat()))
+            self.stdout.write(f"building {version} ({model_name}, d={d})")
+        else:
+            self.stdout.write(f"resuming {version} ({model_name}, d={d})")
+        tag = INDEX_REGISTRY.tag(version)
+        path = INDEX_REGISTRY.root / version
+        # one delta per batch, merged once at the end
+        chunks = FaissIndexManager(path, max_delta_segments=sys.maxsize, factory=INDEX_MANAGER.factory)
+        written = self.stream(chunks, model_name, d, opts)
+        if not chunks.get(d).ntotal:
+            self.stdout.write("no indexed chunks in the database; nothing to rebuild")
+            return
+        chunks.compact()
+        pooled, owners = pool_index(chunks)
+        owners = ChunkIdStore().extend(owners)
+        FaissIndexManager(path / RESUME_INDEX_SUBDIR).replace(build_index(pooled, d, RESUME_INDEX_MANAGER.factory), owners, owners)
+        tag.update(status="ready", finished=timezone.now().isoformat())
+        INDEX_REGISTRY.write_tag(version, tag)
+        took = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"built {version}: {chunks.get().ntotal} chunk rows ({written} this run) and {len(owners)} resume rows "
+            f"in {took:.1f}s ({written / took:.1f} chunks/s)"
+        ))
+        if opts["no_switch"]:
+            self.stdout.write(f"not switched; run rebuild_index --activate {version}")
+            return
+        self.switch(version, datetime.fromisoformat(tag["started"]), opts["grace"])
+
+    def unfinished(self, model_name, d):
+        # the newest build for this model that didn't get to the end
+        building = [v for v, tag in INDEX_REGISTRY.versions() if tag.get("status") == "building" and tag["model"] == model_name and tag["d"] == d]
+        return building[-1] if building else None
+
+    def stream(self, chunks, model_name, d, opts):
+        # Chunks in (resume_id, id) order, a keyset page at a time. Each page
+        # is drained through its own server-side cursor before anything is
+        # encoded or written, so no cursor stays open across writes or for
+        # the whole run. A batch is cut at a resume boundary and written as
+        # one delta, so the partial index is the checkpoint: its last row is
+        # where a rerun picks up, and every resume it holds is complete.
+        t0 = time.perf_counter()
+        snapshot = chunks.get(d)
+        done = snapshot.ntotal
+        total = indexed_chunks().count()
+        cursor = (snapshot.resumes.get(done - 1), snapshot.ids.get(done - 1)) if done else None
+        page_size = opts["batch"] * PAGE_BATCHES
+        written = 0
+        batch = []
+        while True:
+            rows = list(self.page(cursor, page_size, opts["batch"]))
+            for row in rows:
+                if len(batch) >= opts["batch"] and row[1] != batch[-1][1]:
+                    written += self.write_batch(chunks, batch, model_name, opts["encode_batch"])
+                    batch = []
+                    self.progress(done + written, total, written, t0)
+                batch.append(row)
+            if len(rows) < page_size:
+                break
+            cursor = (batch[-1][1], batch[-1][0])
+        if batch:
+            written += self.write_batch(chunks, batch, model_name, opts["encode_batch"])
+            self.progress(done + written, total, written, t0)
+        return written
+
+    def page(self, cursor, size, chunk_size):
+        qs = indexed_chunks().order_by("resume_id", "id")
+        if cursor is not None:
+            qs = qs.filter(Q(resume_id__gt=cursor[0]) | Q(resume_id=cursor[0], id__gt=cursor[1]))
+        return qs.values_list("id", "resume_id", "chunk_text", "text_sha256")[:size].iterator(chunk_size=chunk_size)
+
+    def write_batch(self, chunks, batch, model_name, encode_batch):
+        vecs, _ = embed_texts(
+            [text for _, _, text, _ in batch],
+            [sha for _, _, _, sha in batch],
+            encode=lambda texts: encode_texts(texts, batch_size=encode_batch, model_name=model_name),
+            model_name=model_name,
+        )
+        chunks.add(vecs, [cid for cid, _, _, _ in batch], d=vecs.shape[1], resume_ids=[rid for _, rid, _, _ in batch])
+        return len(batch)
+
+    def progress(self, done, total, written, t0):
+        rate = written / (time.perf_counter() - t0)
+        eta = max(total - done, 0) / rate if rate else 0
+        self.stdout.write(f"{done}/{total} chunks ({rate:.1f} chunks/s, ~{eta:.0f}s left)")
+
+    def switch(self, version, since, grace):
+        # under both write locks: uploads check the active model under them,
+        # so none can write vectors from the old model into the new version
+        with INDEX_MANAGER.writing(), RESUME_INDEX_MANAGER.writing():
+            previous = INDEX_REGISTRY.active()["version"]
+            INDEX_REGISTRY.activate(version)
+        self.stdout.write(f"switched {previous or 'legacy index'} -> {version}")
+        time.sleep(grace)
+        added = self.reconcile(since - SLACK)
+        stale = self.stale_resumes()
+        removed = remove_from_index(stale) if stale else 0
+        self.stdout.write(self.style.SUCCESS(f"{added} rows caught up, {removed} rows of deleted resumes removed"))
+
+    def reconcile(self, since):
+        # uploads that reached the old version after we streamed past them
+        recent = list(indexed_chunks().filter(created_at__gte=since).order_by("resume_id", "chunk_order").values_list(
+            "id", "resume_id", "chunk_text", "text_sha256",
+        ))
+        if not recent:
+            return 0
+        missing = set(missing_ids(INDEX_MANAGER.get().ids, [cid for cid, _, _, _ in recent]))
+        chunks = [c for c in recent if str(c[0]) in missing]
+        if chunks:
+            vecs, _ = embed_texts([text for _, _, text, _ in chunks], [sha for _, _, _, sha in chunks])
+            INDEX_MANAGER.add(vecs, [cid for cid, _, _, _ in chunks], d=vecs.shape[1], resume_ids=[rid for _, rid, _, _ in chunks])
+        # the resume index gets rows for resumes it lacks, pooled over all their chunks
+        lacking = set(missing_ids(RESUME_INDEX_MANAGER.get().ids, {rid for _, rid, _, _ in recent}))
+        resumes = [c for c in recent if str(c[1]) in lacking]
+        if resumes:
+            vecs, _ = embed_texts([text for _, _, text, _ in resumes], [sha for _, _, _, sha in resumes])
+            pooled, pooled_ids = pool_by_resume(vecs, [rid for _, rid, _, _ in resumes])
+            RESUME_INDEX_MANAGER.add(pooled, pooled_ids, d=pooled.shape[1], resume_ids=pooled_ids)
+        return len(chunks)
+
+    def stale_resumes(self):
+        # resumes in the live version that are gone from the DB: deleted
+        # while it was built, or since it was retired (rollback)
+        snapshot = INDEX_MANAGER.get()
+        keys = snapshot.resumes.keys()
+        _, first = np.unique(keys[keys != 0], return_index=True)
+        rows = np.flatnonzero(keys != 0)[first]
+        indexed = [snapshot.resumes.get(row) for row in rows.tolist()]
+        stale = set()
+        for start in range(0, len(indexed), 1000):
+            part = indexed[start:start + 1000]
+            present = {str(rid) for rid in Resume.objects.filter(id__in=part).values_list("id", flat=True)}
+            stale.update(rid for rid in part if rid not in present)
+        return stale
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from resumes.models import Resume
+from resumes.tasks import requeue_stale_resumes, task_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Hand uploads stuck in 'processing' back to the task backend, e.g. the thread backend's queue "
+        "after a worker restart. With the thread backend they are processed here, before the command exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-minutes", type=float, default=None,
+            help="only uploads older than this (default: settings.RESUME_TASK_STALE_MINUTES)",
+        )
+
+    def handle(self, *args, **opts):
+        minutes = opts["stale_minutes"]
+        if minutes is None:
+            minutes = getattr(settings, "RESUME_TASK_STALE_MINUTES", 30)
+        requeued = requeue_stale_resumes(timedelta(minutes=minutes))
+        # the thread backend's futures: this process's pool goes away on exit
+        for _, result in requeued:
+            if hasattr(result, "result"):
+                result.result()
+        ids = [resume_id for resume_id, _ in requeued]
+        if task_backend() == "celery":
+            self.stdout.write(self.style.SUCCESS(f"enqueued {len(ids)} stale uploads"))
+            return
+        statuses = dict(Resume.objects.filter(id__in=ids).values_list("id", "status"))
+        done = sum(statuses.get(resume_id) == "processed" for resume_id in ids)
+        self.stdout.write(self.style.SUCCESS(f"requeued {len(ids)} stale uploads: {done} processed, {len(ids) - done} failed"))
@@ -0,0 +1,343 @@
+import logging
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .dedup import later_copies
+from .models import Job, MatchReport, Resume, ResumeChunk
+from .search import LEXICAL_INDEX
+from .utils import INDEX_MANAGER, INDEX_REGISTRY, RESUME_INDEX_MANAGER, embed_queries, query_index, query_resume_index
+
+logger = logging.getLogger(__name__)
+
+
+def job_query_text(job):
+    return f"{job.title}. Requirements: {'; '.join(job.requirements or [])}. {job.description}"
+
+
+def index_stamp():
+    # changes whenever either index does; cached matches are only valid for
+    # the stamp they were computed at. Generations restart in every index
+    # version, so the version's build time goes in front
+    stamp = f"c{INDEX_MANAGER.get().generation}.r{RESUME_INDEX_MANAGER.get().generation}"
+    version = INDEX_REGISTRY.active()["version"]
+    return f"{version.rsplit('-', 1)[-1]}.{stamp}" if version else stamp
+
+
+def default_rescore():
+    return getattr(settings, "MATCH_RESCORE", False)
+
+
+def hit_evidence(hits):
+    # hits -> {resume_id: [evidence, ...]} in rank order, one chunk query
+    per_resume = getattr(settings, "MATCH_EVIDENCE_PER_RESUME", 3)
+    chunks = ResumeChunk.objects.in_bulk([h["chunk_id"] for h in hits if h.get("chunk_id")])
+    evidence = {}
+    for h in hits:
+        chunk = chunks.get(uuid.UUID(h["chunk_id"])) if h.get("chunk_id") else None
+        if chunk is None:
+            continue
+        rows = evidence.setdefault(str(chunk.resume_id), [])
+        if len(rows) < per_resume:
+            rows.append({"chunk_id": str(chunk.id), "text": chunk.chunk_text[:300], "score": h["score"]})
+    return evidence
+
+
+def drop_copies(ranked):
+    # re-uploads of one file score alike; keep the earliest upload in its place
+    first = {}
+    for r in ranked:
+        resume = r["resume"]
+        if resume.content_sha256:
+            best = first.get(resume.content_sha256)
+            if best is None or (resume.uploaded_at, str(resume.id)) < (best.uploaded_at, str(best.id)):
+                first[resume.content_sha256] = resume
+    return [r for r in ranked if not r["resume"].content_sha256 or first[r["resume"].content_sha256] is r["resume"]]
+
+
+def rank_resumes(job, top_n, resume_ids=None, rescore=None):
+    # shortlist whole resumes from the pooled resume index, then pull
+    # evidence (and, with rescore, the score) from their chunks only
+    rescore = default_rescore() if rescore is None else rescore
+    query_text = job_query_text(job)
+    shortlist = query_resume_index(query_text, k=top_n*getattr(settings, "MATCH_SHORTLIST_FACTOR", 3), resume_ids=resume_ids)
+    if not shortlist:
+        # resume index not built yet (see build_resume_index): chunk hits, best per resume
+        best = {}
+        for h in query_index(query_text, k=top_n*5, resume_ids=resume_ids):
+            best.setdefault(h["resume_id"], h["score"])
+        shortlist = [(rid, score) for rid, score in best.items() if rid]
+    per_resume = getattr(settings, "MATCH_EVIDENCE_PER_RESUME", 3)
+    hits = query_index(query_text, k=len(shortlist)*per_resume, resume_ids=[rid for rid, _ in shortlist]) if shortlist else []
+    evidence = hit_evidence(hits)
+    floor = min((h["score"] for h in hits), default=0.0)
+    resumes = Resume.objects.in_bulk([rid for rid, _ in shortlist])
+    ranked = []
+    for rid, pooled_score in shortlist:
+        resume = resumes.get(uuid.UUID(rid))
+        if resume is None:
+            continue
+        ev = evidence.get(rid, [])
+        score = pooled_score
+        if rescore:
+            # max-sim over the resume's chunks, so one strong section counts
+            # as much as many middling ones; a resume with no chunk in the
+            # hits can score at most the lowest hit
+            score = ev[0]["score"] if ev else floor
+        ranked.append({"resume": resume, "score": score, "evidence": ev})
+    # sort by score desc, tie-breaker: uploaded_at desc then id
+    ranked.sort(key=lambda x: (x["score"], x["resume"].uploaded_at, str(x["resume"].id)), reverse=True)
+    return drop_copies(ranked)[:top_n]
+
+
+def missing_requirements(job, resume_id, lexical):
+    # coverage is checked against the resume's full text via the lexical
+    # index, not just the retrieved evidence
+    return [req for req in job.requirements or [] if not lexical.covers(resume_id, req)]
+
+
+def match_payload(report):
+    return {
+        "resume_id": str(report.resume_id),
+        "score": float(report.score),
+        "evidence": report.evidence,
+        "missing_requirements": report.missing_requirements,
+    }
+
+
+def cached_reports(job, top_n):
+    return list(
+        MatchReport.objects.filter(job=job)
+        .order_by("-score", "-resume__uploaded_at", "-resume_id")[:top_n]
+    )
+
+
+def save_reports(job, reports, stamp, top_n):
+    # the job's report rows become exactly `reports`; one upsert, one delete
+    with transaction.atomic():
+        MatchReport.objects.bulk_create(
+            reports,
+            update_conflicts=True,
+            unique_fields=["job", "resume"],
+            update_fields=["score", "evidence", "missing_requirements"],
+        )
+        MatchReport.objects.filter(job=job).exclude(resume_id__in=[r.resume_id for r in reports]).delete()
+        Job.objects.filter(id=job.id).update(match_generation=stamp, match_top_n=top_n)
+
+
+def match_job(job, top_n, resume_ids=None, rescore=None):
+    # -> (matches, cached). Unfiltered matches in the default scoring mode are
+    # served from MatchReport while the index is unchanged; filtered or
+    # re-scored requests are computed fresh and not stored.
+    cacheable = resume_ids is None and rescore in (None, default_rescore())
+    stamp = index_stamp()
+    if cacheable and job.match_generation == stamp and job.match_top_n >= top_n:
+        return [match_payload(r) for r in cached_reports(job, top_n)], True
+    lexical = LEXICAL_INDEX.get()
+    reports = [
+        MatchReport(
+            job=job,
+            resume=r["resume"],
+            score=r["score"],
+            evidence=r["evidence"],
+            missing_requirements=missing_requirements(job, r["resume"].id, lexical),
+        )
+        for r in rank_resumes(job, top_n, resume_ids=resume_ids, rescore=rescore)
+    ]
+    if cacheable:
+        save_reports(job, reports, stamp, top_n)
+    return [match_payload(r) for r in reports], False
+
+
+def restricted_evidence(qvecs, wanted):
+    # wanted: per query vector, the resume ids it needs evidence for ->
+    # (per query {resume_id: [evidence, ...]} in rank order, per query lowest
+    # hit score). Each query searches its own resumes' chunks only, as deep
+    # as rank_resumes does, so batching jobs can't change any job's evidence;
+    # one chunk query hydrates them all
+    per_resume = getattr(settings, "MATCH_EVIDENCE_PER_RESUME", 3)
+    chunks = INDEX_MANAGER.get()
+    picked = [{} for _ in wanted]
+    floors = [0.0] * len(wanted)
+    for j, own in enumerate(wanted):
+        own = {str(rid) for rid in own if rid}
+        rows = chunks.rows_for_resumes(own) if own else []
+        if not len(rows):
+            continue
+        D, I = chunks.search(qvecs[j:j + 1], len(own) * per_resume, rows=rows)
+        scores = []
+        for score, row in zip(D[0].tolist(), I[0].tolist()):
+            rid = chunks.resumes.get(row) if row >= 0 else None
+            if rid not in own:
+                continue
+            scores.append(score)
+            picked[j].setdefault(rid, []).append((chunks.ids.get(row), score))
+        floors[j] = min(scores, default=0.0)
+    chunk_objs = ResumeChunk.objects.in_bulk([cid for hits in picked for rows in hits.values() for cid, _ in rows if cid])
+    results = [{} for _ in wanted]
+    for j, hits in enumerate(picked):
+        for rid, rows in hits.items():
+            ev = []
+            for cid, score in rows:
+                chunk = chunk_objs.get(uuid.UUID(cid)) if cid else None
+                if chunk is not None and len(ev) < per_resume:
+                    ev.append({"chunk_id": cid, "text": chunk.chunk_text[:300], "score": score})
+            results[j][rid] = ev
+    return results, floors
+
+
+def refresh_matches_for_resumes(resume_ids):
+    # Score just-indexed resumes against every job with cached matches and
+    # splice them into its top match_top_n, instead of dropping the cache.
+    # One multi-query search covers all jobs x new resumes; the evidence
+    # comes from each job's search of its new resumes' chunks.
+    resume_ids = [str(r) for r in resume_ids]
+    jobs = list(Job.objects.exclude(match_generation=""))
+    if not jobs or not resume_ids:
+        return 0
+    stamp = index_stamp()
+    # a re-upload ranks exactly like its earlier copy, which drop_copies
+    # keeps instead; the cached matches already account for it
+    copies = later_copies(resume_ids)
+    resume_ids = [rid for rid in resume_ids if rid not in copies]
+    if not resume_ids:
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(match_generation=stamp)
+        return 0
+    snapshot = RESUME_INDEX_MANAGER.get()
+    rows = snapshot.rows_for_resumes(resume_ids)
+    if len(rows) == 0:
+        return 0
+    qvecs = embed_queries([job_query_text(job) for job in jobs])
+    D, I = snapshot.search(qvecs, len(rows), rows=rows)
+    current = {}
+    for job_id, resume_id, score in MatchReport.objects.filter(job__in=jobs).values_list("job_id", "resume_id", "score"):
+        current.setdefault(job_id, {})[str(resume_id)] = score
+    rescore = default_rescore()
+    lexical = LEXICAL_INDEX.get()
+    # which new resumes can enter each job's top match_top_n and so need
+    # evidence (all of them when it decides the score)
+    job_hits, wanted = [], []
+    for job, scores, found in zip(jobs, D, I):
+        pool = dict(current.get(job.id, {}))
+        hits, need = [], set()
+        for score, row in zip(scores.tolist(), found.tolist()):
+            if row < 0:
+                continue
+            rid = snapshot.ids.get(row)
+            if rescore or len(pool) < job.match_top_n or (pool and score >= min(pool.values())):
+                need.add(rid)
+            pool[rid] = score
+            hits.append((rid, score))
+        job_hits.append(hits)
+        wanted.append(need)
+    evidence, _ = restricted_evidence(qvecs, wanted)
+    updated = 0
+    for job, hits, job_evidence in zip(jobs, job_hits, evidence):
+        pool = dict(current.get(job.id, {}))
+        fresh = {}
+        for rid, score in hits:
+            ev = job_evidence.get(rid, [])
+            if rescore:
+                score = ev[0]["score"] if ev else 0.0
+            pool[rid] = score
+            fresh[rid] = (score, ev)
+        # new uploads win ties, as in rank_resumes
+        keep = set(sorted(pool, key=lambda rid: (pool[rid], rid in fresh), reverse=True)[:job.match_top_n])
+        reports = [
+            MatchReport(job=job, resume_id=rid, score=score, evidence=ev, missing_requirements=missing_requirements(job, rid, lexical))
+            for rid, (score, ev) in fresh.items() if rid in keep
+        ]
+        with transaction.atomic():
+            if reports:
+                MatchReport.objects.bulk_create(
+                    reports,
+                    update_conflicts=True,
+                    unique_fields=["job", "resume"],
+                    update_fields=["score", "evidence", "missing_requirements"],
+                )
+            dropped = set(pool) - keep - set(fresh)
+            if dropped:
+                MatchReport.objects.filter(job=job, resume_id__in=dropped).delete()
+            Job.objects.filter(id=job.id).update(match_generation=stamp)
+        updated += len(reports)
+    return updated
+
+
+def first_per_group(keys):
+    # keys: (nq, k) group keys in rank order -> mask of each row's first hit per group
+    order = np.argsort(keys, axis=1, kind="stable")
+    ranked = np.take_along_axis(keys, order, axis=1)
+    first = np.ones_like(ranked, dtype=bool)
+    first[:, 1:] = ranked[:, 1:] != ranked[:, :-1]
+    mask = np.zeros_like(first)
+    np.put_along_axis(mask, order, first, axis=1)
+    return mask
+
+
+def match_jobs(jobs, top_n):
+    # Batch form of match_job for many jobs: one encode call, one
+    # multi-query search for the shortlists, an evidence search per job over
+    # its own shortlist (as in rank_resumes, so both give the same reports)
+    # and a single transaction of bulk writes. Results replace each job's cache.
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    stamp = index_stamp()
+    rescore = default_rescore()
+    qvecs = embed_queries([job_query_text(job) for job in jobs])
+    chunks = INDEX_MANAGER.get()
+    pooled_index = RESUME_INDEX_MANAGER.get()
+    if pooled_index.ntotal:
+        pooled, rows = pooled_index.search(qvecs, top_n * getattr(settings, "MATCH_SHORTLIST_FACTOR", 3))
+        owners = pooled_index
+    else:
+        # resume index not built yet: best chunk per resume from the chunk
+        # index, every resume in the top_n*5 hits shortlisted as in rank_resumes
+        D, I = chunks.search(qvecs, top_n * 5)
+        keys = np.where(I >= 0, chunks.resume_keys()[np.maximum(I, 0)], 0)
+        D = np.where(first_per_group(keys) & (keys != 0), D, -np.inf)
+        order = np.argsort(-D, axis=1, kind="stable")
+        pooled = np.take_along_axis(D, order, axis=1)
+        rows = np.where(np.isfinite(pooled), np.take_along_axis(I, order, axis=1), -1)
+        owners = chunks
+    short_ids = [[owners.resumes.get(row) for row in job_rows] for job_rows in rows.tolist()]
+
+    # evidence (and the rescore floor) per job, from its own shortlist
+    evidence, floors = restricted_evidence(qvecs, short_ids)
+    resume_objs = Resume.objects.in_bulk({rid for ids in short_ids for rid in ids if rid})
+    lexical = LEXICAL_INDEX.get()
+    reports, results = [], {}
+    for j, job in enumerate(jobs):
+        ranked = []
+        for rid, pooled_score in zip(short_ids[j], pooled[j].tolist()):
+            resume = resume_objs.get(uuid.UUID(rid)) if rid else None
+            if resume is None:
+                continue
+            ev = evidence[j].get(rid, [])
+            score = (ev[0]["score"] if ev else floors[j]) if rescore else pooled_score
+            ranked.append({"resume": resume, "score": score, "evidence": ev})
+        ranked.sort(key=lambda x: (x["score"], x["resume"].uploaded_at, str(x["resume"].id)), reverse=True)
+        job_reports = [
+            MatchReport(job=job, resume=r["resume"], score=r["score"], evidence=r["evidence"],
+                        missing_requirements=missing_requirements(job, r["resume"].id, lexical))
+            for r in drop_copies(ranked)[:top_n]
+        ]
+        reports.extend(job_reports)
+        results[str(job.id)] = [match_payload(r) for r in job_reports]
+    with transaction.atomic():
+        MatchReport.objects.filter(job__in=jobs).delete()
+        MatchReport.objects.bulk_create(reports, batch_size=1000)
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(match_generation=stamp, match_top_n=top_n)
+    return results
+
+
+def refresh_matches_safely(resume_ids):
+    # runs after ingest; a failure only costs a full recompute on next POST
+    try:
+        return refresh_matches_for_resumes(resume_ids)
+    except Exception:
+        logger.exception("incremental match refresh failed for %s", resume_ids)
+        Job.objects.exclude(match_generation="").update(match_generation="")
+        return 0
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def dedupe_match_reports(apps, schema_editor):
+    # every match POST used to insert fresh rows; keep the newest per pair
+    MatchReport = apps.get_model("resumes", "MatchReport")
+    seen = set()
+    stale = []
+    for pk, job_id, resume_id in MatchReport.objects.order_by("-created_at").values_list("id", "job_id", "resume_id").iterator():
+        if (job_id, resume_id) in seen:
+            stale.append(pk)
+        else:
+            seen.add((job_id, resume_id))
+    for start in range(0, len(stale), 1000):
+        MatchReport.objects.filter(id__in=stale[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resumes', '0003_remove_job_resumes_job_embeddi_c9f71b_gin_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='match_generation',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='match_top_n',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(dedupe_match_reports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='matchreport',
+            constraint=models.UniqueConstraint(fields=('job', 'resume'), name='matchreport_job_resume_unique'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:19
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resumes', '0004_job_match_cache_matchreport_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='content_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='resumechunk',
+            name='text_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text_sha256', models.CharField(max_length=64)),
+                ('model', models.CharField(max_length=255)),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('text_sha256', 'model'), name='chunkembedding_text_model_unique')],
+            },
+        ),
+    ]
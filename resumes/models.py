@@ -47,6 +47,8 @@ class Resume(models.Model):
     )
     redacted = models.BooleanField(default=True)
     summary = models.TextField(blank=True, null=True)
+    # SHA-256 of the uploaded file; re-uploads reuse the first copy's chunks
+    content_sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
 
     def __str__(self):
         return f"{self.filename} ({self.id})"
@@ -60,9 +62,25 @@ class ResumeChunk(models.Model):
     page_number = models.IntegerField(null=True, blank=True)
     char_start = models.IntegerField(null=True, blank=True)
     char_end = models.IntegerField(null=True, blank=True)
+    # SHA-256 of chunk_text; keys the stored vector in ChunkEmbedding
+    text_sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class ChunkEmbedding(models.Model):
+    # content-addressed vector store: one row per distinct chunk text and model
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    text_sha256 = models.CharField(max_length=64)
+    model = models.CharField(max_length=255)
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["text_sha256", "model"], name="chunkembedding_text_model_unique"),
+        ]
+
+
 # ----------------------------
 # Job & Match Models
 # ----------------------------
@@ -73,6 +91,10 @@ class Job(models.Model):
     description = models.TextField()
     requirements = models.JSONField(default=list)
     created_at = models.DateTimeField(auto_now_add=True)
+    # the MatchReport rows of this job are the top match_top_n as of this
+    # index generation; empty means nothing is cached
+    match_generation = models.CharField(max_length=64, blank=True, default="")
+    match_top_n = models.IntegerField(default=0)
 
 
 class MatchReport(models.Model):
@@ -84,6 +106,11 @@ class MatchReport(models.Model):
     missing_requirements = models.JSONField(default=list)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "resume"], name="matchreport_job_resume_unique"),
+        ]
+
 
 # ----------------------------
 # Idempotency Key Model
@@ -0,0 +1,146 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from sentence_transformers import CrossEncoder
+
+from .utils import configure_torch_threads
+
+# Second retrieval stage for /ask/: a cross-encoder reads each (query, chunk)
+# pair together and scores it, which orders recruiter questions far better
+# than the bi-encoder's inner product but costs a forward pass per pair. The
+# first stage retrieves top-M cheaply and the shortlist is scored in one
+# batched pass, with M capped so the pass fits a per-request latency budget.
+
+RE_TOKEN = re.compile(r"\w+")
+
+class StubCrossEncoder:
+    # RERANK_MODEL=stub: query-term overlap, for tests and benchmarks
+    # without a model download
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        scores = []
+        for query, text in pairs:
+            terms = set(RE_TOKEN.findall(query.lower()))
+            words = RE_TOKEN.findall(text.lower())
+            scores.append(sum(w in terms for w in words) / (1 + len(words)) + len(terms & set(words)))
+        return np.array(scores, dtype="float32")
+
+CROSS_ENCODERS = {}
+
+def load_cross_encoder(name):
+    if name not in CROSS_ENCODERS:
+        if name == "stub":
+            CROSS_ENCODERS[name] = StubCrossEncoder()
+        else:
+            configure_torch_threads()
+            CROSS_ENCODERS[name] = CrossEncoder(name)
+    return CROSS_ENCODERS[name]
+
+class Reranker:
+    # The budget is turned into M with a cost model fitted on this host: a
+    # pass over n pairs takes fixed + per_pair * n seconds, by least squares
+    # over recent passes weighted by alpha, so a run of small batches isn't
+    # read as an expensive per-pair cost. The first pass warms the model up
+    # and isn't counted.
+    def __init__(self, model_name, max_depth=50, budget_ms=150.0, alpha=0.1):
+        self.model_name = model_name
+        self.max_depth = max_depth
+        self.budget = budget_ms / 1000.0
+        self.alpha = alpha
+        # weighted means of n, t, n*n and n*t over measured passes
+        self.moments = None
+        self.calls = 0
+        self.pairs = 0
+        self._lock = threading.Lock()
+
+    def cost(self):
+        # -> (fixed, per_pair) seconds, None until a pass is measured
+        if self.moments is None:
+            return None
+        n, t, nn, nt = self.moments
+        var = nn - n * n
+        if var > 1e-6 * nn:
+            per_pair = (nt - n * t) / var
+            if per_pair > 0:
+                return max(t - per_pair * n, 0.0), per_pair
+        # every pass the same size (or noise): no way to split the cost
+        return 0.0, t / n
+
+    def depth(self, k=0):
+        # candidates one pass can score within the budget, up to max_depth;
+        # never fewer than the k answers (or max_depth), so a request that
+        # asked for re-ranking gets it and every request keeps measuring
+        cost = self.cost()
+        if cost is None:
+            return self.max_depth
+        fixed, per_pair = cost
+        fits = int(max(self.budget - fixed, 0.0) / per_pair)
+        return max(min(k, self.max_depth), min(self.max_depth, fits))
+
+    def score(self, query, texts):
+        if not texts:
+            return np.zeros(0, dtype="float32")
+        model = load_cross_encoder(self.model_name)
+        t0 = time.perf_counter()
+        scores = model.predict([(query, t) for t in texts], batch_size=len(texts), show_progress_bar=False)
+        self._observe(time.perf_counter() - t0, len(texts))
+        return np.asarray(scores, dtype="float32").ravel()
+
+    def _observe(self, elapsed, n):
+        with self._lock:
+            self.calls += 1
+            self.pairs += n
+            if self.calls == 1:
+                return
+            point = (n, elapsed, n * n, n * elapsed)
+            if self.moments is None:
+                self.moments = point
+            else:
+                self.moments = tuple((1 - self.alpha) * m + self.alpha * x for m, x in zip(self.moments, point))
+
+    def rerank(self, query, hydrated, depth):
+        # hydrated: [(hit, chunk)] in first-stage order. The first depth are
+        # re-ordered by cross-encoder score, the rest keep their place after
+        # them. Copies of one chunk text are scored once.
+        head, tail = hydrated[:depth], hydrated[depth:]
+        texts = {}
+        for _, chunk in head:
+            texts.setdefault(chunk.text_sha256 or chunk.id, chunk.chunk_text)
+        scores = dict(zip(texts, self.score(query, list(texts.values())).tolist()))
+        scored = [({**hit, "rerank_score": scores[chunk.text_sha256 or chunk.id]}, chunk) for hit, chunk in head]
+        scored.sort(key=lambda pair: -pair[0]["rerank_score"])
+        return scored + tail
+
+    def stats(self):
+        with self._lock:
+            cost = self.cost()
+            return {
+                "model": self.model_name,
+                "fixed_ms": cost[0] * 1000.0 if cost else None,
+                "pair_cost_ms": cost[1] * 1000.0 if cost else None,
+                "depth": self.depth(),
+                "max_depth": self.max_depth,
+                "budget_ms": self.budget * 1000.0,
+                "calls": self.calls,
+                "pairs": self.pairs,
+            }
+
+_RERANKER = {}
+
+def get_reranker():
+    # one per process, None when RERANK_MODEL is empty
+    model_name = getattr(settings, "RERANK_MODEL", "")
+    if not model_name:
+        return None
+    pid = os.getpid()
+    if pid not in _RERANKER:
+        _RERANKER.clear()
+        _RERANKER[pid] = Reranker(
+            model_name,
+            max_depth=getattr(settings, "RERANK_MAX_DEPTH", 50),
+            budget_ms=getattr(settings, "RERANK_BUDGET_MS", 150.0),
+        )
+    return _RERANKER[pid]
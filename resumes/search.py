@@ -0,0 +1,281 @@
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import ResumeChunk
+from .utils import INDEX_MANAGER, query_index
+
+logger = logging.getLogger(__name__)
+
+RE_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the to was were will with "
+    "we you your our i my me".split()
+)
+
+def tokenize(text):
+    return [t for t in RE_TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    # In-process inverted index over ResumeChunk.chunk_text. Postings map a
+    # term to {chunk_id: term frequency}; resume -> chunks is kept as well so
+    # requirement coverage can look at a resume's full text.
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_len = {}
+        self.chunk_terms = {}
+        self.chunk_resume = {}
+        self.resume_chunks = defaultdict(set)
+        self.total_len = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, chunk_id, resume_id, text):
+        chunk_id, resume_id = str(chunk_id), str(resume_id)
+        tokens = tokenize(text)
+        with self.lock:
+            if chunk_id in self.doc_len:
+                return
+            counts = defaultdict(int)
+            for t in tokens:
+                counts[t] += 1
+            for t, tf in counts.items():
+                self.postings[t][chunk_id] = tf
+            self.doc_len[chunk_id] = len(tokens)
+            self.chunk_terms[chunk_id] = tuple(counts)
+            self.total_len += len(tokens)
+            self.chunk_resume[chunk_id] = resume_id
+            self.resume_chunks[resume_id].add(chunk_id)
+
+    def remove(self, chunk_id):
+        chunk_id = str(chunk_id)
+        with self.lock:
+            if chunk_id not in self.doc_len:
+                return
+            for t in self.chunk_terms.pop(chunk_id):
+                posting = self.postings[t]
+                del posting[chunk_id]
+                if not posting:
+                    del self.postings[t]
+            self.total_len -= self.doc_len.pop(chunk_id)
+            resume_id = self.chunk_resume.pop(chunk_id)
+            self.resume_chunks[resume_id].discard(chunk_id)
+            if not self.resume_chunks[resume_id]:
+                del self.resume_chunks[resume_id]
+
+    def search(self, query, k=10, resume_ids=None):
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.doc_len)
+            if not n or not terms:
+                return []
+            avgdl = self.total_len / n
+            allowed = None
+            if resume_ids is not None:
+                allowed = set()
+                for rid in resume_ids:
+                    allowed |= self.resume_chunks.get(str(rid), set())
+            k1, doc_len = self.k1, self.doc_len
+            base, per_len = k1 * (1 - self.b), k1 * self.b / avgdl
+            scores = defaultdict(float)
+            for t in terms:
+                posting = self.postings.get(t)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5)) * (k1 + 1)
+                if allowed is not None:
+                    posting = {c: tf for c, tf in posting.items() if c in allowed}
+                for chunk_id, tf in posting.items():
+                    scores[chunk_id] += idf * tf / (tf + base + per_len * doc_len[chunk_id])
+        ranked = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [{"chunk_id": cid, "score": score} for cid, score in ranked]
+
+    def search_resumes(self, query, k=100):
+        # best chunk score per resume
+        best = {}
+        for hit in self.search(query, k=k * 5):
+            rid = self.chunk_resume.get(hit["chunk_id"])
+            if rid is not None and rid not in best:
+                best[rid] = hit["score"]
+        return sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+    def covers(self, resume_id, phrase):
+        # every term of the phrase appears somewhere in the resume's chunks
+        terms = tokenize(phrase)
+        with self.lock:
+            chunks = self.resume_chunks.get(str(resume_id), set())
+            if not terms or not chunks:
+                return False
+            return all(not chunks.isdisjoint(self.postings.get(t, ())) for t in terms)
+
+
+class LexicalIndexManager:
+    # Holds the chunks the FAISS index serves. Built from the DB (chunks of
+    # processed resumes, as rebuild_index indexes them), then kept in step
+    # with FAISS rows: when the generation moves, the chunk ids of rows added
+    # since are loaded, and tombstoned rows removed. Rows whose chunk hasn't
+    # committed yet (an upload's transaction is still open) are retried on the
+    # next move. Chunks ingested by this process are added directly at commit
+    # time; a rebuilt index (new chunk-id file) means a fresh build.
+    # warm_in_background() builds at worker start instead of on the first
+    # request that needs it.
+    LOAD_BATCH = 2000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._warm = False
+        self._reset()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self.index = None
+        self.generation = None
+        self.ids_ino = None
+        self.rows_seen = 0
+        self.tombstones_seen = 0
+        self.waiting = set()
+
+    def _after_fork(self):
+        # a build running in the parent (gunicorn --preload) doesn't exist
+        # here, and its lock may have been held mid-build
+        self.lock = threading.Lock()
+        self._reset()
+        if self._warm:
+            self.warm_in_background()
+
+    def warm_in_background(self):
+        self._warm = True
+        thread = threading.Thread(target=self._warm_up, name="lexical-index-build", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception:
+            # the first request builds it instead
+            logger.exception("lexical index build failed")
+        finally:
+            close_old_connections()
+
+    def get(self):
+        snapshot = INDEX_MANAGER.get()
+        generation = snapshot.generation
+        if self.index is not None and generation == self.generation:
+            return self.index
+        with self.lock:
+            if self.index is not None and snapshot.ids.ino != self.ids_ino:
+                self.index = None
+            if self.index is None:
+                self._build(snapshot)
+            elif generation != self.generation:
+                self._catch_up(snapshot)
+            self.generation = generation
+            self.ids_ino = snapshot.ids.ino
+        return self.index
+
+    def _build(self, snapshot):
+        index = BM25Index()
+        loaded = _load(index, ResumeChunk.objects.filter(resume__status="processed"))
+        self._reset()
+        self.index = index
+        # indexed rows the scan didn't cover (an import between its index
+        # write and status update, an upload not yet committed) go by id;
+        # found with a vectorised key test, not a lookup per row
+        keys = np.frombuffer(b"".join(chunk_id.bytes[:8] for chunk_id in loaded), dtype="<i8")
+        covered = np.isin(snapshot.ids.keys(), keys)
+        rows = np.setdiff1d(np.flatnonzero(~covered), snapshot.dead)
+        self.waiting = {snapshot.ids.get(row) for row in rows.tolist()}
+        self.rows_seen = len(snapshot.ids)
+        self._catch_up(snapshot)
+
+    def _catch_up(self, snapshot):
+        dead = set(snapshot.dead.tolist())
+        for row in range(self.rows_seen, len(snapshot.ids)):
+            chunk_id = snapshot.ids.get(row)
+            if row not in dead and chunk_id not in self.index.doc_len:
+                self.waiting.add(chunk_id)
+        self.rows_seen = len(snapshot.ids)
+        waiting = list(self.waiting)
+        for start in range(0, len(waiting), self.LOAD_BATCH):
+            for chunk_id in _load(self.index, ResumeChunk.objects.filter(id__in=waiting[start:start + self.LOAD_BATCH])):
+                self.waiting.discard(str(chunk_id))
+        for row in snapshot.tombstones[self.tombstones_seen:].tolist():
+            chunk_id = snapshot.ids.get(row)
+            self.index.remove(chunk_id)
+            self.waiting.discard(chunk_id)
+        self.tombstones_seen = len(snapshot.tombstones)
+
+    def add_chunks(self, chunk_objs):
+        if self.index is None:
+            return
+        with self.lock:
+            for c in chunk_objs:
+                self.index.add(c.id, c.resume_id, c.chunk_text)
+                self.waiting.discard(str(c.id))
+
+
+def _load(index, qs):
+    # -> ids (UUID) of the chunks read
+    rows = qs.order_by().values_list("id", "resume_id", "chunk_text")
+    loaded = []
+    for chunk_id, resume_id, text in rows.iterator(chunk_size=2000):
+        index.add(chunk_id, resume_id, text)
+        loaded.append(chunk_id)
+    return loaded
+
+LEXICAL_INDEX = LexicalIndexManager()
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # rankings: lists of chunk ids, best first
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            fused[chunk_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def hybrid_depth(k):
+    return max(k * getattr(settings, "HYBRID_CANDIDATE_FACTOR", 4), k)
+
+
+def fuse_hits(query_text, vector_hits, k=5, resume_ids=None):
+    # vector hits (already retrieved at hybrid_depth(k)) merged with BM25 by
+    # reciprocal rank fusion; the per-retriever scores ride along for
+    # clients that want them
+    vector_hits = [h for h in vector_hits if h.get("chunk_id")]
+    lexical_hits = LEXICAL_INDEX.get().search(query_text, k=hybrid_depth(k), resume_ids=resume_ids)
+    vector_scores = {h["chunk_id"]: h["score"] for h in vector_hits}
+    lexical_scores = {h["chunk_id"]: h["score"] for h in lexical_hits}
+    fused = reciprocal_rank_fusion([
+        [h["chunk_id"] for h in vector_hits],
+        [h["chunk_id"] for h in lexical_hits],
+    ], k=getattr(settings, "HYBRID_RRF_K", 60))
+    return [
+        {
+            "chunk_id": chunk_id,
+            "score": score,
+            "vector_score": vector_scores.get(chunk_id),
+            "lexical_score": lexical_scores.get(chunk_id),
+        }
+        for chunk_id, score in fused[:k]
+    ]
+
+
+def hybrid_search(query_text, k=5, resume_ids=None):
+    vector_hits = query_index(query_text, k=hybrid_depth(k), resume_ids=resume_ids)
+    return fuse_hits(query_text, vector_hits, k=k, resume_ids=resume_ids)
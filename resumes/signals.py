@@ -0,0 +1,25 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Resume
+from .utils import remove_from_index
+
+logger = logging.getLogger(__name__)
+
+
+def remove_safely(resume_id):
+    # the delete has committed; if tombstoning fails the rows stay until
+    # rebuild_index, and hydration drops their hits meanwhile
+    try:
+        remove_from_index([resume_id])
+    except Exception:
+        logger.exception("removing resume %s from the index failed", resume_id)
+
+
+@receiver(post_delete, sender=Resume)
+def tombstone_deleted_resume(sender, instance, **kwargs):
+    resume_id = instance.id
+    transaction.on_commit(lambda: remove_safely(resume_id))
@@ -1,34 +1,158 @@
-from .models import Resume, ResumeChunk
-from .utils import extract_text_from_pdf, chunk_text, add_chunks_to_index, redact_pii
-from django.conf import settings
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-def process_resume_sync(resume_id):
-    resume = Resume.objects.get(id=resume_id)
-    path = resume.original_file.path
-    text = extract_text_from_pdf(path)
-    # detect and redact PII stored separately
-    redacted_text = redact_pii(text)
-    # chunk the redacted text for retrieval
-    chunks = chunk_text(redacted_text, chunk_size=250, overlap=50)
-    chunk_objs = []
-    for c in chunks:
-        rc = ResumeChunk.objects.create(
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Resume, ResumeChunk
+from .utils import active_model_name, stream_pdf_chunks, add_vectors_to_index
+from .dedup import embed_chunks, file_sha256, find_sources, source_chunks, text_sha256
+from .search import LEXICAL_INDEX
+from .matching import refresh_matches_safely
+
+try:
+    from celery import shared_task
+except ImportError:
+    shared_task = None
+
+logger = logging.getLogger(__name__)
+
+# words per chunk / words shared between neighbouring chunks
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 50
+
+def chunk_rows(resume, chunks):
+    return [
+        ResumeChunk(
             resume=resume,
             chunk_text=c["text"],
             chunk_order=c["order"],
-            page_number=None
+            page_number=c["page"],
+            char_start=c["start"],
+            char_end=c["end"],
+            text_sha256=c.get("sha") or text_sha256(c["text"]),
         )
-        chunk_objs.append(rc)
-    # add to faiss
-    add_chunks_to_index(chunk_objs)
+        for c in chunks
+    ]
+
+def already_processed(resume_id):
+    # a redelivered task (acks_late after a worker died past the commit) or a
+    # second dispatch must not insert and index the chunks again
+    return Resume.objects.filter(id=resume_id).filter(Q(status="processed") | Q(chunks__isnull=False)).exists()
+
+def process_resume_sync(resume_id):
+    if already_processed(resume_id):
+        return True
+    resume = Resume.objects.get(id=resume_id)
+    path = resume.original_file.path
+    if not resume.content_sha256:
+        resume.content_sha256 = file_sha256(path)
+    source = find_sources([resume.content_sha256], exclude=resume.id).get(resume.content_sha256)
+    if source is not None:
+        # same file uploaded before: its parsed chunks (and, by text hash,
+        # their vectors) are reused instead of parsing again
+        resume.summary, chunks = source_chunks([source])[source]
+        chunk_objs = chunk_rows(resume, chunks)
+    else:
+        # pages are read, redacted and chunked as a stream, with page/offset spans
+        chunks, summary = stream_pdf_chunks(path, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        chunk_objs = chunk_rows(resume, chunks)
+        resume.summary = "".join(summary)
+    # encode before opening the transaction; it's the slow part
+    model_name = active_model_name()
+    vecs = embed_chunks(chunk_objs, model_name)
     resume.status = "processed"
-    resume.summary = (redacted_text[:800])
-    resume.save()
+    with transaction.atomic():
+        # re-checked under the row lock: a concurrent delivery may have
+        # committed while this one parsed and encoded
+        Resume.objects.select_for_update().only("id").get(id=resume.id)
+        if already_processed(resume.id):
+            return True
+        ResumeChunk.objects.bulk_create(chunk_objs)
+        resume.save(update_fields=["status", "summary", "content_sha256"])
+        # index last: if it fails the chunks and status roll back with it
+        add_vectors_to_index(vecs, chunk_objs, model_name)
+        transaction.on_commit(lambda: LEXICAL_INDEX.add_chunks(chunk_objs))
+        # after the lexical add, so requirement coverage sees the new chunks
+        transaction.on_commit(lambda: refresh_matches_safely([resume.id]))
     return True
 
-# If using Celery, you can define a Celery task:
-# from celery import shared_task
-# @shared_task
-# def process_resume_task(resume_id):
-#     return process_resume_sync(resume_id)
+def run_resume_processing(resume_id):
+    try:
+        return process_resume_sync(resume_id)
+    except Exception:
+        logger.exception("processing resume %s failed", resume_id)
+        Resume.objects.filter(id=resume_id).update(status="failed")
+        return False
+
+if shared_task is not None:
+    @shared_task(ignore_result=True)
+    def process_resume_task(resume_id):
+        return run_resume_processing(resume_id)
+else:
+    process_resume_task = None
+
+_EXECUTORS = {}
+
+def get_executor():
+    # one pool per process; gunicorn forks workers after import
+    pid = os.getpid()
+    if pid not in _EXECUTORS:
+        _EXECUTORS.clear()
+        _EXECUTORS[pid] = ThreadPoolExecutor(
+            max_workers=getattr(settings, "RESUME_TASK_WORKERS", 2),
+            thread_name_prefix="resume-task",
+        )
+    return _EXECUTORS[pid]
+
+def run_in_thread(resume_id):
+    # worker threads get their own DB connections; don't leak them
+    close_old_connections()
+    try:
+        return run_resume_processing(resume_id)
+    finally:
+        close_old_connections()
+
+TASK_BACKENDS = ("celery", "thread", "sync")
+
+def task_backend():
+    # a backend that can't run here is a configuration error at startup
+    # (ResumesConfig.ready), not a quiet switch to the in-process pool
+    backend = getattr(settings, "RESUME_TASK_BACKEND", "thread")
+    if backend not in TASK_BACKENDS:
+        raise ImproperlyConfigured(f"RESUME_TASK_BACKEND must be one of {', '.join(TASK_BACKENDS)}, not {backend!r}")
+    if backend == "celery" and process_resume_task is None:
+        raise ImproperlyConfigured("RESUME_TASK_BACKEND=celery but celery is not installed")
+    return backend
+
+def dispatch_resume_processing(resume_id):
+    backend = task_backend()
+    if backend == "sync":
+        return run_resume_processing(resume_id)
+    if backend == "celery":
+        try:
+            process_resume_task.delay(resume_id)
+            return None
+        except Exception:
+            # broker unreachable: keep serving uploads in-process
+            logger.exception("celery enqueue failed for resume %s, using thread pool", resume_id)
+    return get_executor().submit(run_in_thread, resume_id)
+
+def enqueue_resume_processing(resume_id):
+    # wait for the Resume row to be committed before a worker looks for it
+    transaction.on_commit(lambda: dispatch_resume_processing(str(resume_id)))
+
+def stale_resumes(older_than):
+    # uploads still "processing" long after they came in: the thread backend
+    # lost them with a restarted worker (or a broker lost the message)
+    cutoff = timezone.now() - older_than
+    return list(Resume.objects.filter(status="processing", uploaded_at__lt=cutoff).order_by("uploaded_at").values_list("id", flat=True))
+
+def requeue_stale_resumes(older_than):
+    # -> [(resume_id, dispatch result)]. Safe against one that is only slow:
+    # processing is idempotent, and whichever run commits second does nothing
+    return [(resume_id, dispatch_resume_processing(str(resume_id))) for resume_id in stale_resumes(older_than)]
@@ -1,3 +1,964 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import faiss
+import numpy as np
+from filelock import Timeout
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .matching import index_stamp, match_job, match_jobs, refresh_matches_for_resumes
+from .models import ChunkEmbedding, Job, MatchReport, Resume, ResumeChunk, User
+from .search import BM25Index, LexicalIndexManager, hybrid_search
+from .utils import (
+    INDEX_MANAGER, INDEX_REGISTRY, PAGE_MARKER, ChunkIdStore, FaissIndexManager, QueryEmbeddingCache, active_model_name,
+    add_vectors_to_index, build_index, index_vectors, iter_chunks, iter_document_pages, migrate_id_map, query_index,
+    redact_pii, stream_pdf_chunks,
+)
+from . import async_views, rerank, tasks, utils
+from .management.commands import import_resumes, rebuild_index
+from .views import AskView, JobMatchView, hydrate_hits
+
+
+def unit_vectors(n, d, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+def bag_of_words(texts, batch_size=None, model_name=None, d=64):
+    # stands in for the embedding model: hashed word counts, L2-normalised
+    vecs = np.zeros((len(texts), d), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vecs[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % d] += 1.0
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+def resumes_with_chunks(texts, status="processed"):
+    # one resume per list of chunk texts
+    resumes = Resume.objects.bulk_create([Resume(filename=f"r{i}.pdf", status=status) for i in range(len(texts))])
+    chunks = ResumeChunk.objects.bulk_create([
+        ResumeChunk(resume=resume, chunk_text=text, chunk_order=order, text_sha256=hashlib.sha256(text.encode()).hexdigest())
+        for resume, chunk_texts in zip(resumes, texts) for order, text in enumerate(chunk_texts)
+    ])
+    return resumes, chunks
+
+
+class TemporaryIndexMixin:
+    # Points the registry (and so both index managers, which follow it) at an
+    # empty directory, and embeds with bag_of_words, for tests that go
+    # through the real retrieval path.
+    def use_temporary_index(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        lexical = LexicalIndexManager()
+        patches = [
+            mock.patch.object(INDEX_REGISTRY, "root", root),
+            mock.patch.object(INDEX_REGISTRY, "pointer_path", root / "ACTIVE.json"),
+            mock.patch.object(INDEX_REGISTRY, "_active", None),
+            mock.patch.object(INDEX_REGISTRY, "_stamp", None),
+            mock.patch("resumes.utils.encode_texts", bag_of_words),
+            mock.patch("resumes.utils.QUERY_CACHE", QueryEmbeddingCache()),
+            mock.patch("resumes.search.LEXICAL_INDEX", lexical),
+            mock.patch("resumes.matching.LEXICAL_INDEX", lexical),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return root
+
+    def rebuild(self, **opts):
+        out = io.StringIO()
+        with mock.patch.object(rebuild_index, "encode_texts", bag_of_words), \
+                mock.patch.object(rebuild_index, "embedding_dimension", return_value=64):
+            call_command("rebuild_index", grace=0, stdout=out, **opts)
+        return out.getvalue()
+
+    def index_chunks(self, chunks):
+        index_vectors(bag_of_words([c.chunk_text for c in chunks]), [c.id for c in chunks], [c.resume_id for c in chunks])
+
+
+class ConcurrentUploadTests(TransactionTestCase):
+    # Parallel uploads against one index directory, each through its own
+    # FaissIndexManager as separate gunicorn workers would be, so writes are
+    # ordered by the file lock and not just the in-process one.
+    UPLOADS = 50
+    CHUNKS_PER_UPLOAD = 4
+    D = 32
+
+    def setUp(self):
+        self.index_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+
+    def test_parallel_uploads_keep_every_chunk(self):
+        resumes = Resume.objects.bulk_create([Resume(filename=f"r{i}.pdf", status="processed") for i in range(self.UPLOADS)])
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=f"chunk {order} of {resume.filename}", chunk_order=order)
+            for resume in resumes for order in range(self.CHUNKS_PER_UPLOAD)
+        ])
+        vecs = unit_vectors(len(chunks), self.D)
+
+        def upload(i):
+            rows = slice(i * self.CHUNKS_PER_UPLOAD, (i + 1) * self.CHUNKS_PER_UPLOAD)
+            # a low delta limit so compactions run alongside the writes
+            manager = FaissIndexManager(self.index_dir, max_delta_segments=8)
+            manager.add(vecs[rows], [c.id for c in chunks[rows]], d=self.D, resume_ids=[c.resume_id for c in chunks[rows]])
+
+        with ThreadPoolExecutor(self.UPLOADS) as pool:
+            list(pool.map(upload, range(self.UPLOADS)))
+
+        snapshot = FaissIndexManager(self.index_dir).get(self.D)
+        self.assertEqual(snapshot.ntotal, ResumeChunk.objects.count())
+        # each chunk's own vector finds it
+        _, I = snapshot.search(vecs, 1)
+        self.assertEqual([snapshot.ids.get(int(row)) for row in I[:, 0]], [str(c.id) for c in chunks])
+
+
+class HydrationQueryCountTests(TestCase):
+    # Retrieval is replaced by canned hits over the test chunks, so only the
+    # ORM work of turning hits into answers is counted; it must not grow with k.
+    RESUMES = 20
+    CHUNKS_PER_RESUME = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="recruiter", role="recruiter")
+        resumes = Resume.objects.bulk_create([Resume(filename=f"r{i}.pdf", status="processed") for i in range(cls.RESUMES)])
+        cls.chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=f"python django {resume.filename} part {order}", chunk_order=order, text_sha256=f"{resume.filename}{order}")
+            for order in range(cls.CHUNKS_PER_RESUME) for resume in resumes
+        ])
+        cls.job = Job.objects.create(owner=cls.user, title="Backend engineer", description="python django", requirements=["python", "go"])
+
+    def hits(self, k):
+        return [{"chunk_id": str(c.id), "resume_id": str(c.resume_id), "score": 1.0 - i / 100} for i, c in enumerate(self.chunks[:k])]
+
+    def post(self, view, path, body, **kwargs):
+        request = APIRequestFactory().post(path, body, format="json")
+        force_authenticate(request, user=self.user)
+        return view.as_view()(request, **kwargs)
+
+    def test_hydrate_hits_is_one_query(self):
+        for k in (1, 10, 50):
+            with self.assertNumQueries(1):
+                hydrated = hydrate_hits(self.hits(k))
+            self.assertEqual([str(chunk.id) for _, chunk in hydrated], [h["chunk_id"] for h in self.hits(k)])
+            # select_related: reading the resume costs nothing more
+            with self.assertNumQueries(0):
+                [chunk.resume.filename for _, chunk in hydrated]
+
+    def test_ask_query_count_is_constant_in_k(self):
+        for k in (1, 5, 20):
+            with mock.patch("resumes.views.query_index", side_effect=lambda q, k, resume_ids: self.hits(k)):
+                with self.assertNumQueries(1):
+                    response = self.post(AskView, "/ask/", {"query": "python", "k": k, "hybrid": False, "rerank": False})
+            self.assertEqual(len(response.data["answers"]), k)
+
+    def test_job_match_query_count_is_constant_in_top_n(self):
+        lexical = BM25Index()
+        for c in self.chunks:
+            lexical.add(c.id, c.resume_id, c.chunk_text)
+        resume_hits = lambda q, k, resume_ids: [(h["resume_id"], h["score"]) for h in self.hits(k) if h["resume_id"]]
+        chunk_hits = lambda q, k, resume_ids: [h for h in self.hits(len(self.chunks)) if h["resume_id"] in set(resume_ids)][:k]
+        for top_n in (1, 5, 15):
+            # a fresh computation each time: job lookup, chunks, resumes, and
+            # the report upsert, delete and job update inside a savepoint
+            Job.objects.filter(id=self.job.id).update(match_generation="")
+            with mock.patch.multiple(
+                "resumes.matching",
+                query_resume_index=resume_hits,
+                query_index=chunk_hits,
+                index_stamp=lambda: "test",
+                LEXICAL_INDEX=mock.Mock(get=lambda: lexical),
+            ):
+                with self.assertNumQueries(8):
+                    response = self.post(JobMatchView, f"/jobs/{self.job.id}/match/", {"top_n": top_n}, id=self.job.id)
+            self.assertEqual(len(response.data["matches"]), top_n)
+            self.assertTrue(all(m["missing_requirements"] == ["go"] for m in response.data["matches"]))
+
+
+class LexicalIndexRefreshTests(TemporaryIndexMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_index()
+        self.manager = LexicalIndexManager()
+
+    def chunk(self, text, status="processed"):
+        resume = Resume.objects.create(filename="r.pdf", status=status)
+        return ResumeChunk.objects.create(resume=resume, chunk_text=text, chunk_order=0)
+
+    def found(self, query):
+        return [h["chunk_id"] for h in self.manager.get().search(query)]
+
+    def test_catches_up_after_building_from_an_empty_table(self):
+        # a fresh deployment: the first build finds no chunks
+        self.assertEqual(self.found("python"), [])
+        # another worker ingests a resume and moves the FAISS generation
+        chunk = self.chunk("python developer")
+        self.index_chunks([chunk])
+        self.assertEqual(self.found("python"), [str(chunk.id)])
+
+    def test_holds_only_what_the_dense_index_serves(self):
+        served = self.chunk("python developer")
+        self.index_chunks([served])
+        self.chunk("python processing", status="processing")
+        self.chunk("python failed", status="failed")
+        self.assertEqual(self.found("python"), [str(served.id)])
+
+    def test_rows_indexed_before_their_chunks_commit_are_retried(self):
+        resume = Resume.objects.create(filename="r.pdf", status="processed")
+        pending = ResumeChunk(resume=resume, chunk_text="golang developer", chunk_order=0)
+        # the uploading worker wrote the index inside its still-open transaction
+        self.index_chunks([pending])
+        self.assertEqual(self.found("golang"), [])
+        pending.save()
+        # the next generation move picks it up
+        self.index_chunks([self.chunk("rust developer")])
+        self.assertEqual(self.found("golang"), [str(pending.id)])
+
+
+class LexicalWarmUpTests(TemporaryIndexMixin, TransactionTestCase):
+    # the build thread has its own DB connection, so nothing may sit in an
+    # open test transaction
+    def test_warms_up_in_the_background(self):
+        self.use_temporary_index()
+        resume = Resume.objects.create(filename="r.pdf", status="processed")
+        chunk = ResumeChunk.objects.create(resume=resume, chunk_text="python developer", chunk_order=0)
+        self.index_chunks([chunk])
+        manager = LexicalIndexManager()
+        manager.warm_in_background().join()
+        self.assertEqual([h["chunk_id"] for h in manager.index.search("python")], [str(chunk.id)])
+
+
+class HybridQualityTests(TemporaryIndexMixin, TestCase):
+    # known-item queries (a few words lifted from one chunk) over a corpus
+    # whose embedding confuses words: fusing BM25 in must find more of them
+    # than the dense ranking alone, and never rank the item lower on average
+    VOCAB = [f"skill{i}" for i in range(300)]
+
+    def test_hybrid_beats_dense_on_known_items(self):
+        self.use_temporary_index()
+        rng = random.Random(3)
+        resume = Resume.objects.create(filename="r.pdf", status="processed")
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=" ".join(rng.sample(self.VOCAB, 12)), chunk_order=i) for i in range(200)
+        ])
+        self.index_chunks(chunks)
+        qrels = {" ".join(rng.sample(c.chunk_text.split(), 3)): str(c.id) for c in rng.sample(chunks, 50)}
+        quality = {}
+        for name, retrieve in (("vector", query_index), ("hybrid", hybrid_search)):
+            ranks = [[h["chunk_id"] for h in retrieve(q, k=5)] for q in qrels]
+            quality[name] = (
+                sum(relevant in hits for hits, relevant in zip(ranks, qrels.values())) / len(qrels),
+                sum(1 / (hits.index(relevant) + 1) for hits, relevant in zip(ranks, qrels.values()) if relevant in hits) / len(qrels),
+            )
+        (vector_recall, vector_mrr), (hybrid_recall, hybrid_mrr) = quality["vector"], quality["hybrid"]
+        self.assertGreater(hybrid_recall, vector_recall)
+        self.assertGreaterEqual(hybrid_mrr, vector_mrr)
+
+
+class AskCopiesTests(TestCase):
+    # one file uploaded five times: every chunk text has five copies, which
+    # rank next to each other and must not crowd out distinct answers
+    COPIES = 5
+    TEXTS = 13
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="recruiter", role="recruiter")
+        resumes = Resume.objects.bulk_create([Resume(filename="same.pdf", status="processed", content_sha256="f" * 64) for _ in range(cls.COPIES)])
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=f"python section {order}", chunk_order=order, text_sha256=f"{order:064d}")
+            for order in range(cls.TEXTS) for resume in resumes
+        ])
+        cls.hits = [{"chunk_id": str(c.id), "resume_id": str(c.resume_id), "score": 1.0 - i / 1000} for i, c in enumerate(chunks)]
+
+    def search(self, q, k, resume_ids=None):
+        return self.hits[:k]
+
+    def test_ask_searches_deeper_for_distinct_answers(self):
+        request = APIRequestFactory().post("/ask/", {"query": "python", "k": 3, "hybrid": False}, format="json")
+        force_authenticate(request, user=self.user)
+        with mock.patch("resumes.views.query_index", side_effect=self.search):
+            answers = AskView.as_view()(request).data["answers"]
+        self.assertEqual([a["evidence"][0]["text"] for a in answers], ["python section 0", "python section 1", "python section 2"])
+
+    def test_ask_stops_when_the_index_runs_out(self):
+        request = APIRequestFactory().post("/ask/", {"query": "python", "k": 20, "hybrid": False}, format="json")
+        force_authenticate(request, user=self.user)
+        with mock.patch("resumes.views.query_index", side_effect=self.search) as search:
+            answers = AskView.as_view()(request).data["answers"]
+        self.assertEqual(len(answers), self.TEXTS)
+        self.assertEqual(search.call_count, 2)
+
+    @override_settings(ASK_MAX_DEPTH=12)
+    def test_ask_stops_widening_at_the_depth_cap(self):
+        request = APIRequestFactory().post("/ask/", {"query": "python", "k": 5, "hybrid": False}, format="json")
+        force_authenticate(request, user=self.user)
+        with mock.patch("resumes.views.query_index", side_effect=self.search) as search:
+            answers = AskView.as_view()(request).data["answers"]
+        # 10 hits, then the capped 12: three distinct texts are what there is
+        self.assertEqual([call.kwargs["k"] for call in search.call_args_list], [10, 12])
+        self.assertEqual(len(answers), 3)
+
+    def test_ask_rejects_k_out_of_range(self):
+        for k in ("five", None, 0, -1, 51):
+            request = APIRequestFactory().post("/ask/", {"query": "python", "k": k, "hybrid": False}, format="json")
+            force_authenticate(request, user=self.user)
+            with mock.patch("resumes.views.query_index", side_effect=self.search) as search:
+                response = AskView.as_view()(request)
+            self.assertEqual(response.status_code, 400, k)
+            self.assertEqual(response.data["error"]["field"], "k")
+            search.assert_not_called()
+
+    def test_async_ask_asks_for_a_deeper_search(self):
+        self.assertIsNone(async_views.finish_ask("python", self.hits[:6], 3, False, None, 6, 0))
+        payload = async_views.finish_ask("python", self.hits[:24], 3, False, None, 24, 0)
+        self.assertEqual(len(payload["answers"]), 3)
+
+
+def shortlist(texts):
+    # [(hit, unsaved chunk)] in first-stage order, as hydrate_hits returns
+    chunks = [ResumeChunk(chunk_text=text, chunk_order=i, text_sha256=text) for i, text in enumerate(texts)]
+    return [({"chunk_id": str(c.id), "score": 1.0 - i / 100}, c) for i, c in enumerate(chunks)]
+
+
+class BuildIndexTests(SimpleTestCase):
+    @override_settings(FAISS_ANN_MIN_VECTORS=10000)
+    def test_small_corpora_build_flat_unless_the_threshold_is_overridden(self):
+        vecs = unit_vectors(500, 16)
+        self.assertIsInstance(build_index(vecs, 16, factory="IVF8,Flat"), faiss.IndexFlat)
+        self.assertIsInstance(build_index(vecs, 16, factory="IVF8,Flat", min_vectors=0), faiss.IndexIVFFlat)
+
+
+class ChunkSpanTests(SimpleTestCase):
+    PAGES = [
+        (1, "Jane Doe  jane@example.com\nSenior engineer, Python and Django"),
+        (2, "Built   search on FAISS.\n\nCall 555-123-4567 for references"),
+        (4, "Hobbies: climbing"),
+    ]
+
+    def document(self):
+        # what extract_text_from_pdf + redaction would have produced
+        return "".join(PAGE_MARKER.format(p) + redact_pii(t) for p, t in self.PAGES)
+
+    def test_spans_point_at_the_chunk_text_in_the_document(self):
+        doc = self.document()
+        chunks = list(iter_chunks(iter_document_pages(self.PAGES), chunk_size=4, overlap=1))
+        self.assertEqual([c["order"] for c in chunks], list(range(len(chunks))))
+        for chunk in chunks:
+            # a span across a page break takes the page marker in with it
+            span = re.sub(r"---PAGE \d+---", " ", doc[chunk["start"]:chunk["end"]])
+            self.assertEqual(span.split(), chunk["text"].split())
+            # the page is the first word's
+            self.assertEqual(doc.rfind("---PAGE", 0, chunk["start"]), doc.find(f"---PAGE {chunk['page']}---"))
+        self.assertNotIn("jane@example.com", " ".join(c["text"] for c in chunks))
+        # windows overlap by one word and span page breaks
+        self.assertEqual(chunks[1]["text"].split()[0], chunks[0]["text"].split()[-1])
+        self.assertTrue(any(doc.count("---PAGE", c["start"], c["end"]) for c in chunks))
+
+    def test_pages_are_read_as_chunks_are_consumed(self):
+        read = []
+
+        def pages():
+            for page in self.PAGES:
+                read.append(page[0])
+                yield page
+
+        with mock.patch("resumes.utils.iter_pdf_pages", return_value=pages()):
+            chunks, summary = stream_pdf_chunks("resume.pdf", chunk_size=4, overlap=1, summary_chars=40)
+            first = next(chunks)
+            self.assertEqual((read, first["page"]), ([1], 1))
+            rest = list(chunks)
+        self.assertEqual(read, [1, 2, 4])
+        self.assertTrue(rest[-1]["text"].endswith("Hobbies: climbing"))
+        self.assertEqual("".join(summary), self.document()[:40])
+
+
+class ChunkIdStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.ids = [str(uuid.uuid4()) for _ in range(12)]
+
+    def write_legacy_index(self, vecs):
+        # the single-file layout: resume_chunks.faiss plus id_map.json
+        index = faiss.IndexFlatIP(vecs.shape[1])
+        index.add(vecs)
+        faiss.write_index(index, str(self.dir / "resume_chunks.faiss"))
+        # json object order isn't row order
+        (self.dir / "id_map.json").write_text(json.dumps({str(i): self.ids[i] for i in reversed(range(len(vecs)))}))
+
+    def test_migrate_id_map_keeps_every_row(self):
+        (self.dir / "id_map.json").write_text(json.dumps({str(i): self.ids[i] for i in reversed(range(12))}))
+        self.assertEqual(migrate_id_map(self.dir / "id_map.json", self.dir / "chunk_ids.bin"), 12)
+        self.assertEqual((self.dir / "chunk_ids.bin").stat().st_size, 12 * ChunkIdStore.ROW_BYTES)
+        for mmap in (False, True):
+            store = ChunkIdStore.load(self.dir / "chunk_ids.bin", mmap=mmap)
+            self.assertEqual([store.get(row) for row in range(12)], self.ids)
+            self.assertIsNone(store.get(12))
+
+    def test_a_legacy_index_is_migrated_on_load_and_appended_to(self):
+        vecs = unit_vectors(12, 16)
+        self.write_legacy_index(vecs[:10])
+        manager = FaissIndexManager(self.dir)
+        snapshot = manager.get(16)
+        self.assertTrue((self.dir / "chunk_ids.bin").exists())
+        D, I = snapshot.search(vecs[3:4], 1)
+        self.assertEqual(snapshot.ids.get(I[0][0]), self.ids[3])
+
+        self.assertEqual(manager.add(vecs[10:], self.ids[10:], d=16), 10)
+        snapshot = manager.get(16)
+        self.assertEqual([snapshot.ids.get(row) for row in range(12)], self.ids)
+        self.assertEqual([seg["name"] for seg in manager.read_manifest()["segments"]][0], "resume_chunks.faiss")
+
+    def test_append_drops_rows_past_the_last_saved_row(self):
+        path = self.dir / "chunk_ids.bin"
+        ChunkIdStore.append(path, 0, self.ids[:8])
+        # rows 6 and 7 belong to a writer that died before its manifest swap
+        ChunkIdStore.append(path, 6, self.ids[8:])
+        self.assertEqual([ChunkIdStore.load(path).get(row) for row in range(10)], self.ids[:6] + self.ids[8:])
+
+
+class SegmentedIndexTests(SimpleTestCase):
+    # two managers on one directory stand in for two workers
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.worker = FaissIndexManager(self.dir, lock_timeout=0.1)
+        self.other = FaissIndexManager(self.dir, lock_timeout=0.1)
+        self.vecs = unit_vectors(30, 16)
+        self.ids = [str(uuid.uuid4()) for _ in range(30)]
+
+    def upload(self, manager, start, stop):
+        return manager.add(self.vecs[start:stop], self.ids[start:stop], d=16)
+
+    def assert_exact(self, manager):
+        flat = faiss.IndexFlatIP(16)
+        flat.add(self.vecs[:manager.get(16).ntotal])
+        queries = unit_vectors(5, 16, seed=1)
+        D, I = manager.get(16).search(queries, 5)
+        expected_D, expected_I = flat.search(queries, 5)
+        np.testing.assert_array_equal(I, expected_I)
+        np.testing.assert_allclose(D, expected_D, rtol=1e-5)
+
+    def test_each_upload_appends_one_delta(self):
+        for start in range(0, 30, 10):
+            self.assertEqual(self.upload(self.worker, start, start + 10), start)
+        manifest = self.worker.read_manifest()
+        self.assertEqual([seg["ntotal"] for seg in manifest["segments"]], [10, 10, 10])
+        # the other worker picks the new segments up from disk
+        snapshot = self.other.get(16)
+        self.assertEqual([snapshot.ids.get(row) for row in range(30)], self.ids)
+        self.assert_exact(self.other)
+
+    def test_writes_wait_for_the_file_lock(self):
+        self.upload(self.worker, 0, 10)
+        self.upload(self.worker, 10, 20)
+        with self.other.writing():
+            with self.assertRaises(Timeout):
+                self.upload(self.worker, 20, 30)
+            with self.assertRaises(Timeout):
+                self.worker.compact()
+        self.assertEqual(len(self.worker.read_manifest()["segments"]), 2)
+        self.assertTrue(self.worker.compact())
+        self.assertEqual(len(self.other.get(16).segments), 1)
+        self.assertEqual(sorted(p.name for p in self.dir.glob("*.faiss")), [self.worker.read_manifest()["segments"][0]["name"]])
+        self.assert_exact(self.other)
+
+    def test_an_upload_during_compaction_lands_after_the_merged_base(self):
+        self.upload(self.worker, 0, 10)
+        self.upload(self.worker, 10, 20)
+        merge = utils.segment_vectors
+
+        def upload_while_merging(index):
+            # the merge runs outside the lock, so another worker can write
+            if len(self.other.read_manifest()["segments"]) == 2:
+                self.upload(self.other, 20, 30)
+            return merge(index)
+
+        with mock.patch("resumes.utils.segment_vectors", side_effect=upload_while_merging):
+            self.assertTrue(self.worker.compact())
+        manifest = self.worker.read_manifest()
+        self.assertEqual([seg["ntotal"] for seg in manifest["segments"]], [20, 10])
+        self.assertEqual([self.worker.get(16).ids.get(row) for row in range(30)], self.ids)
+        self.assert_exact(self.worker)
+
+
+class RerankerTests(SimpleTestCase):
+    def test_reorders_the_head_and_keeps_the_tail(self):
+        hydrated = shortlist(["java", "python", "python django", "go", "django python django"])
+        ranked = rerank.Reranker("stub").rerank("python django", hydrated, 4)
+        self.assertEqual([c.chunk_text for _, c in ranked], ["python django", "python", "java", "go", "django python django"])
+        self.assertEqual([h["score"] for h, _ in ranked][:2], [0.98, 0.99])
+        self.assertNotIn("rerank_score", ranked[-1][0])
+
+    def test_copies_of_a_text_are_scored_once(self):
+        model = mock.Mock(predict=mock.Mock(side_effect=lambda pairs, **kw: np.arange(len(pairs), dtype="float32")))
+        with mock.patch("resumes.rerank.load_cross_encoder", return_value=model):
+            ranked = rerank.Reranker("stub").rerank("q", shortlist(["a", "b", "a", "a", "b"]), 5)
+        (pairs,), _ = model.predict.call_args
+        self.assertEqual(pairs, [("q", "a"), ("q", "b")])
+        self.assertEqual([c.chunk_text for _, c in ranked], ["b", "b", "a", "a", "a"])
+
+    def test_depth_fits_the_budget_with_a_fixed_cost(self):
+        reranker = rerank.Reranker("stub", max_depth=50, budget_ms=100)
+        self.assertEqual(reranker.depth(5), 50)
+        # warm-up pass, not counted
+        reranker._observe(1.0, 10)
+        self.assertIsNone(reranker.cost())
+        # 20ms per pass + 1ms per pair
+        for n in (5, 10, 40, 20, 5, 30):
+            reranker._observe(0.020 + 0.001 * n, n)
+        fixed, per_pair = reranker.cost()
+        self.assertAlmostEqual(fixed, 0.020)
+        self.assertAlmostEqual(per_pair, 0.001)
+        self.assertEqual(reranker.depth(5), 50)
+        reranker.budget = 0.050
+        self.assertEqual(reranker.depth(5), 30)
+
+    def test_an_over_budget_model_still_reranks_k(self):
+        reranker = rerank.Reranker("stub", max_depth=50, budget_ms=10)
+        reranker._observe(1.0, 10)
+        for n in (5, 10, 20):
+            reranker._observe(0.050 + 0.010 * n, n)
+        self.assertEqual(reranker.depth(5), 5)
+        self.assertEqual(reranker.depth(80), 50)
+        # the floor keeps passes (and measurements) coming: once the model
+        # gets cheap the depth grows back
+        reranker.alpha = 0.5
+        for n in (5, 6, 5, 6, 5, 6, 5, 6, 5, 6, 5, 6, 5, 6, 5, 6):
+            reranker._observe(0.0001 * n, n)
+        self.assertEqual(reranker.depth(5), 50)
+
+
+@override_settings(RERANK_MODEL="stub", RERANK=False, RERANK_MAX_DEPTH=10)
+class AskRerankTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="recruiter", role="recruiter")
+        resume = Resume.objects.create(filename="r.pdf", status="processed")
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=text, chunk_order=i, text_sha256=text)
+            for i, text in enumerate(["java spring", "go services", "python django redis", "python"])
+        ])
+        cls.hits = [{"chunk_id": str(c.id), "resume_id": str(c.resume_id), "score": 1.0 - i / 100} for i, c in enumerate(chunks)]
+
+    def setUp(self):
+        rerank._RERANKER.clear()
+        self.addCleanup(rerank._RERANKER.clear)
+
+    def ask(self, body):
+        request = APIRequestFactory().post("/ask/", dict(body, query="python django", hybrid=False), format="json")
+        force_authenticate(request, user=self.user)
+        with mock.patch("resumes.views.query_index", side_effect=lambda q, k, resume_ids: self.hits[:k]) as search:
+            return AskView.as_view()(request).data["answers"], search.call_args.kwargs["k"]
+
+    def test_rerank_is_opt_in_per_request(self):
+        answers, _ = self.ask({"k": 2})
+        self.assertEqual([a["evidence"][0]["text"] for a in answers], ["java spring", "go services"])
+        self.assertIsNone(answers[0]["rerank_score"])
+        answers, depth = self.ask({"k": 2, "rerank": True})
+        self.assertEqual([a["evidence"][0]["text"] for a in answers], ["python django redis", "python"])
+        self.assertGreater(answers[0]["rerank_score"], answers[1]["rerank_score"])
+        # retrieval goes as deep as the re-rank stage
+        self.assertEqual(depth, 10)
+
+    @override_settings(RERANK_MODEL="")
+    def test_no_model_means_no_rerank(self):
+        answers, _ = self.ask({"k": 2, "rerank": True})
+        self.assertEqual([a["evidence"][0]["text"] for a in answers], ["java spring", "go services"])
+
+
+class BatchMatchTests(TemporaryIndexMixin, TestCase):
+    # match_jobs must give every job the reports match_job gives it alone,
+    # however the jobs' shortlists overlap
+    TOPICS = ["python django", "python flask", "rust embedded", "react typescript", "java spring", "go kubernetes"]
+    FILLER = "team lead project delivery agile mentoring api design testing cloud".split()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="recruiter", role="recruiter")
+        rng = random.Random(7)
+        resumes = Resume.objects.bulk_create([Resume(filename=f"r{i}.pdf", status="processed") for i in range(30)])
+        cls.chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(
+                resume=resume,
+                chunk_text=" ".join([cls.TOPICS[(i + order) % len(cls.TOPICS)] if order < 2 else ""] + rng.sample(cls.FILLER, 4)),
+                chunk_order=order,
+            )
+            for i, resume in enumerate(resumes) for order in range(5)
+        ])
+        cls.jobs = Job.objects.bulk_create([
+            Job(owner=cls.user, title=topic, description=f"{topic} {rng.choice(cls.FILLER)}", requirements=topic.split())
+            for topic in cls.TOPICS
+        ])
+
+    def setUp(self):
+        self.use_temporary_index()
+
+    def per_job(self, top_n):
+        matches = {str(job.id): match_job(job, top_n)[0] for job in self.jobs}
+        Job.objects.update(match_generation="")
+        return matches
+
+    def assert_batch_matches_per_job(self, top_n=5):
+        expected = self.per_job(top_n)
+        self.assertEqual(match_jobs(self.jobs, top_n), expected)
+        shortlists = {job.title: {m["resume_id"] for m in expected[str(job.id)]} for job in self.jobs}
+        self.assertTrue(shortlists["python django"] & shortlists["python flask"])
+        self.assertFalse(shortlists["python django"] & shortlists["react typescript"])
+
+    def test_batch_matches_per_job(self):
+        self.index_chunks(self.chunks)
+        for rescore in (False, True):
+            with self.subTest(rescore=rescore), override_settings(MATCH_RESCORE=rescore):
+                self.assert_batch_matches_per_job()
+
+    def test_batch_matches_per_job_without_a_resume_index(self):
+        vecs = bag_of_words([c.chunk_text for c in self.chunks])
+        INDEX_MANAGER.add(vecs, [c.id for c in self.chunks], d=vecs.shape[1], resume_ids=[c.resume_id for c in self.chunks])
+        for rescore in (False, True):
+            with self.subTest(rescore=rescore), override_settings(MATCH_RESCORE=rescore):
+                self.assert_batch_matches_per_job()
+
+
+class TaskBackendTests(TestCase):
+    def test_a_backend_that_cannot_run_fails_loudly(self):
+        with override_settings(RESUME_TASK_BACKEND="celery"), mock.patch("resumes.tasks.process_resume_task", None):
+            with self.assertRaises(ImproperlyConfigured):
+                tasks.dispatch_resume_processing("0")
+        with override_settings(RESUME_TASK_BACKEND="rq"), self.assertRaises(ImproperlyConfigured):
+            tasks.dispatch_resume_processing("0")
+
+    def test_requeue_picks_up_uploads_stuck_in_processing(self):
+        old = timezone.now() - timedelta(hours=2)
+        stuck, slow, done = Resume.objects.bulk_create([
+            Resume(filename="stuck.pdf", status="processing"),
+            Resume(filename="slow.pdf", status="processing"),
+            Resume(filename="done.pdf", status="processed"),
+        ])
+        Resume.objects.filter(id__in=[stuck.id, done.id]).update(uploaded_at=old)
+
+        def process(resume_id):
+            Resume.objects.filter(id=resume_id).update(status="processed")
+            return True
+
+        out = io.StringIO()
+        with override_settings(RESUME_TASK_BACKEND="sync"), mock.patch("resumes.tasks.process_resume_sync", side_effect=process) as processed:
+            call_command("requeue_resumes", stale_minutes=30, stdout=out)
+        processed.assert_called_once_with(str(stuck.id))
+        self.assertIn("requeued 1 stale uploads: 1 processed, 0 failed", out.getvalue())
+        self.assertEqual(Resume.objects.get(id=slow.id).status, "processing")
+
+
+class ImportResumesTests(TemporaryIndexMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_index()
+        patch = mock.patch("resumes.management.commands.import_resumes.encode_texts", bag_of_words)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.command = import_resumes.Command(stdout=io.StringIO())
+
+    def test_a_rerun_adopts_files_committed_before_the_checkpoint(self):
+        owner = User.objects.create(username="importer")
+        # two identical files under one name, of which the crashed run stored one
+        kept = Resume.objects.create(owner=owner, filename="cv.pdf", content_sha256="a" * 64, status="processing")
+        batch = ["a/cv.pdf", "b/cv.pdf", "c/other.pdf"]
+        hashes = {"a/cv.pdf": "a" * 64, "b/cv.pdf": "a" * 64, "c/other.pdf": "b" * 64}
+        names = {"a/cv.pdf": "cv.pdf", "b/cv.pdf": "cv.pdf", "c/other.pdf": "other.pdf"}
+        self.assertEqual(self.command.imported_before(batch, hashes, names, owner, set()), {"a/cv.pdf": str(kept.id)})
+        # already in the checkpoint under another key
+        self.assertEqual(self.command.imported_before(batch, hashes, names, owner, {str(kept.id)}), {})
+
+    def test_pending_chunks_are_indexed_in_batches_cut_at_resumes(self):
+        resumes = Resume.objects.bulk_create([Resume(filename=f"r{i}.pdf", status="processing") for i in range(5)])
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=f"resume {i} chunk {order}", chunk_order=order, text_sha256=f"{i}-{order}")
+            for i, resume in enumerate(resumes) for order in range(3)
+        ])
+        # an interrupted run already indexed the first resume
+        self.index_chunks(chunks[:3])
+        with mock.patch.object(import_resumes.Command, "index_batch", wraps=self.command.index_batch) as index_batch, \
+                mock.patch.object(import_resumes, "RESUME_SLICE", 2):
+            written = self.command.index_pending([str(r.id) for r in resumes], embed_batch=4, index_batch=4)
+        self.assertEqual(written, 12)
+        for call in index_batch.call_args_list:
+            batch = call.args[0]
+            self.assertLessEqual(len(batch), 6)
+            self.assertEqual(len(batch) % 3, 0)
+        self.assertEqual(len(INDEX_MANAGER.get().ids), 15)
+        self.assertFalse(Resume.objects.exclude(status="processed").exists())
+
+
+class IndexModelChangedTests(TemporaryIndexMixin, TestCase):
+    def test_vectors_from_a_replaced_model_are_re_embedded_through_the_store(self):
+        self.use_temporary_index()
+        resume = Resume.objects.create(filename="r.pdf", status="processing")
+        chunks = ResumeChunk.objects.bulk_create([
+            ResumeChunk(resume=resume, chunk_text=text, chunk_order=i, text_sha256=hashlib.sha256(text.encode()).hexdigest())
+            for i, text in enumerate(["python django rest", "kubernetes operator go"])
+        ])
+        stale = unit_vectors(2, 64)
+        add_vectors_to_index(stale, chunks, model_name="retired-model")
+        stored = ChunkEmbedding.objects.filter(model=active_model_name(), text_sha256__in=[c.text_sha256 for c in chunks])
+        self.assertEqual(stored.count(), 2)
+        hits = query_index("kubernetes operator go", k=1)
+        self.assertEqual(hits[0]["chunk_id"], str(chunks[1].id))
+        self.assertAlmostEqual(hits[0]["score"], 1.0, places=5)
+
+
+class TombstoneTests(TemporaryIndexMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_index()
+        self.resumes, self.chunks = resumes_with_chunks([
+            ["python django api", "postgres tuning"],
+            ["python flask api", "redis caching"],
+            ["python fastapi api", "kafka streams"],
+        ])
+        # one delta per resume, so rows span segments
+        for i in range(3):
+            self.index_chunks(self.chunks[2 * i:2 * i + 2])
+        self.query = bag_of_words(["python api"])
+
+    def search_resumes(self, k=6):
+        snapshot = INDEX_MANAGER.get()
+        D, I = snapshot.search(self.query, k)
+        return [snapshot.resumes.get(row) for row in I[0] if row >= 0]
+
+    def test_removed_resumes_leave_search_at_once(self):
+        gone = str(self.resumes[0].id)
+        self.assertIn(gone, self.search_resumes())
+        self.assertEqual(INDEX_MANAGER.remove_resumes([gone]), 2)
+        found = self.search_resumes()
+        self.assertNotIn(gone, found)
+        # the scan skips the dead rows, so every live row still comes back
+        self.assertEqual(len(found), 4)
+        snapshot = INDEX_MANAGER.get()
+        self.assertEqual((snapshot.ntotal, snapshot.live), (6, 4))
+        # removing it again writes nothing
+        self.assertEqual(INDEX_MANAGER.remove_resumes([gone]), 0)
+
+    def test_compaction_keeps_them_hidden_and_rebuild_purges_them(self):
+        gone = str(self.resumes[1].id)
+        INDEX_MANAGER.remove_resumes([gone])
+        self.assertTrue(INDEX_MANAGER.compact())
+        snapshot = INDEX_MANAGER.get()
+        self.assertEqual(len(snapshot.segments), 1)
+        self.assertNotIn(gone, self.search_resumes())
+
+        self.resumes[1].delete()
+        self.rebuild()
+        snapshot = INDEX_MANAGER.get()
+        self.assertEqual((snapshot.ntotal, len(snapshot.dead)), (4, 0))
+        self.assertNotIn(gone, self.search_resumes())
+
+    def test_a_deleted_resume_is_removed_only_once_the_delete_commits(self):
+        gone = str(self.resumes[2].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.resumes[2].delete()
+            self.assertIn(gone, self.search_resumes())
+        self.assertNotIn(gone, self.search_resumes())
+
+        kept = str(self.resumes[0].id)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.resumes[0].delete()
+        # rolled back: the callbacks never run and the rows stay
+        self.assertEqual(len(callbacks), 1)
+        self.assertIn(kept, self.search_resumes())
+
+
+class RebuildIndexTests(TemporaryIndexMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_index()
+        self.resumes, self.chunks = resumes_with_chunks([
+            [f"resume {i} skill {j}" for j in range(3)] for i in range(4)
+        ])
+        # version names carry the creation second
+        stamps = (f"20260101T0000{i:02d}" for i in range(10))
+        patch = mock.patch("resumes.utils.time.strftime", side_effect=lambda fmt: next(stamps))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def indexed_resumes(self):
+        snapshot = INDEX_MANAGER.get()
+        return {snapshot.resumes.get(row) for row in range(snapshot.ntotal) if row not in set(snapshot.dead.tolist())}
+
+    def test_switch_and_roll_back_between_versions(self):
+        self.index_chunks(self.chunks)
+        self.rebuild()
+        first = INDEX_REGISTRY.active()["version"]
+        self.rebuild(fresh=True, no_switch=True)
+        second = INDEX_REGISTRY.versions()[-1][0]
+        self.assertEqual(INDEX_REGISTRY.active()["version"], first)
+        self.assertEqual(INDEX_REGISTRY.tag(second)["status"], "ready")
+
+        self.rebuild(activate=second)
+        self.assertEqual(INDEX_REGISTRY.active()["version"], second)
+        gone = str(self.resumes[0].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.resumes[0].delete()
+        self.assertNotIn(gone, self.indexed_resumes())
+
+        # rolling back removes what was deleted while the first version was retired
+        out = self.rebuild(activate=first)
+        self.assertEqual(INDEX_REGISTRY.active()["version"], first)
+        self.assertIn("3 rows of deleted resumes removed", out)
+        self.assertEqual(self.indexed_resumes(), {str(r.id) for r in self.resumes[1:]})
+
+        unfinished = INDEX_REGISTRY.create("other-model", 64)
+        with self.assertRaises(CommandError):
+            self.rebuild(activate=unfinished)
+
+    def test_an_interrupted_build_resumes_after_its_last_batch(self):
+        write_batch = rebuild_index.Command.write_batch
+        batches = []
+
+        def crash_on_third(command, chunks, batch, *args):
+            if len(batches) == 2:
+                raise RuntimeError("killed")
+            batches.append(batch)
+            return write_batch(command, chunks, batch, *args)
+
+        with mock.patch.object(rebuild_index.Command, "write_batch", autospec=True, side_effect=crash_on_third):
+            with self.assertRaises(RuntimeError):
+                self.rebuild(batch=3)
+        version, tag = INDEX_REGISTRY.versions()[-1]
+        self.assertEqual(tag["status"], "building")
+        self.assertIsNone(INDEX_REGISTRY.active()["version"])
+
+        out = self.rebuild(batch=3)
+        self.assertIn(f"resuming {version}", out)
+        self.assertIn("(6 this run)", out)
+        self.assertEqual(INDEX_REGISTRY.active()["version"], version)
+        snapshot = INDEX_MANAGER.get()
+        ids = [snapshot.ids.get(row) for row in range(snapshot.ntotal)]
+        self.assertEqual(sorted(ids), sorted(str(c.id) for c in self.chunks))
+
+
+class FilteredSearchTests(TemporaryIndexMixin, TestCase):
+    # the closest chunks belong to resumes outside the filter, so
+    # post-filtering a top-k would come back short
+    def setUp(self):
+        self.use_temporary_index()
+        self.user = User.objects.create(username="recruiter", role="recruiter")
+        self.resumes, self.chunks = resumes_with_chunks(
+            [["python django api"] * 3 for _ in range(10)] + [[f"python notes {i}", f"gardening {i}", f"cooking {i}"] for i in range(5)]
+        )
+        self.index_chunks(self.chunks)
+        self.wanted = {str(r.id) for r in self.resumes[10:]}
+
+    def test_filtered_search_fills_k_from_the_allowed_resumes(self):
+        self.assertFalse({h["resume_id"] for h in query_index("python django api", k=5)} & self.wanted)
+        for batch_size in (1, 32):
+            with self.subTest(batch_size=batch_size), override_settings(QUERY_BATCH_SIZE=batch_size):
+                hits = query_index("python django api", k=5, resume_ids=self.wanted)
+                self.assertEqual(len(hits), 5)
+                self.assertLessEqual({h["resume_id"] for h in hits}, self.wanted)
+                self.assertEqual(query_index("python django api", k=5, resume_ids={str(uuid.uuid4())}), [])
+
+    def test_filtered_search_skips_removed_resumes(self):
+        removed = str(self.resumes[10].id)
+        INDEX_MANAGER.remove_resumes([removed])
+        hits = query_index("python notes", k=15, resume_ids=self.wanted)
+        self.assertEqual(len(hits), 12)
+        self.assertNotIn(removed, {h["resume_id"] for h in hits})
+
+    def test_ask_filters_by_owner(self):
+        Resume.objects.filter(id__in=self.wanted).update(owner=self.user)
+        request = APIRequestFactory().post(
+            "/ask/", {"query": "python django api", "k": 3, "hybrid": False, "filters": {"owner_id": self.user.id}}, format="json",
+        )
+        force_authenticate(request, user=self.user)
+        answers = AskView.as_view()(request).data["answers"]
+        self.assertEqual(len(answers), 3)
+        self.assertLessEqual({a["resume_id"] for a in answers}, self.wanted)
+
+
+class MatchCacheTests(TemporaryIndexMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_index()
+        self.user = User.objects.create(username="recruiter", role="recruiter")
+        self.resumes, chunks = resumes_with_chunks([
+            ["python django api", "postgres"],
+            ["python flask api", "redis"],
+            ["react typescript", "css"],
+            ["python django celery", "aws"],
+            ["java spring", "kafka"],
+        ])
+        self.index_chunks(chunks)
+        self.job = Job.objects.create(owner=self.user, title="python django", description="api", requirements=["python", "django"])
+
+    def match(self, top_n=3):
+        self.job.refresh_from_db()
+        with mock.patch("resumes.matching.query_resume_index", wraps=utils.query_resume_index) as search:
+            matches, cached = match_job(self.job, top_n)
+        self.assertEqual(search.called, not cached)
+        return matches, cached
+
+    def fresh(self, top_n=3):
+        Job.objects.filter(id=self.job.id).update(match_generation="")
+        return self.match(top_n)[0]
+
+    def upload(self, texts):
+        (resume,), chunks = resumes_with_chunks([texts])
+        self.index_chunks(chunks)
+        return resume
+
+    def test_cached_until_the_index_changes(self):
+        first, cached = self.match()
+        self.assertFalse(cached)
+        self.assertEqual(self.match(), (first, True))
+        # a wider top_n than was stored isn't in the cache
+        self.assertFalse(self.match(top_n=4)[1])
+        self.assertTrue(self.match(top_n=2)[1])
+
+        stamp = index_stamp()
+        self.upload(["watercolour painting", "pottery"])
+        self.assertNotEqual(index_stamp(), stamp)
+        self.assertFalse(self.match()[1])
+        self.assertTrue(self.match()[1])
+
+    def test_an_upload_is_spliced_into_the_cached_matches(self):
+        self.match()
+        resume = self.upload(["python django api", "python django"])
+        self.assertEqual(refresh_matches_for_resumes([resume.id]), 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.match_generation, index_stamp())
+        matches, cached = self.match()
+        self.assertTrue(cached)
+        self.assertEqual(matches[0]["resume_id"], str(resume.id))
+        self.assertEqual(MatchReport.objects.filter(job=self.job).count(), 3)
+        expected = self.fresh()
+        self.assertEqual([(m["resume_id"], m["evidence"]) for m in matches], [(m["resume_id"], m["evidence"]) for m in expected])
+        for got, want in zip(matches, expected):
+            self.assertAlmostEqual(got["score"], want["score"], places=5)
+
+    def test_an_irrelevant_upload_keeps_the_cache_and_a_delete_drops_it(self):
+        first, _ = self.match()
+        resume = self.upload(["watercolour painting", "pottery"])
+        refresh_matches_for_resumes([resume.id])
+        self.assertEqual(self.match(), (first, True))
+
+        gone = first[0]["resume_id"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Resume.objects.get(id=gone).delete()
+        self.assertFalse(MatchReport.objects.filter(resume_id=gone).exists())
+        matches, cached = self.match()
+        self.assertFalse(cached)
+        self.assertNotIn(gone, [m["resume_id"] for m in matches])
+        self.assertEqual(len(matches), 3)
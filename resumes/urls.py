@@ -1,14 +1,19 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import (
     RegisterView,
     ResumeUploadView,
     ResumeListView,
     ResumeDetailView,
+    ResumeStatusView,
     AskView,
     JobListView,
     JobCreateView,
     JobDetailView,
-    JobMatchView
+    JobMatchView,
+    BatchJobMatchView,
+    RetrievalStatsView,
 )
 from rest_framework_simplejwt.views import TokenObtainPairView
 
@@ -17,11 +22,22 @@ urlpatterns = [
     path("resumes/", ResumeListView.as_view()),
     path("resumes/upload/", ResumeUploadView.as_view()),
     path("resumes/<uuid:id>/", ResumeDetailView.as_view()),
+    path("resumes/<uuid:id>/status/", ResumeStatusView.as_view()),
     path("ask/", AskView.as_view()),
+    path("stats/", RetrievalStatsView.as_view()),
 
     # Jobs
     path("jobs/", JobCreateView.as_view(), name="job-create"),
     path("jobs/list/", JobListView.as_view(), name="job-list"),
+    path("jobs/match/", BatchJobMatchView.as_view()),
     path("jobs/<uuid:id>/", JobDetailView.as_view()),
     path("jobs/<uuid:id>/match/", JobMatchView.as_view()),
 ]
+
+if getattr(settings, "ASYNC_QUERY_VIEWS", False):
+    # ASGI deployments: the query endpoints don't pin a worker while
+    # encoding and searching
+    urlpatterns = [
+        path("ask/", async_views.ask),
+        path("jobs/<uuid:id>/match/", async_views.job_match),
+    ] + urlpatterns
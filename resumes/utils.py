@@ -1,30 +1,254 @@
 import os
 import re
 import json
+import hashlib
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from PyPDF2 import PdfReader
+from filelock import FileLock
 from django.conf import settings
+from django.core.cache import caches
 
 MODEL_CACHE = {}
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
 
-def load_embedding_model(name="all-MiniLM-L6-v2"):
+def configure_torch_threads():
+    threads = getattr(settings, "TORCH_NUM_THREADS", 0)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def active_model_name():
+    # the model the live index was embedded with; queries must match it
+    return INDEX_REGISTRY.active()["model"]
+
+def load_embedding_model(name=None):
+    name = name or active_model_name()
     if name not in MODEL_CACHE:
+        configure_torch_threads()
         MODEL_CACHE[name] = SentenceTransformer(name)
     return MODEL_CACHE[name]
 
-def extract_text_from_pdf(path):
-    text = ""
+def embedding_dimension(name=None):
+    return load_embedding_model(name).get_sentence_embedding_dimension()
+
+def encode_texts(texts, batch_size=None, model_name=None):
+    model = load_embedding_model(model_name)
+    vecs = model.encode(
+        texts,
+        batch_size=batch_size or getattr(settings, "EMBED_BATCH_SIZE", 64),
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
+    # L2-normalize for cosine via inner product
+    faiss.normalize_L2(vecs)
+    return vecs
+
+class EmbeddingBatcher:
+    # Ingestion stage shared by every upload in the process: chunks from many
+    # resumes are pooled into one encode call, flushed when batch_size texts
+    # are waiting or max_wait seconds after the first one arrived. The queue
+    # is bounded so producers block instead of piling up unbounded work.
+    def __init__(self, batch_size=64, max_wait=0.02, max_pending=256):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts, model_name=None):
+        future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype="float32"))
+            return future
+        self._ensure_thread()
+        # the model is fixed at submit time, so a version switch mid-queue
+        # can't hand a caller vectors from a model it didn't ask for
+        self.queue.put((list(texts), model_name or active_model_name(), future))
+        return future
+
+    def encode(self, texts, model_name=None):
+        return self.submit(texts, model_name).result()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        items = [self.queue.get()]
+        count = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            count += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            by_model = {}
+            for item in self._collect():
+                by_model.setdefault(item[1], []).append(item)
+            for model_name, items in by_model.items():
+                self._encode(model_name, items)
+
+    def _encode(self, model_name, items):
+        texts = [t for batch, _, _ in items for t in batch]
+        try:
+            vecs = encode_texts(texts, batch_size=self.batch_size, model_name=model_name)
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        start = 0
+        for batch, _, future in items:
+            future.set_result(vecs[start:start + len(batch)])
+            start += len(batch)
+
+class QueryEmbeddingCache:
+    # LRU of normalized query vectors keyed by model + normalized query text,
+    # with an optional shared tier in a Django cache (e.g. Redis) so workers
+    # reuse each other's encodes.
+    def __init__(self, maxsize=1024, shared_alias=None, shared_timeout=3600):
+        self.maxsize = maxsize
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.lower().split())
+
+    def key(self, model_name, text):
+        return (model_name, self.normalize(text))
+
+    def shared_key(self, key):
+        return "qemb:" + hashlib.sha1("\0".join(key).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vec
+        if self.shared_alias:
+            raw = caches[self.shared_alias].get(self.shared_key(key))
+            if raw is not None:
+                vec = np.frombuffer(raw, dtype="float32")
+                self._store(key, vec)
+                with self._lock:
+                    self.shared_hits += 1
+                return vec
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, vec):
+        vec = np.ascontiguousarray(vec, dtype="float32")
+        vec.setflags(write=False)
+        self._store(key, vec)
+        if self.shared_alias:
+            caches[self.shared_alias].set(self.shared_key(key), vec.tobytes(), self.shared_timeout)
+
+    def _store(self, key, vec):
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+QUERY_CACHE = QueryEmbeddingCache(
+    maxsize=getattr(settings, "QUERY_EMBED_CACHE_SIZE", 1024),
+    shared_alias=getattr(settings, "QUERY_EMBED_SHARED_CACHE", None),
+)
+
+def embed_query(query_text, model_name=None):
+    model_name = model_name or active_model_name()
+    key = QUERY_CACHE.key(model_name, query_text)
+    vec = QUERY_CACHE.get(key)
+    if vec is None:
+        vec = encode_texts([query_text], model_name=model_name)[0]
+        QUERY_CACHE.put(key, vec)
+    return vec
+
+def embed_queries(texts, model_name=None):
+    # many queries, one encode call for whatever the cache doesn't have
+    model_name = model_name or active_model_name()
+    keys = [QUERY_CACHE.key(model_name, t) for t in texts]
+    vecs = [QUERY_CACHE.get(key) for key in keys]
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+    if missing:
+        for i, vec in zip(missing, encode_texts([texts[i] for i in missing], model_name=model_name)):
+            QUERY_CACHE.put(keys[i], vec)
+            vecs[i] = vec
+    return np.stack(vecs) if vecs else np.zeros((0, 0), dtype="float32")
+
+_EMBEDDING_BATCHER = {}
+
+def get_embedding_batcher():
+    # one batcher thread per process; gunicorn forks after import
+    pid = os.getpid()
+    if pid not in _EMBEDDING_BATCHER:
+        _EMBEDDING_BATCHER.clear()
+        _EMBEDDING_BATCHER[pid] = EmbeddingBatcher(
+            batch_size=getattr(settings, "EMBED_BATCH_SIZE", 64),
+            max_wait=getattr(settings, "EMBED_BATCH_MAX_WAIT_MS", 20) / 1000.0,
+            max_pending=getattr(settings, "EMBED_QUEUE_SIZE", 256),
+        )
+    return _EMBEDDING_BATCHER[pid]
+
+PAGE_MARKER = "\n\n---PAGE {}---\n\n"
+RE_WORD = re.compile(r"\S+")
+
+def iter_pdf_pages(path):
+    # yields (page_number, text) one page at a time; path may be a file object
     try:
         reader = PdfReader(path)
         for p, page in enumerate(reader.pages, start=1):
             t = page.extract_text()
             if t:
-                text += f"\n\n---PAGE {p}---\n\n" + t
+                yield p, t
     except Exception as e:
         print("pdf extract err", e)
-    return text
+
+def extract_text_from_pdf(path):
+    return "".join(PAGE_MARKER.format(p) + t for p, t in iter_pdf_pages(path))
 
 RE_PII_EMAIL = re.compile(r"[A-Za-z0-9\._%+\-]+@[A-Za-z0-9\.\-]+\.[A-Za-z]{2,}")
 RE_PII_PHONE = re.compile(r"(\+?\d{2,3}[-.\s]?)?(\d{10}|\d{3}[-.\s]\d{3}[-.\s]\d{4})")
@@ -34,75 +258,926 @@ def redact_pii(text):
     text = RE_PII_PHONE.sub("[REDACTED_PHONE]", text)
     return text
 
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    i = 0
+def iter_document_pages(pages, redact=True):
+    # (page_number, offset, text): offset is where the page text starts in the
+    # document extract_text_from_pdf() would build (after redaction)
+    offset = 0
+    for p, t in pages:
+        if redact:
+            t = redact_pii(t)
+        offset += len(PAGE_MARKER.format(p))
+        yield p, offset, t
+        offset += len(t)
+
+def iter_chunks(pages, chunk_size=500, overlap=50):
+    # sliding window over the words of (page_number, offset, text) triples;
+    # only the current window is held, never the whole word list
+    window = deque()
     order = 0
-    while i < len(words):
-        chunk_words = words[i:i+chunk_size]
-        chunk_text = " ".join(chunk_words)
-        chunks.append({"text": chunk_text, "order": order})
-        i += (chunk_size - overlap)
-        order += 1
-    return chunks
+    for p, base, t in pages:
+        for m in RE_WORD.finditer(t):
+            window.append((m.group(), base + m.start(), base + m.end(), p))
+            if len(window) == chunk_size:
+                yield window_chunk(window, order)
+                order += 1
+                for _ in range(chunk_size - overlap):
+                    window.popleft()
+    if window:
+        yield window_chunk(window, order)
+
+def window_chunk(window, order):
+    return {
+        "text": " ".join(w[0] for w in window),
+        "order": order,
+        "page": window[0][3],
+        "start": window[0][1],
+        "end": window[-1][2],
+    }
+
+def chunk_text(text, chunk_size=500, overlap=50):
+    return list(iter_chunks([(None, 0, text)], chunk_size, overlap))
+
+def stream_pdf_chunks(path, chunk_size=500, overlap=50, summary_chars=800):
+    # returns (chunk iterator, summary parts); the parts fill in as the
+    # iterator is consumed, so only the first summary_chars are kept
+    summary = []
+    def pages():
+        kept = 0
+        for p, base, t in iter_document_pages(iter_pdf_pages(path)):
+            if kept < summary_chars:
+                summary.append((PAGE_MARKER.format(p) + t)[:summary_chars - kept])
+                kept += len(summary[-1])
+            yield p, base, t
+    return iter_chunks(pages(), chunk_size, overlap), summary
 
 # FAISS helper
 INDEX_DIR = settings.BASE_DIR / "faiss_index"
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 FAISS_INDEX_PATH = INDEX_DIR / "resume_chunks.faiss"
 ID_MAP_PATH = INDEX_DIR / "id_map.json"
+CHUNK_IDS_PATH = INDEX_DIR / "chunk_ids.bin"
+RESUME_IDS_PATH = INDEX_DIR / "resume_ids.bin"
+
+# mmap-capable read flags; IO_FLAG_MMAP_IFC maps flat codes zero-copy (faiss >= 1.11)
+FAISS_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def atomic_write(path, write):
+    # readers (and other workers' mmaps) keep the old inode until they reopen
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    write(str(tmp))
+    os.replace(tmp, path)
+
+def atomic_write_json(path, data):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+    atomic_write(path, write)
+
+class ChunkIdStore:
+    # FAISS row -> ResumeChunk UUID as a fixed-width array, 16 raw bytes per
+    # row, so lookups are O(1) and the file can be mapped and appended to.
+    ROW_BYTES = 16
+
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else np.zeros((0, self.ROW_BYTES), dtype=np.uint8)
+        self.ino = None
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        if os.path.getsize(path) < cls.ROW_BYTES:
+            return cls()
+        if mmap:
+            rows = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            rows = np.fromfile(path, dtype=np.uint8)
+        n = len(rows) // cls.ROW_BYTES
+        return cls(rows[:n * cls.ROW_BYTES].reshape(n, cls.ROW_BYTES))
+
+    @classmethod
+    def from_json_map(cls, id_map):
+        rows = np.zeros((len(id_map), cls.ROW_BYTES), dtype=np.uint8)
+        for k, v in id_map.items():
+            rows[int(k)] = np.frombuffer(uuid.UUID(v).bytes, dtype=np.uint8)
+        return cls(rows)
+
+    @staticmethod
+    def encode(chunk_ids):
+        return b"".join(uuid.UUID(str(c)).bytes for c in chunk_ids)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, row, default=None):
+        row = int(row)
+        if row < 0 or row >= len(self.rows):
+            return default
+        return str(uuid.UUID(bytes=self.rows[row].tobytes()))
+
+    def extend(self, chunk_ids):
+        new = np.frombuffer(self.encode(chunk_ids), dtype=np.uint8).reshape(-1, self.ROW_BYTES)
+        return ChunkIdStore(np.concatenate([np.asarray(self.rows), new]))
+
+    def extend_from_file(self, path):
+        tail = np.fromfile(path, dtype=np.uint8, offset=len(self) * self.ROW_BYTES)
+        n = len(tail) // self.ROW_BYTES
+        if n == 0:
+            return self
+        return ChunkIdStore(np.concatenate([self.rows, tail[:n * self.ROW_BYTES].reshape(n, self.ROW_BYTES)]))
+
+    def write(self, path):
+        np.ascontiguousarray(self.rows).tofile(path)
+
+    def keys(self):
+        # first 8 bytes of each UUID as an int64, for vectorised membership tests
+        return np.ascontiguousarray(self.rows[:, :8]).view("<i8").ravel()
+
+    @staticmethod
+    def keys_for(ids):
+        return np.frombuffer(b"".join(uuid.UUID(str(i)).bytes[:8] for i in ids), dtype="<i8")
+
+    @classmethod
+    def append(cls, path, start_row, chunk_ids):
+        # drop rows a crashed writer appended past the last saved index, so
+        # file row i always lines up with FAISS row i
+        with open(path, "ab") as f:
+            f.truncate(start_row * cls.ROW_BYTES)
+            f.write(cls.encode(chunk_ids))
+            f.flush()
+            os.fsync(f.fileno())
+
+def migrate_id_map(json_path=ID_MAP_PATH, bin_path=CHUNK_IDS_PATH):
+    with open(json_path) as f:
+        store = ChunkIdStore.from_json_map(json.load(f))
+    atomic_write(bin_path, store.write)
+    return len(store)
+
+def segment_vectors(index):
+    try:
+        # IVF indexes can only reconstruct by id once they have a direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+# top-level index types that can't take an IDSelector (tombstones, resume
+# filters) or an inner-product metric; PQ works behind IVF ("IVF{n},PQ48")
+UNSELECTABLE_FACTORIES = ("PQ", "LSH")
+
+def index_factory_spec(n, factory=None, min_vectors=None):
+    # "{n}" in the factory string becomes a list count sized to the corpus,
+    # e.g. "IVF{n},Flat" -> "IVF1264,Flat" at 100k vectors
+    factory = factory or getattr(settings, "FAISS_INDEX_FACTORY", "Flat")
+    if factory.startswith(UNSELECTABLE_FACTORIES):
+        raise ValueError(f"unsupported index factory {factory!r}; put PQ behind IVF, e.g. 'IVF{{n}},PQ48'")
+    if min_vectors is None:
+        min_vectors = getattr(settings, "FAISS_ANN_MIN_VECTORS", 10000)
+    if n < min_vectors:
+        # brute force is exact and already fast here, and IVF/PQ can't train
+        return "Flat"
+    return factory.replace("{n}", str(max(1, int(4 * np.sqrt(n)))))
+
+def build_index(vecs, d, factory=None, min_vectors=None):
+    spec = index_factory_spec(len(vecs), factory, min_vectors)
+    index = faiss.index_factory(d, spec, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vecs)
+    index.add(vecs)
+    return index
+
+def search_params(index, sel):
+    # SearchParameters replace the index's own knobs for the call, so carry
+    # the tuned nprobe / efSearch / k_factor over alongside the selector
+    if isinstance(index, faiss.IndexRefine):
+        # the selector filters the compressed scan; re-ranking only sees its candidates
+        return faiss.IndexRefineSearchParameters(k_factor=index.k_factor, base_index_params=search_params(index.base_index, sel))
+    try:
+        return faiss.SearchParametersIVF(sel=sel, nprobe=faiss.extract_index_ivf(index).nprobe)
+    except RuntimeError:
+        pass
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=hnsw.efSearch)
+    return faiss.SearchParameters(sel=sel)
+
+def tune_index(index, nprobe=None, ef_search=None, k_factor=None):
+    params = faiss.ParameterSpace()
+    knobs = (
+        ("nprobe", nprobe or getattr(settings, "FAISS_NPROBE", 16)),
+        ("efSearch", ef_search or getattr(settings, "FAISS_EF_SEARCH", 64)),
+        ("k_factor_rf", k_factor or getattr(settings, "FAISS_REFINE_K_FACTOR", 4)),
+    )
+    for name, value in knobs:
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # knob doesn't apply to this index type
+            pass
+    return index
+
+def rows_between(rows, start, stop):
+    # the part of a sorted row array in [start, stop), shifted to local rows
+    lo, hi = np.searchsorted(rows, [start, stop])
+    return rows[lo:hi] - start
+
+class IndexSnapshot:
+    # Immutable view of one manifest generation: the segments in row order
+    # plus the chunk-id and resume-id stores. Searches every segment and
+    # merges by score. Tombstoned rows stay in the segments until a rebuild
+    # but are skipped inside the scan.
+    def __init__(self, generation, segments, ids, d, resumes=None, tombstones=None):
+        self.generation = generation
+        self.segments = segments  # [(name, row_offset, faiss_index)]
+        self.ids = ids
+        self.resumes = resumes if resumes is not None else ChunkIdStore()
+        self.d = d
+        # in append order; dead is the sorted set
+        self.tombstones = tombstones if tombstones is not None else np.zeros(0, dtype="int64")
+        self.dead = np.unique(self.tombstones)
+        self._resume_keys = None
+
+    @property
+    def ntotal(self):
+        return sum(index.ntotal for _, _, index in self.segments)
 
-def ensure_faiss_index(d=384):
-    # d set by model output dimension; all-MiniLM-L6-v2 -> 384
-    if FAISS_INDEX_PATH.exists():
-        index = faiss.read_index(str(FAISS_INDEX_PATH))
-        id_map = json.loads(open(ID_MAP_PATH).read())
-        return index, id_map
-    else:
-        index = faiss.IndexFlatIP(d)
-        id_map = {}
-        return index, id_map
+    @property
+    def live(self):
+        return self.ntotal - len(self.dead)
+
+    def resume_keys(self):
+        # per-row resume keys; rows indexed before resume_ids.bin existed are
+        # zero and never match a resume
+        if self._resume_keys is None:
+            keys = self.resumes.keys()
+            if len(keys) < self.ntotal:
+                keys = np.concatenate([keys, np.zeros(self.ntotal - len(keys), dtype=keys.dtype)])
+            self._resume_keys = keys
+        return self._resume_keys
+
+    def rows_for_resumes(self, resume_ids):
+        return np.flatnonzero(np.isin(self.resume_keys(), ChunkIdStore.keys_for(resume_ids)))
+
+    def rows_owned_by(self, resume_ids):
+        # rows_for_resumes, with the full id checked against key collisions
+        resume_ids = {str(r) for r in resume_ids}
+        return np.array([row for row in self.rows_for_resumes(resume_ids).tolist() if self.resumes.get(row) in resume_ids], dtype="int64")
+
+    def search(self, qvecs, k, rows=None):
+        # rows: sorted global rows to restrict to; the filter and the
+        # tombstones are applied inside each segment's scan via IDSelectors,
+        # so k results come back whenever k live matching rows exist
+        nq = len(qvecs)
+        if rows is not None and len(self.dead):
+            rows = np.setdiff1d(rows, self.dead)
+        Ds, Is = [], []
+        for _, offset, index in self.segments:
+            if index.ntotal == 0:
+                continue
+            if rows is not None:
+                local = rows_between(rows, offset, offset + index.ntotal)
+                if len(local) == 0:
+                    continue
+                sel = faiss.IDSelectorBatch(local)
+                D, I = index.search(qvecs, k, params=search_params(index, sel))
+            elif len(dead := rows_between(self.dead, offset, offset + index.ntotal)):
+                skip = faiss.IDSelectorBatch(dead)
+                D, I = index.search(qvecs, k, params=search_params(index, faiss.IDSelectorNot(skip)))
+            else:
+                D, I = index.search(qvecs, k)
+            Ds.append(np.where(I >= 0, D, -np.inf))
+            Is.append(np.where(I >= 0, I + offset, -1))
+        if not Ds:
+            return np.full((nq, k), -np.inf, dtype="float32"), np.full((nq, k), -1, dtype="int64")
+        if len(Ds) == 1:
+            return Ds[0], Is[0]
+        D = np.concatenate(Ds, axis=1)
+        I = np.concatenate(Is, axis=1)
+        order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+class FaissIndexManager:
+    # Keeps the index resident in the worker process and only re-reads what
+    # changed on disk. The on-disk layout is a base segment plus small delta
+    # segments listed in manifest.json; uploads write a new delta, queries
+    # search all segments, and compaction merges them back into one base.
+    # With mmap=True segments and chunk ids are mapped read-only, so every
+    # worker on the host shares the same page-cache pages.
+    # Given a registry, the manager serves <active version>/<subdir> and
+    # moves over when the registry's ACTIVE.json changes.
+    def __init__(self, index_dir=None, mmap=False, max_delta_segments=16, lock_timeout=-1, registry=None, subdir="", factory=None):
+        self.mmap = mmap
+        # index_factory string for compacted bases (None: FAISS_INDEX_FACTORY)
+        self.factory = factory
+        self.max_delta_segments = max_delta_segments
+        self.lock_timeout = lock_timeout
+        self.registry = registry
+        self.subdir = subdir
+        self._lock = threading.Lock()
+        # single writer per host: the thread lock orders writers in this
+        # process, the file lock orders them across gunicorn workers;
+        # reentrant so a rebuild can hold it across its final catch-up and swap
+        self._write_lock = threading.RLock()
+        self._compacting = threading.Lock()
+        self._retarget(index_dir if registry is None else registry.active()["path"] / subdir)
+
+    def _retarget(self, index_dir):
+        # the directory is created by the first write, not here: importing
+        # this module (manage.py check, a worker's boot) writes nothing
+        self.index_dir = index_dir
+        self.manifest_path = index_dir / "manifest.json"
+        self.chunk_ids_path = index_dir / "chunk_ids.bin"
+        self.resume_ids_path = index_dir / "resume_ids.bin"
+        # append-only int64 rows removed since the last rebuild
+        self.tombstones_path = index_dir / "tombstones.bin"
+        self.legacy_index_path = index_dir / "resume_chunks.faiss"
+        self.legacy_id_map_path = index_dir / "id_map.json"
+        self._file_lock = FileLock(str(index_dir / ".write.lock"), timeout=self.lock_timeout)
+        self._snapshot = None
+        self._stamp = None
+
+    def _follow(self):
+        if self.registry is None:
+            return
+        index_dir = self.registry.active()["path"] / self.subdir
+        if index_dir != self.index_dir:
+            # waits out in-flight writes to the old version
+            with self._write_lock, self._lock:
+                if index_dir != self.index_dir:
+                    self._retarget(index_dir)
+
+    def disk_stamp(self):
+        for path in (self.manifest_path, self.legacy_index_path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return (path.name, st.st_ino, st.st_mtime_ns, st.st_size)
+        return None
+
+    def read_manifest(self):
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        if self.legacy_index_path.exists():
+            # single-file layout from before segments; ntotal is filled in on first write
+            return {"generation": 0, "ntotal": None, "segments": [{"name": self.legacy_index_path.name, "ntotal": None}]}
+        return {"generation": 0, "ntotal": 0, "segments": []}
+
+    def write_manifest(self, manifest):
+        atomic_write_json(self.manifest_path, manifest)
+
+    def _read_segment(self, name):
+        flags = FAISS_MMAP_FLAGS if self.mmap else 0
+        return tune_index(faiss.read_index(str(self.index_dir / name), flags))
+
+    def _read_store(self, path, previous):
+        try:
+            ino = os.stat(path).st_ino
+        except FileNotFoundError:
+            return ChunkIdStore()
+        if self.mmap or previous is None or previous.ino != ino:
+            store = ChunkIdStore.load(path, mmap=self.mmap)
+        else:
+            # same file, append-only: only read the rows we don't have yet
+            store = previous.extend_from_file(path)
+        # a rebuild or backfill swaps in a new inode and forces a full read
+        store.ino = ino
+        return store
+
+    def _read_ids(self, previous):
+        if not self.chunk_ids_path.exists() and self.legacy_id_map_path.exists():
+            # one-off upgrade of deployments that still have id_map.json
+            migrate_id_map(self.legacy_id_map_path, self.chunk_ids_path)
+        return self._read_store(self.chunk_ids_path, previous)
+
+    def _load(self, d):
+        manifest = self.read_manifest()
+        previous = self._snapshot
+        loaded = {name: index for name, _, index in previous.segments} if previous else {}
+        segments = []
+        offset = 0
+        for seg in manifest["segments"]:
+            # segment files are immutable, so anything already loaded is reused
+            index = loaded.get(seg["name"]) or self._read_segment(seg["name"])
+            segments.append((seg["name"], offset, index))
+            offset += index.ntotal
+        ids = self._read_ids(previous.ids if previous else None)
+        resumes = self._read_store(self.resume_ids_path, previous.resumes if previous else None)
+        return IndexSnapshot(manifest["generation"], segments, ids, manifest.get("d", d), resumes, self._read_tombstones())
+
+    def _read_tombstones(self):
+        try:
+            return np.fromfile(self.tombstones_path, dtype="<i8")
+        except FileNotFoundError:
+            return np.zeros(0, dtype="int64")
+
+    def _refresh(self, d):
+        stamp = self.disk_stamp()
+        if self._snapshot is not None and stamp == self._stamp:
+            return self._snapshot
+        try:
+            snapshot = self._load(d)
+        except RuntimeError:
+            # a compaction removed a segment between reading the manifest and
+            # opening it; the manifest now points at the merged base
+            stamp = self.disk_stamp()
+            snapshot = self._load(d)
+        self._snapshot, self._stamp = snapshot, stamp
+        return snapshot
+
+    def get(self, d=384):
+        self._follow()
+        snapshot = self._snapshot
+        if snapshot is not None and self.disk_stamp() == self._stamp:
+            return snapshot
+        with self._lock:
+            return self._refresh(d)
+
+    @contextmanager
+    def writing(self):
+        self._follow()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with self._write_lock, self._file_lock:
+            if self.registry is not None:
+                self.registry.pin()
+            yield
+
+    def _writable_manifest(self):
+        manifest = self.read_manifest()
+        if manifest["ntotal"] is None:
+            base = faiss.read_index(str(self.legacy_index_path), FAISS_MMAP_FLAGS)
+            manifest["ntotal"] = manifest["segments"][0]["ntotal"] = base.ntotal
+        return manifest
+
+    def add(self, vecs, chunk_ids, d=384, resume_ids=None):
+        # cost is proportional to the new vectors: one small delta segment,
+        # an append to chunk_ids.bin and a manifest swap
+        with self.writing():
+            # re-read under the lock; another worker may have written since
+            manifest = self._writable_manifest()
+            start_id = manifest["ntotal"]
+            generation = manifest["generation"] + 1
+            segment = faiss.IndexFlatIP(d)
+            segment.add(vecs)
+            name = f"seg-{generation:08d}.faiss"
+            atomic_write(self.index_dir / name, lambda p: faiss.write_index(segment, p))
+            # ids before the manifest: readers only look up rows a listed segment can return
+            ChunkIdStore.append(self.chunk_ids_path, start_id, chunk_ids)
+            if resume_ids is not None:
+                # a store that predates this batch is zero-padded up to start_id
+                ChunkIdStore.append(self.resume_ids_path, start_id, resume_ids)
+            self.write_manifest({
+                "generation": generation,
+                "ntotal": start_id + segment.ntotal,
+                "d": d,
+                "segments": manifest["segments"] + [{"name": name, "ntotal": segment.ntotal}],
+            })
+            deltas = len(manifest["segments"])
+        with self._lock:
+            self._refresh(d)
+        if deltas >= self.max_delta_segments:
+            self.compact_in_background()
+        return start_id
+
+    def replace(self, index, ids, resume_ids=None):
+        # swap in a whole new base (rebuilds); old segments are dropped
+        with self.writing():
+            manifest = self.read_manifest()
+            generation = manifest["generation"] + 1
+            name = f"seg-{generation:08d}.faiss"
+            atomic_write(self.index_dir / name, lambda p: faiss.write_index(index, p))
+            atomic_write(self.chunk_ids_path, ids.write)
+            if resume_ids is not None:
+                atomic_write(self.resume_ids_path, resume_ids.write)
+            else:
+                # the old rows no longer line up; filtered search needs a backfill
+                self.resume_ids_path.unlink(missing_ok=True)
+            # a new base only holds live rows
+            self.tombstones_path.unlink(missing_ok=True)
+            self.write_manifest({"generation": generation, "ntotal": index.ntotal, "d": index.d, "segments": [{"name": name, "ntotal": index.ntotal}]})
+            self._remove_unlisted()
+        with self._lock:
+            self._refresh(index.d)
+
+    def compact(self):
+        if not self._compacting.acquire(blocking=False):
+            return False
+        try:
+            merging = self._writable_manifest()["segments"]
+            if len(merging) < 2:
+                return False
+            # merge outside the writer lock so uploads keep landing as deltas
+            base = faiss.read_index(str(self.index_dir / merging[0]["name"]))
+            deltas = np.concatenate([segment_vectors(faiss.read_index(str(self.index_dir / seg["name"]))) for seg in merging[1:]])
+            ntotal = base.ntotal + len(deltas)
+            if isinstance(base, faiss.IndexFlat) and index_factory_spec(ntotal, self.factory) != "Flat":
+                # the corpus just outgrew FAISS_ANN_MIN_VECTORS: the one
+                # rebuild, from the exact Flat vectors, into the ANN base
+                vecs = np.concatenate([segment_vectors(base), deltas])
+                merged = build_index(vecs, vecs.shape[1], self.factory)
+                del vecs
+            else:
+                # otherwise the deltas go into the trained base as is, at a
+                # cost proportional to the deltas; re-encoding a compressed
+                # base would also compound its error. rebuild_index retrains
+                # (IVF lists sized for the grown corpus) from stored vectors.
+                merged = base
+                merged.add(deltas)
+            del base, deltas
+            with self.writing():
+                current = self.read_manifest()
+                if [seg["name"] for seg in current["segments"][:len(merging)]] != [seg["name"] for seg in merging]:
+                    # another worker compacted or rebuilt while we merged
+                    return False
+                generation = current["generation"] + 1
+                name = f"seg-{generation:08d}.faiss"
+                atomic_write(self.index_dir / name, lambda p: faiss.write_index(merged, p))
+                # deltas written while we merged stay after the new base
+                newer = current["segments"][len(merging):]
+                current.update({
+                    "generation": generation,
+                    "segments": [{"name": name, "ntotal": merged.ntotal}] + newer,
+                })
+                self.write_manifest(current)
+                self._remove_unlisted()
+            with self._lock:
+                self._refresh(merged.d)
+            return True
+        finally:
+            self._compacting.release()
+
+    def set_resume_ids(self, resumes):
+        # backfill for indexes built before resume_ids.bin; rows must line up
+        # with chunk_ids.bin, so the caller resolves them inside writing().
+        # The generation bump makes every worker pick the new file up.
+        atomic_write(self.resume_ids_path, resumes.write)
+        manifest = self._writable_manifest()
+        manifest["generation"] += 1
+        self.write_manifest(manifest)
+        with self._lock:
+            self._refresh(manifest.get("d", 384))
+
+    def remove_rows(self, rows):
+        # tombstone rows; every worker stops returning them on its next get().
+        # Compaction keeps row numbers, so tombstones survive it; a rebuild
+        # (replace) drops the rows for good.
+        rows = np.asarray(rows, dtype="<i8")
+        with self.writing():
+            if len(rows):
+                with open(self.tombstones_path, "ab") as f:
+                    f.write(rows.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            manifest = self._writable_manifest()
+            manifest["generation"] += 1
+            self.write_manifest(manifest)
+        with self._lock:
+            self._refresh(manifest.get("d", 384))
+        return len(rows)
+
+    def remove_resumes(self, resume_ids):
+        with self.writing():
+            # rows resolved under the lock so a concurrent rebuild can't renumber them
+            snapshot = self.get()
+            rows = np.setdiff1d(snapshot.rows_owned_by(resume_ids), snapshot.dead)
+            return self.remove_rows(rows) if len(rows) else 0
+
+    def compact_in_background(self):
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def _remove_unlisted(self):
+        listed = {seg["name"] for seg in self.read_manifest()["segments"]}
+        for path in self.index_dir.glob("*.faiss"):
+            if path.name not in listed:
+                path.unlink(missing_ok=True)
+
+class IndexRegistry:
+    # Index versions side by side under one root, each a directory tagged
+    # (version.json) with the embedding model and dimension it was built
+    # with. ACTIVE.json names the live one and rewriting it is the switch, so
+    # a new model's index is built next to the old one while it serves.
+    # Without ACTIVE.json the root itself is the index, as laid out before
+    # versions existed.
+    def __init__(self, root, default_model=DEFAULT_MODEL_NAME):
+        self.root = root
+        self.pointer_path = root / "ACTIVE.json"
+        self.default_model = default_model
+        self._lock = threading.Lock()
+        self._active = None
+        self._stamp = None
+
+    def active(self):
+        # {"version", "path", "model", "d"}; re-read only when the pointer changes
+        try:
+            st = os.stat(self.pointer_path)
+            stamp = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if self._active is not None and stamp == self._stamp:
+            return self._active
+        with self._lock:
+            if stamp is None:
+                active = dict(self._root_tag(), version=None, path=self.root)
+            else:
+                with open(self.pointer_path) as f:
+                    version = json.load(f)["version"]
+                active = dict(self.tag(version), version=version, path=self.root / version)
+            self._active, self._stamp = active, stamp
+            return active
+
+    def _root_tag(self):
+        path = self.root / "version.json"
+        if path.exists():
+            with open(path) as f:
+                return json.load(f)
+        if (self.root / "manifest.json").exists() or (self.root / "resume_chunks.faiss").exists():
+            # built before versions were tagged, always with the default model
+            return {"model": DEFAULT_MODEL_NAME, "d": 384}
+        # a fresh root takes the configured model until pin()
+        return {"model": self.default_model, "d": None}
+
+    def pin(self):
+        # called by every index write: the first one into the root records
+        # the model it's written with, so a later EMBEDDING_MODEL change
+        # can't silently mix models in it
+        if self.pointer_path.exists() or (self.root / "version.json").exists():
+            return
+        active = self.active()
+        atomic_write_json(self.root / "version.json", {"model": active["model"], "d": active["d"]})
+
+    def tag(self, version):
+        with open(self.root / version / "version.json") as f:
+            return json.load(f)
+
+    def versions(self):
+        # [(version, tag)], oldest first
+        if not self.root.exists():
+            return []
+        found = [(p.name, self.tag(p.name)) for p in self.root.iterdir() if (p / "version.json").exists()]
+        return sorted(found, key=lambda v: v[1].get("created", ""))
+
+    def create(self, model_name, d):
+        created = time.strftime("%Y%m%dT%H%M%S")
+        slug = re.sub(r"[^a-z0-9]+", "-", model_name.lower().rsplit("/", 1)[-1]).strip("-")[:32]
+        version = f"{slug}-d{d}-{created}"
+        (self.root / version).mkdir(parents=True)
+        self.write_tag(version, {"model": model_name, "d": d, "created": created, "status": "building"})
+        return version
+
+    def write_tag(self, version, tag):
+        atomic_write_json(self.root / version / "version.json", tag)
+
+    def activate(self, version):
+        # every worker moves over on its next get(); the old directory stays for rollback
+        self.tag(version)
+        atomic_write_json(self.pointer_path, {"version": version})
+        return self.active()
+
+INDEX_REGISTRY = IndexRegistry(INDEX_DIR, default_model=getattr(settings, "EMBEDDING_MODEL", DEFAULT_MODEL_NAME))
+
+INDEX_MANAGER = FaissIndexManager(
+    mmap=getattr(settings, "FAISS_MMAP", False),
+    max_delta_segments=getattr(settings, "FAISS_MAX_DELTA_SEGMENTS", 16),
+    lock_timeout=getattr(settings, "FAISS_WRITE_LOCK_TIMEOUT", 60),
+    registry=INDEX_REGISTRY,
+    factory=getattr(settings, "FAISS_INDEX_FACTORY", "Flat"),
+)
+
+# one pooled vector per resume; both id stores hold the resume id
+RESUME_INDEX_SUBDIR = "resumes"
+RESUME_INDEX_MANAGER = FaissIndexManager(
+    mmap=getattr(settings, "FAISS_MMAP", False),
+    max_delta_segments=getattr(settings, "FAISS_MAX_DELTA_SEGMENTS", 16),
+    lock_timeout=getattr(settings, "FAISS_WRITE_LOCK_TIMEOUT", 60),
+    registry=INDEX_REGISTRY,
+    subdir=RESUME_INDEX_SUBDIR,
+    factory=getattr(settings, "FAISS_RESUME_INDEX_FACTORY", None) or getattr(settings, "FAISS_INDEX_FACTORY", "Flat"),
+)
+
+def pool_by_resume(vecs, resume_ids):
+    # mean of each resume's (unit) chunk vectors, re-normalised, in first-seen order
+    keys = ChunkIdStore.keys_for(resume_ids)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    pooled = np.zeros((len(first), vecs.shape[1]), dtype="float32")
+    np.add.at(pooled, inverse, vecs)
+    faiss.normalize_L2(pooled)
+    order = np.argsort(first)
+    return pooled[order], [resume_ids[i] for i in first[order]]
+
+def pool_index(manager):
+    # -> (pooled, owners): each resume's chunk vectors pooled over the whole
+    # index, re-normalised, one segment in memory at a time
+    snapshot = manager.get()
+    keys = snapshot.resumes.keys()
+    slots = {}
+    owners = []
+    sums = np.zeros((0, snapshot.d), dtype="float32")
+    for name, offset, _ in snapshot.segments:
+        vecs = segment_vectors(faiss.read_index(str(manager.index_dir / name)))
+        seg_keys = keys[offset:offset + len(vecs)]
+        known = seg_keys != 0
+        if len(snapshot.dead):
+            known &= ~np.isin(np.arange(offset, offset + len(vecs)), snapshot.dead)
+        uniq, first, inverse = np.unique(seg_keys[known], return_index=True, return_inverse=True)
+        rows = np.flatnonzero(known)
+        new = [key for key in uniq.tolist() if key not in slots]
+        for key, row in zip(uniq.tolist(), first.tolist()):
+            if key not in slots:
+                slots[key] = len(slots)
+                owners.append(snapshot.resumes.get(offset + rows[row]))
+        sums = np.concatenate([sums, np.zeros((len(new), snapshot.d), dtype="float32")])
+        target = np.array([slots[key] for key in uniq.tolist()], dtype="int64")[inverse]
+        np.add.at(sums, target, vecs[known])
+    faiss.normalize_L2(sums)
+    return sums, owners
+
+def missing_ids(store, candidate_ids):
+    # candidate ids (str) with no row in store
+    candidate_ids = [str(c) for c in candidate_ids]
+    if not candidate_ids or not len(store):
+        return candidate_ids
+    rows = np.flatnonzero(np.isin(store.keys(), ChunkIdStore.keys_for(candidate_ids)))
+    present = {store.get(row) for row in rows.tolist()}
+    return [c for c in candidate_ids if c not in present]
+
+def ensure_faiss_index(d=None):
+    # d is the active version's model output dimension; all-MiniLM-L6-v2 -> 384
+    snapshot = INDEX_MANAGER.get(d or INDEX_REGISTRY.active()["d"] or 384)
+    return snapshot, snapshot.ids
 
 def save_faiss(index, id_map):
-    faiss.write_index(index, str(FAISS_INDEX_PATH))
-    with open(ID_MAP_PATH, "w") as f:
-        json.dump(id_map, f)
+    if not isinstance(id_map, ChunkIdStore):
+        id_map = ChunkIdStore.from_json_map(id_map)
+    INDEX_MANAGER.replace(index, id_map)
 
 def build_embeddings_for_chunks(chunks):
-    model = load_embedding_model()
-    texts = [c["text"] for c in chunks]
-    vecs = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-    # L2-normalize for cosine via inner product
-    faiss.normalize_L2(vecs)
+    from .dedup import embed_texts
+    vecs, _ = embed_texts([c["text"] for c in chunks], [c.get("sha", "") for c in chunks])
     return vecs
 
-def add_chunks_to_index(chunk_objs):
-    index, id_map = ensure_faiss_index()
-    d = index.d if hasattr(index, "d") else index.ntotal and index.reconstruct(0).shape[0] or 384
-    texts = [c.chunk_text for c in chunk_objs]
-    model = load_embedding_model()
-    vecs = model.encode(texts, convert_to_numpy=True)
-    faiss.normalize_L2(vecs)
-    start_id = index.ntotal
-    index.add(vecs)
-    for i, c in enumerate(chunk_objs):
-        gid = start_id + i
-        id_map[str(gid)] = str(c.id)
-    save_faiss(index, id_map)
+class IndexModelChanged(Exception):
+    # the active index version switched embedding models after these vectors were computed
+    pass
+
+def index_vectors(vecs, chunk_ids, resume_ids, model_name=None):
+    # chunk rows first; the resume-level rows are derived from them. Both
+    # locks are held so a version switch (taken under them) can't land
+    # between the model check and the writes.
+    with INDEX_MANAGER.writing(), RESUME_INDEX_MANAGER.writing():
+        if model_name is not None and model_name != active_model_name():
+            raise IndexModelChanged(model_name)
+        INDEX_MANAGER.add(vecs, chunk_ids, d=vecs.shape[1], resume_ids=resume_ids)
+        pooled, pooled_ids = pool_by_resume(vecs, resume_ids)
+        RESUME_INDEX_MANAGER.add(pooled, pooled_ids, d=pooled.shape[1], resume_ids=pooled_ids)
+
+def remove_from_index(resume_ids):
+    # tombstones the resumes' rows in both indexes -> chunk rows removed
+    removed = INDEX_MANAGER.remove_resumes(resume_ids)
+    RESUME_INDEX_MANAGER.remove_resumes(resume_ids)
+    return removed
+
+def add_vectors_to_index(vecs, chunk_objs, model_name=None):
+    if not chunk_objs:
+        return True
+    try:
+        index_vectors(vecs, [c.id for c in chunk_objs], [c.resume_id for c in chunk_objs], model_name)
+    except IndexModelChanged:
+        # re-encoded with the model the index now uses (dedup imports this module)
+        from .dedup import embed_chunks
+        index_vectors(embed_chunks(chunk_objs), [c.id for c in chunk_objs], [c.resume_id for c in chunk_objs])
     return True
 
-def query_index(query_text, k=5):
-    index, id_map = ensure_faiss_index()
-    model = load_embedding_model()
-    qvec = model.encode([query_text], convert_to_numpy=True)
-    faiss.normalize_L2(qvec)
-    D, I = index.search(qvec, k)
-    scores = D[0].tolist()
-    ids = I[0].tolist()
+def add_chunks_to_index(chunk_objs):
+    from .dedup import embed_chunks
+    return add_vectors_to_index(embed_chunks(chunk_objs), chunk_objs)
+
+def query_resume_index(query_text, k=10, resume_ids=None):
+    # top-k resumes by pooled vector, best first: [(resume_id, score)]
+    snapshot = RESUME_INDEX_MANAGER.get()
+    rows = None
+    if resume_ids is not None:
+        rows = snapshot.rows_for_resumes(resume_ids)
+        if len(rows) == 0:
+            return []
+    D, I = snapshot.search(embed_query(query_text).reshape(1, -1), k, rows=rows)
+    return [(snapshot.ids.get(idx), float(score)) for score, idx in zip(D[0].tolist(), I[0].tolist()) if idx >= 0]
+
+def snapshot_hits(snapshot, scores, rows, resume_ids=None):
     results = []
-    for score, idx in zip(scores, ids):
+    for score, idx in zip(scores.tolist(), rows.tolist()):
         if idx < 0: continue
-        chunk_id = id_map.get(str(idx))
-        results.append({"chunk_index": idx, "chunk_id": chunk_id, "score": float(score)})
+        chunk_id = snapshot.ids.get(idx)
+        resume_id = snapshot.resumes.get(idx)
+        if resume_ids is not None and resume_id not in resume_ids:
+            # 64-bit key collision; the full id decides
+            continue
+        results.append({"chunk_index": idx, "chunk_id": chunk_id, "resume_id": resume_id, "score": float(score)})
     return results
+
+def search_index_batch(query_texts, ks, resume_ids=None):
+    # one encode for all queries; unfiltered ones share one search at max(k),
+    # filtered ones (resume_ids[i] not None) each scan with their own selector
+    snapshot, _ = ensure_faiss_index()
+    resume_ids = resume_ids or [None] * len(query_texts)
+    qvecs = embed_queries(query_texts)
+    results = [None] * len(query_texts)
+    plain = [i for i, allowed in enumerate(resume_ids) if allowed is None]
+    if plain:
+        D, I = snapshot.search(qvecs[plain], max(ks[i] for i in plain))
+        for row, i in enumerate(plain):
+            results[i] = snapshot_hits(snapshot, D[row][:ks[i]], I[row][:ks[i]])
+    for i, allowed in enumerate(resume_ids):
+        if allowed is None:
+            continue
+        allowed = {str(r) for r in allowed}
+        rows = snapshot.rows_for_resumes(allowed)
+        if len(rows) == 0:
+            results[i] = []
+            continue
+        D, I = snapshot.search(qvecs[i:i + 1], ks[i], rows=rows)
+        results[i] = snapshot_hits(snapshot, D[0], I[0], allowed)
+    return results
+
+class QueryScheduler:
+    # Serving-side counterpart of EmbeddingBatcher: query_index calls from
+    # any thread are queued and answered in groups by one worker thread with
+    # search_index_batch. A group closes at max_batch queries or max_wait
+    # seconds after its first one; with max_wait=0 it takes whatever queued
+    # up while the previous group was running, so groups grow with load.
+    def __init__(self, max_batch=32, max_wait=0.0, max_pending=1024):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.queries = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, query_text, k=5, resume_ids=None):
+        future = Future()
+        self._ensure_thread()
+        self.queue.put((query_text, k, resume_ids, future))
+        return future
+
+    def search(self, query_text, k=5, resume_ids=None):
+        return self.submit(query_text, k, resume_ids).result()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-scheduler", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                items.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            self.batches += 1
+            self.queries += len(items)
+            try:
+                results = search_index_batch([q for q, _, _, _ in items], [k for _, k, _, _ in items], [r for _, _, r, _ in items])
+            except Exception as e:
+                for *_, future in items:
+                    future.set_exception(e)
+                continue
+            for (*_, future), hits in zip(items, results):
+                future.set_result(hits)
+
+_QUERY_SCHEDULER = {}
+
+def get_query_scheduler():
+    # one scheduler thread per process; gunicorn forks after import
+    pid = os.getpid()
+    if pid not in _QUERY_SCHEDULER:
+        _QUERY_SCHEDULER.clear()
+        _QUERY_SCHEDULER[pid] = QueryScheduler(
+            max_batch=getattr(settings, "QUERY_BATCH_SIZE", 32),
+            max_wait=getattr(settings, "QUERY_BATCH_MAX_WAIT_MS", 0) / 1000.0,
+            max_pending=getattr(settings, "QUERY_QUEUE_SIZE", 1024),
+        )
+    return _QUERY_SCHEDULER[pid]
+
+def query_index(query_text, k=5, resume_ids=None):
+    # resume_ids restricts the search to those resumes' chunks inside the scan;
+    # concurrent callers share encodes and searches through the scheduler
+    if getattr(settings, "QUERY_BATCH_SIZE", 32) > 1:
+        return get_query_scheduler().search(query_text, k, resume_ids)
+    return search_index_batch([query_text], [k], [resume_ids])[0]
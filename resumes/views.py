@@ -1,17 +1,65 @@
+import uuid
+from datetime import datetime
 from rest_framework.views import APIView
 from rest_framework import generics, status, permissions
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Resume, ResumeChunk, Job, MatchReport, IdempotencyKey
+from .models import Resume, ResumeChunk, Job, IdempotencyKey
 from .serializers import ResumeSerializer, JobSerializer, MatchReportSerializer, ResumeChunkSerializer
-from .tasks import process_resume_sync
-from .utils import query_index
+from .tasks import enqueue_resume_processing
+from .utils import query_index, get_query_scheduler, QUERY_CACHE, INDEX_MANAGER, INDEX_REGISTRY, RESUME_INDEX_MANAGER
+from .matching import match_job, match_jobs
+from .search import LEXICAL_INDEX, hybrid_search
+from .rerank import get_reranker
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from rest_framework.exceptions import PermissionDenied
+from django.db.models import Q, Case, When, IntegerField
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from rest_framework.exceptions import PermissionDenied, ValidationError
 User = get_user_model()
 
+def hydrate_hits(hits):
+    # one query for every hit's chunk and resume, returned in FAISS rank order;
+    # hits whose chunk no longer exists are dropped
+    ids = [h["chunk_id"] for h in hits if h.get("chunk_id")]
+    chunks = ResumeChunk.objects.select_related("resume").in_bulk(ids)
+    hydrated = []
+    for h in hits:
+        chunk = chunks.get(uuid.UUID(h["chunk_id"])) if h.get("chunk_id") else None
+        if chunk is not None:
+            hydrated.append((h, chunk))
+    return hydrated
+
+def parse_when(value):
+    if not value:
+        return None
+    when = parse_datetime(value)
+    if when is None and parse_date(value):
+        when = datetime.combine(parse_date(value), datetime.min.time())
+    if when is not None and timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+def filtered_resume_ids(filters):
+    # {"owner_id", "status", "uploaded_after", "uploaded_before", "resume_ids"}
+    # -> the resume ids a search may return, or None for "no filter"
+    if not filters:
+        return None
+    qs = Resume.objects.all()
+    if filters.get("owner_id"):
+        qs = qs.filter(owner_id=filters["owner_id"])
+    if filters.get("status"):
+        qs = qs.filter(status=filters["status"])
+    if parse_when(filters.get("uploaded_after")):
+        qs = qs.filter(uploaded_at__gte=parse_when(filters["uploaded_after"]))
+    if parse_when(filters.get("uploaded_before")):
+        qs = qs.filter(uploaded_at__lte=parse_when(filters["uploaded_before"]))
+    if filters.get("resume_ids") is not None:
+        qs = qs.filter(id__in=filters["resume_ids"])
+    return set(qs.values_list("id", flat=True))
+
 class RegisterView(APIView):
     permission_classes = []
     def post(self, request):
@@ -44,12 +92,9 @@ class ResumeUploadView(APIView):
                 resume.save()
             except:
                 pass
-        # process sync (or enqueue)
-        try:
-            process_resume_sync(str(resume.id))
-        except Exception as e:
-            resume.status = "failed"
-            resume.save()
+        # parsing, embedding and indexing happen in the task backend;
+        # clients poll /resumes/<id>/status/
+        enqueue_resume_processing(resume.id)
         # update idempotency response if present
         key = request.headers.get("Idempotency-Key")
         if key:
@@ -62,6 +107,12 @@ class ResumeUploadView(APIView):
                 pass
         return Response({"id":str(resume.id),"filename":resume.filename,"status":resume.status}, status=202)
 
+class ResumeStatusView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    def get(self, request, id):
+        resume = get_object_or_404(Resume.objects.only("id", "filename", "status"), id=id)
+        return Response({"id":str(resume.id),"filename":resume.filename,"status":resume.status})
+
 class ResumeListView(generics.ListAPIView):
     serializer_class = ResumeSerializer
     permission_classes = (permissions.IsAuthenticated,)
@@ -69,8 +120,11 @@ class ResumeListView(generics.ListAPIView):
         q = self.request.query_params.get("q")
         qs = Resume.objects.all().order_by("-uploaded_at")
         if q:
-            # naive text search in summary or in chunk text (could be expanded to semantic)
-            qs = qs.filter(Q(summary__icontains=q) | Q(filename__icontains=q))
+            # BM25 over chunk text ranks resumes by their best chunk; filename
+            # matches still come back, after the ranked ones
+            ranked = [rid for rid, _ in LEXICAL_INDEX.get().search_resumes(q, k=200)]
+            rank = Case(*[When(id=rid, then=i) for i, rid in enumerate(ranked)], default=len(ranked), output_field=IntegerField())
+            qs = qs.filter(Q(id__in=ranked) | Q(filename__icontains=q)).order_by(rank, "-uploaded_at")
         return qs
 
 class ResumeDetailView(generics.RetrieveAPIView):
@@ -89,34 +143,109 @@ class ResumeDetailView(generics.RetrieveAPIView):
                 c["chunk_text"] = c["chunk_text"].replace("REDACTED_EMAIL","[REDACTED]").replace("REDACTED_PHONE","[REDACTED]")
         return Response(data)
 
+def flag(data, name, default):
+    value = data.get(name, default)
+    if isinstance(value, str):
+        value = value.lower() not in ("0", "false", "no")
+    return bool(value)
+
+def ask_k(data):
+    # 1..ASK_MAX_K answers; anything else is a 400 (ValidationError), not a
+    # 500 or an unbounded search
+    max_k = getattr(settings, "ASK_MAX_K", 50)
+    try:
+        k = int(data.get("k", 5))
+    except (TypeError, ValueError):
+        k = 0
+    if not 1 <= k <= max_k:
+        raise ValidationError({"error": {"code": "FIELD_INVALID", "field": "k", "message": f"k must be an integer from 1 to {max_k}"}})
+    return k
+
+def ask_params(data):
+    # -> (query, k, hybrid, allowed resume ids, rerank); shared with the async path
+    hybrid = flag(data, "hybrid", getattr(settings, "HYBRID_SEARCH", True))
+    rerank = flag(data, "rerank", getattr(settings, "RERANK", False)) and get_reranker() is not None
+    return data.get("query"), ask_k(data), hybrid, filtered_resume_ids(data.get("filters")), rerank
+
+ASK_DEDUP_OVERFETCH = 2
+# retrieval deepens by this factor while copies crowd out distinct answers,
+# up to ASK_MAX_DEPTH hits
+ASK_WIDEN_FACTOR = 4
+
+def ask_max_depth():
+    return getattr(settings, "ASK_MAX_DEPTH", 1000)
+
+def ask_depth(k):
+    # hits to retrieve first for k answers; copies of a chunk collapse into one
+    return k * ASK_DEDUP_OVERFETCH
+
+def ask_plan(k, rerank):
+    # -> (hits to retrieve, how many of them to re-rank); the re-rank depth
+    # is what the latency budget allows, up to RERANK_MAX_DEPTH, and at least k
+    m = get_reranker().depth(k) if rerank else 0
+    return min(max(ask_depth(k), m), ask_max_depth()), m
+
+def ask_widen(depth):
+    return min(depth * ASK_WIDEN_FACTOR, ask_max_depth())
+
+def ask_hydrate(hits, k, depth):
+    # -> hydrated hits, or None when a file uploaded many times left fewer
+    # than k distinct chunk texts in them and a deeper retrieval (more than
+    # depth hits, within ASK_MAX_DEPTH) can still find others. At the cap
+    # the answers are whatever distinct texts it found
+    hydrated = hydrate_hits(hits)
+    if len(hits) >= depth and depth < ask_max_depth() and len({chunk.text_sha256 or chunk.id for _, chunk in hydrated}) < k:
+        return None
+    return hydrated
+
+def ask_answers(q, hydrated, k=None, rerank_depth=0):
+    answers = []
+    seen = set()
+    if rerank_depth:
+        hydrated = get_reranker().rerank(q, hydrated, rerank_depth)
+    for r, chunk in hydrated:
+        # the same chunk text from re-uploads of one file answers once
+        if chunk.text_sha256:
+            if chunk.text_sha256 in seen:
+                continue
+            seen.add(chunk.text_sha256)
+        if k is not None and len(answers) >= k:
+            break
+        answers.append({
+            "resume_id": str(chunk.resume_id),
+            "score": r.get("score"),
+            "vector_score": r.get("vector_score", r.get("score")),
+            "lexical_score": r.get("lexical_score"),
+            "rerank_score": r.get("rerank_score"),
+            "evidence": [{
+                "chunk_id": str(chunk.id),
+                "text": chunk.chunk_text[:500],
+                "page": chunk.page_number,
+                "start": chunk.char_start,
+                "end": chunk.char_end
+            }]
+        })
+    return {"query_id":"q_"+str(hash(q)),"answers":answers}
+
+QUERY_REQUIRED = {"error":{"code":"FIELD_REQUIRED","field":"query","message":"query required"}}
+
 class AskView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
     def post(self, request):
-        q = request.data.get("query")
-        k = int(request.data.get("k",5))
+        q, k, hybrid, allowed, rerank = ask_params(request.data)
         if not q:
-            return Response({"error":{"code":"FIELD_REQUIRED","field":"query","message":"query required"}}, status=400)
-        results = query_index(q, k=k)
-        answers = []
-        for r in results:
-            chunk_id = r.get("chunk_id")
-            score = r.get("score")
-            try:
-                chunk = ResumeChunk.objects.get(id=chunk_id)
-                answers.append({
-                    "resume_id": str(chunk.resume.id),
-                    "score": score,
-                    "evidence": [{
-                        "chunk_id": str(chunk.id),
-                        "text": chunk.chunk_text[:500],
-                        "page": chunk.page_number,
-                        "start": chunk.char_start,
-                        "end": chunk.char_end
-                    }]
-                })
-            except:
-                continue
-        return Response({"query_id":"q_"+str(hash(q)),"answers":answers})
+            return Response(QUERY_REQUIRED, status=400)
+        depth, rerank_depth = ask_plan(k, rerank)
+        while True:
+            if hybrid:
+                results = hybrid_search(q, k=depth, resume_ids=allowed)
+            else:
+                results = query_index(q, k=depth, resume_ids=allowed)
+            hydrated = ask_hydrate(results, k, depth)
+            if hydrated is not None:
+                return Response(ask_answers(q, hydrated, k, rerank_depth))
+            depth = ask_widen(depth)
+
 class JobListView(generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = JobSerializer
@@ -143,55 +272,44 @@ class JobDetailView(generics.RetrieveAPIView):
     queryset = Job.objects.all()
     lookup_field = "id"
 
+def job_match_payload(id, data):
+    top_n = int(data.get("top_n", 10))
+    job = get_object_or_404(Job, id=id)
+    # optional candidate pool, same filter shape as /ask/
+    filters = data.get("filters") or {}
+    if data.get("resume_ids") is not None:
+        filters = {**filters, "resume_ids": data["resume_ids"]}
+    matches, cached = match_job(job, top_n, resume_ids=filtered_resume_ids(filters), rescore=data.get("rescore"))
+    return {"job_id": str(job.id), "cached": cached, "matches": matches}
+
 class JobMatchView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
     def post(self, request, id):
+        return Response(job_match_payload(id, request.data))
+
+class BatchJobMatchView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    def post(self, request):
+        if request.user.role not in ["recruiter", "admin"]:
+            raise PermissionDenied("Only recruiters and admins can batch-match jobs.")
         top_n = int(request.data.get("top_n", 10))
-        job = get_object_or_404(Job, id=id)
-        # aggregate resume-level score by querying job title+requirements
-        query_text = f"{job.title}. Requirements: {'; '.join(job.requirements or [])}. {job.description}"
-        hits = query_index(query_text, k=top_n*5)
-        # map chunk hits to resume scores
-        resume_scores = {}
-        from .models import ResumeChunk
-        for h in hits:
-            cid = h.get("chunk_id")
-            score = h.get("score")
-            try:
-                chunk = ResumeChunk.objects.get(id=cid)
-            except:
-                continue
-            rid = str(chunk.resume.id)
-            resume_scores.setdefault(rid, {"score_sum":0,"evidence":[],"count":0})
-            resume_scores[rid]["score_sum"] += score
-            resume_scores[rid]["count"] += 1
-            resume_scores[rid]["evidence"].append({"chunk_id":str(chunk.id),"text":chunk.chunk_text[:300],"score":score})
-        # produce ranked list
-        ranked = []
-        for rid, d in resume_scores.items():
-            # deterministic tie break: use uploaded_at then resume id
-            resume = Resume.objects.get(id=rid)
-            score = d["score_sum"] / max(1, d["count"])
-            ranked.append({"resume":resume, "score": score, "evidence": d["evidence"]})
-        # sort by score desc, tie-breaker: uploaded_at desc then id
-        ranked.sort(key=lambda x: (x["score"], x["resume"].uploaded_at, str(x["resume"].id)), reverse=True)
-        matches = []
-        # compute missing requirements by searching evidence text for requirement strings
-        for r in ranked[:top_n]:
-            found_reqs = []
-            missing = []
-            text_blob = " ".join([e["text"] for e in r["evidence"]])
-            for req in job.requirements or []:
-                if req.lower() in text_blob.lower():
-                    found_reqs.append(req)
-                else:
-                    missing.append(req)
-            matches.append({
-                "resume_id": str(r["resume"].id),
-                "score": float(r["score"]),
-                "evidence": r["evidence"],
-                "missing_requirements": missing
-            })
-            # optionally store MatchReport
-            MatchReport.objects.create(job=job, resume=r["resume"], score=r["score"], evidence=r["evidence"], missing_requirements=missing)
-        return Response({"job_id": str(job.id), "matches": matches})
+        jobs = Job.objects.all().order_by("-created_at")
+        if request.data.get("job_ids") is not None:
+            jobs = jobs.filter(id__in=request.data["job_ids"])
+        results = match_jobs(jobs, top_n)
+        return Response({"jobs": [{"job_id": job_id, "matches": matches} for job_id, matches in results.items()]})
+
+class RetrievalStatsView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    def get(self, request):
+        snapshot = INDEX_MANAGER.get()
+        resumes = RESUME_INDEX_MANAGER.get()
+        active = INDEX_REGISTRY.active()
+        return Response({
+            "index_version": {"version": active["version"], "model": active["model"], "d": active["d"]},
+            "index": {"generation": snapshot.generation, "ntotal": snapshot.ntotal, "live": snapshot.live, "segments": len(snapshot.segments)},
+            "resume_index": {"generation": resumes.generation, "ntotal": resumes.ntotal, "live": resumes.live, "segments": len(resumes.segments)},
+            "query_embedding_cache": QUERY_CACHE.stats(),
+            "query_scheduler": get_query_scheduler().stats(),
+            "reranker": get_reranker().stats() if get_reranker() is not None else None,
+        })